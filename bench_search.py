@@ -0,0 +1,156 @@
+# bench_search.py
+# Микро-бенчмарк поиска по индексу (без сети, на случайных векторах).
+# Запуск: python bench_search.py [--sizes 10000,100000,1000000] [--dim 768]
+#         python bench_search.py --ann [--sizes 100000] [--probes 1,4,8,16,32]
+#         python bench_search.py --compressed [--sizes 100000]
+import time
+import argparse
+import numpy as np
+
+from index_store import normalize_rows, top_k_indices
+from vector_index import ExactIndex, IVFIndex, Int8Index, PQIndex
+
+# Шум вокруг центров кластеров в синтетике (больше — сложнее для IVF)
+SYNTH_SPREAD = 2.0
+
+
+def timeit(fn, repeat=5):
+    """Медиана времени вызова, мс."""
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def random_matrix(n, dim, rng, block=100_000):
+    """Нормированная float32-матрица, генерируется блоками (без float64-копии на весь размер)."""
+    matrix = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, block):
+        part = rng.standard_normal((min(block, n - start), dim), dtype=np.float32)
+        matrix[start:start + len(part)] = normalize_rows(part)
+    return matrix
+
+
+def bench_size(n, dim, top_k, queries, rng):
+    matrix = random_matrix(n, dim, rng)
+    q = normalize_rows(rng.standard_normal((queries, dim), dtype=np.float32))
+
+    def old_search():
+        # Как было: float64 + полная сортировка на каждый запрос
+        for row in q.astype(np.float64):
+            scores = np.dot(matrix, row)
+            np.argsort(scores)[-top_k:][::-1]
+
+    def new_search_loop():
+        for row in q:
+            top_k_indices(matrix @ row, top_k)
+
+    def new_search_many():
+        top_k_indices(q @ matrix.T, top_k)
+
+    print(f"{n:>9} | {timeit(old_search) / queries:10.2f} | {timeit(new_search_loop) / queries:10.2f} | "
+          f"{timeit(new_search_many) / queries:10.2f}")
+
+
+def clustered_matrix(n, dim, rng, clusters=500, spread=None, block=100_000):
+    """Синтетика "как у кода": вектора сгруппированы вокруг тем (на чистом шуме IVF бессмыслен)."""
+    spread = SYNTH_SPREAD if spread is None else spread
+    centers = normalize_rows(rng.standard_normal((clusters, dim), dtype=np.float32))
+    matrix = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, block):
+        size = min(block, n - start)
+        part = centers[rng.integers(0, clusters, size)] + \
+            spread * rng.standard_normal((size, dim), dtype=np.float32) / np.sqrt(dim)
+        matrix[start:start + size] = normalize_rows(part)
+    return matrix, centers
+
+
+def bench_ann(n, dim, top_k, queries, probes, rng):
+    matrix, centers = clustered_matrix(n, dim, rng)
+    q = centers[rng.integers(0, len(centers), queries)] + \
+        SYNTH_SPREAD * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim)
+    q = normalize_rows(q)
+
+    exact = ExactIndex()
+    exact.build(matrix)
+    truth = exact.search(q, top_k)
+    exact_ms = timeit(lambda: exact.search(q, top_k)) / queries
+
+    ivf = IVFIndex()
+    t = time.perf_counter()
+    ivf.build(matrix)
+    build_s = time.perf_counter() - t
+
+    print(f"\nchunks={n}, lists={len(ivf.centroids)}, build={build_s:.1f}s, exact={exact_ms:.2f} мс/запрос")
+    print(f"{'n_probe':>8} | {'recall@' + str(top_k):>9} | {'мс/запрос':>10}")
+    for probe in probes:
+        ivf.n_probe = probe
+        found = ivf.search(q, top_k)
+        recall = recall_at_k(found, truth, top_k)
+        ms = timeit(lambda: ivf.search(q, top_k)) / queries
+        print(f"{probe:>8} | {recall:9.3f} | {ms:10.2f}")
+
+
+def recall_at_k(found, truth, k):
+    return np.mean([len(set(a.tolist()) & set(b.tolist())) / k for a, b in zip(found, truth)])
+
+
+def bench_compressed(n, dim, top_k, queries, rng):
+    """recall@k и память сжатых индексов (int8, PQ) против точного float32."""
+    matrix, centers = clustered_matrix(n, dim, rng)
+    q = centers[rng.integers(0, len(centers), queries)] + \
+        SYNTH_SPREAD * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim)
+    q = normalize_rows(q)
+
+    exact = ExactIndex()
+    exact.build(matrix)
+    truth = exact.search(q, top_k)
+
+    print(f"\nchunks={n}, dim={dim}")
+    print(f"{'index':>14} | {'RAM, МБ':>8} | {'сжатие':>6} | {'recall@' + str(top_k):>9} | {'мс/запрос':>10}")
+    print(f"{'exact float32':>14} | {matrix.nbytes / 2 ** 20:8.1f} | {1:6.1f} | {1:9.3f} | "
+          f"{timeit(lambda: exact.search(q, top_k)) / queries:10.2f}")
+
+    candidates = [('int8', Int8Index(rerank=1)), ('int8+rerank', Int8Index()),
+                  ('pq', PQIndex(m=max(1, dim // 8), rerank=1)), ('pq+rerank', PQIndex(m=max(1, dim // 8)))]
+    for name, index in candidates:
+        index.build(matrix)
+        found = index.search(q, top_k)
+        ms = timeit(lambda: index.search(q, top_k), repeat=3) / queries
+        mem = index.memory_bytes()
+        print(f"{name:>14} | {mem / 2 ** 20:8.1f} | {matrix.nbytes / mem:6.1f} | "
+              f"{recall_at_k(found, truth, top_k):9.3f} | {ms:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ProjectIndexer search micro-benchmark")
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=6)
+    parser.add_argument('--ann', action='store_true', help="recall/latency IVF против точного поиска")
+    parser.add_argument('--probes', default='1,4,8,16,32')
+    parser.add_argument('--compressed', action='store_true', help="recall/память int8 и PQ против точного поиска")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.ann:
+        probes = [int(x) for x in args.probes.split(',')]
+        for n in (int(x) for x in args.sizes.split(',')):
+            bench_ann(n, args.dim, args.top_k, max(args.queries, 50), probes, rng)
+        return
+    if args.compressed:
+        for n in (int(x) for x in args.sizes.split(',')):
+            bench_compressed(n, args.dim, args.top_k, max(args.queries, 50), rng)
+        return
+
+    print(f"dim={args.dim}, top_k={args.top_k}, queries={args.queries}; мс на запрос (медиана)")
+    print(f"{'chunks':>9} | {'argsort':>10} | {'argpart':>10} | {'search_many':>10}")
+    for n in (int(x) for x in args.sizes.split(',')):
+        bench_size(n, args.dim, args.top_k, args.queries, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import tempfile
+import threading
+from array import array
+from collections import deque
+
+from PyQt6.QtWidgets import QTextBrowser
+from PyQt6.QtGui import QTextCursor, QTextFrameFormat
+
+# Сколько сообщений держим в памяти (старые уходят во временный файл)
+CHAT_MEMORY_MESSAGES = 500
+# Сколько последних сообщений отрисовано в документе (остальные — по прокрутке вверх)
+CHAT_RENDERED_MESSAGES = 150
+# Сколько старых сообщений догружается за раз при прокрутке к началу
+CHAT_PAGE_MESSAGES = 50
+
+
+class ChatMessage:
+    """Одно сообщение чата: готовый HTML. live — ещё дописывается (поток), его не выгружаем."""
+    __slots__ = ('html', 'live')
+
+    def __init__(self, html="", live=False):
+        self.html = html
+        self.live = live
+
+
+class ChatHistory:
+    """
+    Модель сообщений чата: последние max_memory — в памяти, более старые
+    дописываются во временный файл (удаляется при закрытии) и читаются оттуда по индексу.
+    Индексы сквозные: 0 — самое первое сообщение сессии.
+    """
+
+    def __init__(self, max_memory=CHAT_MEMORY_MESSAGES):
+        self.max_memory = max_memory
+        self.messages = deque()
+        self.spilled = 0
+        self._offsets = array('q', [0])  # границы сообщений в файле
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.spilled + len(self.messages)
+
+    def append(self, message):
+        self.messages.append(message)
+        self._spill()
+        return len(self) - 1
+
+    def get(self, index):
+        """HTML сообщения по сквозному индексу."""
+        if index >= self.spilled:
+            return self.messages[index - self.spilled].html
+        with self._lock:
+            self._file.seek(self._offsets[index])
+            return self._file.read(self._offsets[index + 1] - self._offsets[index]).decode('utf-8')
+
+    def _spill(self):
+        # Живое (стримящееся) сообщение не выгружаем — подождём, пока допишется
+        while len(self.messages) > self.max_memory and not self.messages[0].live:
+            data = self.messages.popleft().html.encode('utf-8')
+            with self._lock:
+                if self._file is None:
+                    self._file = tempfile.TemporaryFile(prefix='chat-', suffix='.log')
+                self._file.seek(self._offsets[-1])
+                self._file.write(data)
+                self._offsets.append(self._offsets[-1] + len(data))
+            self.spilled += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ChatLog(QTextBrowser):
+    """
+    Лента чата поверх ChatHistory. Каждое сообщение — своя рамка (QTextFrame) в документе;
+    в документе только последние max_rendered сообщений, поэтому добавление стоит одинаково
+    и через час работы агента. Стили задаются один раз (defaultStyleSheet), undo выключен.
+    Прокрутка к самому верху догружает более ранние сообщения страницами.
+    append(html) совместим с QTextBrowser.append — старые вызовы идут через модель.
+    """
+
+    def __init__(self, stylesheet="", max_rendered=CHAT_RENDERED_MESSAGES, history=None, parent=None):
+        super().__init__(parent)
+        self.setOpenLinks(False)
+        self.document().setDefaultStyleSheet(stylesheet)
+        self.document().setUndoRedoEnabled(False)
+        self.max_rendered = max_rendered
+        self.history = history or ChatHistory()
+        self.frames = deque()  # рамки сообщений history[first:]
+        self.first = 0
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+    # --- ДОБАВЛЕНИЕ / ОБНОВЛЕНИЕ ---
+    def append(self, html):
+        return self.append_message(ChatMessage(html))
+
+    def append_message(self, message):
+        bar = self.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - 4
+        self.history.append(message)
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        frame = cursor.insertFrame(QTextFrameFormat())
+        self.frames.append(frame)
+        if message.html:
+            self._fill(frame, message.html)
+        if at_bottom:
+            self._trim()
+            bar.setValue(bar.maximum())
+        return message
+
+    def begin_message(self):
+        """Пустое живое сообщение (для потока) — наполняется через update_message."""
+        return self.append_message(ChatMessage(live=True))
+
+    def update_message(self, message, html, final=False):
+        message.html = html
+        if final:
+            message.live = False
+        frame = self._frame_of(message)
+        if frame is not None:
+            self._fill(frame, html)
+
+    def _frame_of(self, message):
+        # Живые сообщения почти всегда в самом конце — ищем с хвоста
+        memory = self.history.messages
+        for offset in range(1, min(len(memory), len(self.frames)) + 1):
+            if memory[-offset] is message:
+                return self.frames[-offset]
+        return None
+
+    def _fill(self, frame, html):
+        cursor = frame.firstCursorPosition()
+        cursor.setPosition(frame.lastPosition(), QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertHtml(html)
+
+    # --- ОКНО ОТРИСОВКИ ---
+    def _trim(self):
+        """Убирает из документа самые старые сообщения сверх max_rendered (в истории они остаются)."""
+        memory = self.history.messages
+        while len(self.frames) > self.max_rendered:
+            index = self.first - self.history.spilled
+            if 0 <= index < len(memory) and memory[index].live:
+                break
+            self._remove_frame(self.frames.popleft())
+            self.first += 1
+
+    def _remove_frame(self, frame):
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(frame.firstPosition() - 1)
+        cursor.setPosition(frame.lastPosition() + 1, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+
+    def _on_scroll(self, value):
+        if value == self.verticalScrollBar().minimum() and self.first > 0:
+            self.load_earlier()
+
+    def load_earlier(self, count=CHAT_PAGE_MESSAGES):
+        """Догружает count более ранних сообщений в начало ленты, не сбивая прокрутку."""
+        bar = self.verticalScrollBar()
+        old_max = bar.maximum()
+        start = max(0, self.first - count)
+        cursor = QTextCursor(self.document())
+        for index in reversed(range(start, self.first)):
+            cursor.setPosition(0)
+            frame = cursor.insertFrame(QTextFrameFormat())
+            self._fill(frame, self.history.get(index))
+            self.frames.appendleft(frame)
+        self.first = start
+        bar.setValue(bar.maximum() - old_max)
@@ -0,0 +1,244 @@
+import io
+import os
+import mmap
+import uuid
+from array import array
+import numpy as np
+
+from chunker import Chunk
+
+CHUNKS_PREFIX = 'chunks-'
+CHUNKS_SUFFIX = '.txt'
+
+
+class ChunkRecord:
+    """
+    Лёгкое представление одной строки ChunkStore (два поля на объект).
+    Текст читается из общего буфера только при обращении к .text / str(record),
+    т.е. фактически только для top-k результатов, которые идут в промпт.
+    """
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def file(self):
+        return self.store.paths[self.store.file_ids[self.row]]
+
+    @property
+    def start_line(self):
+        return int(self.store.start_lines[self.row])
+
+    @property
+    def end_line(self):
+        return int(self.store.end_lines[self.row])
+
+    @property
+    def symbol(self):
+        symbol_id = self.store.symbol_ids[self.row]
+        return self.store.symbols[symbol_id] if symbol_id >= 0 else None
+
+    @property
+    def text(self):
+        return self.store.text(self.row)
+
+    # Тот же формат, что у chunker.Chunk (от него зависят ключи эмбеддингов)
+    header = Chunk.header
+    __str__ = Chunk.__str__
+    __repr__ = Chunk.__repr__
+
+
+class ChunkStore:
+    """
+    Неизменяемая колоночная таблица чанков:
+      paths / symbols           — интернированные строки (каждый путь хранится один раз),
+      file_ids, symbol_ids      — int32 индексы в эти таблицы,
+      start_lines, end_lines    — int32,
+      offsets                   — int64, границы текста чанка i: offsets[i]:offsets[i+1]
+    в едином UTF-8 буфере (mmap файла .jarvis_index/chunks-*.txt или bytes в памяти).
+    Замена индекса — это замена ссылки на новый ChunkStore, старый живёт,
+    пока на него ссылаются выданные ChunkRecord.
+    """
+
+    def __init__(self, paths=(), symbols=(), file_ids=None, symbol_ids=None,
+                 start_lines=None, end_lines=None, offsets=None, buffer=b'', buffer_file=None):
+        self.paths = list(paths)
+        self.symbols = list(symbols)
+        empty = np.empty(0, dtype=np.int32)
+        self.file_ids = empty if file_ids is None else file_ids
+        self.symbol_ids = empty if symbol_ids is None else symbol_ids
+        self.start_lines = empty if start_lines is None else start_lines
+        self.end_lines = empty if end_lines is None else end_lines
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self.buffer = buffer
+        self.buffer_file = buffer_file
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def __getitem__(self, row):
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return ChunkRecord(self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield ChunkRecord(self, row)
+
+    def text(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self.buffer[start:end].decode('utf-8', errors='ignore')
+
+    def rows_except(self, match_path):
+        """Номера строк, чей файл НЕ удовлетворяет match_path(path)."""
+        ids = [i for i, path in enumerate(self.paths) if match_path(path)]
+        if not ids:
+            return np.arange(len(self))
+        return np.flatnonzero(~np.isin(self.file_ids, ids))
+
+    def appended(self, chunks, directory=None):
+        """
+        Новый ChunkStore: эти строки и chunks в конце. Колонки склеиваются numpy (без цикла
+        по старым строкам), текст новых чанков дописывается в конец файла буфера —
+        выданные ChunkRecord продолжают читать старый mmap.
+        """
+        builder = ChunkStoreBuilder()
+        builder.paths, builder.symbols = list(self.paths), list(self.symbols)
+        builder.path_ids = {path: i for i, path in enumerate(self.paths)}
+        builder.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        builder.extend(chunks)
+        data = builder.f.getvalue()
+
+        buffer, buffer_file = self.buffer, self.buffer_file
+        if data:
+            buffer, buffer_file = self._append_text(data, directory)
+        columns = {name: np.concatenate([getattr(self, name), np.asarray(values, dtype=np.int32)])
+                   for name, values in builder.columns.items()}
+        new_offsets = self.offsets[-1] + np.asarray(builder.offsets[1:], dtype=np.int64)
+        offsets = np.concatenate([self.offsets, new_offsets])
+        return ChunkStore(builder.paths, builder.symbols, offsets=offsets, buffer=buffer,
+                          buffer_file=buffer_file, **columns)
+
+    def _append_text(self, data, directory):
+        """Буфер с дописанным data: тот же файл (новый mmap) или, без файла, bytes в памяти."""
+        size = int(self.offsets[-1])
+        if self.buffer_file and directory:
+            try:
+                with open(os.path.join(directory, self.buffer_file), 'r+b') as f:
+                    f.seek(size)
+                    f.write(data)
+                    f.truncate()
+                    f.flush()
+                    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), self.buffer_file
+            except OSError as e:
+                print(f"[WARN] Не удалось дописать файл чанков, держим текст в памяти: {e}")
+        return bytes(self.buffer[:size]) + data, None
+
+    def memory_bytes(self):
+        """Память вне буфера текста (буфер в mmap-режиме лежит в page cache ОС)."""
+        columns = (self.file_ids, self.symbol_ids, self.start_lines, self.end_lines, self.offsets)
+        return sum(c.nbytes for c in columns) + sum(len(s) for s in self.paths) + sum(len(s) for s in self.symbols)
+
+
+class ChunkStoreBuilder:
+    """
+    Собирает ChunkStore потоково: текст пишется сразу в новый файл в папке индекса
+    (имя уникальное — см. _StoreWriter в index_store), колонки копятся в компактных array.
+    Без папки (или если в неё нельзя писать) буфер собирается в памяти.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.buffer_file = None
+        self.path = None
+        self.f = None
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self.buffer_file = f"{CHUNKS_PREFIX}{uuid.uuid4().hex[:12]}{CHUNKS_SUFFIX}"
+                self.path = os.path.join(directory, self.buffer_file)
+                self.f = open(self.path, 'w+b')
+            except OSError as e:
+                print(f"[WARN] Не удалось создать файл чанков, держим текст в памяти: {e}")
+                self.buffer_file = self.path = None
+        if self.f is None:
+            self.f = io.BytesIO()
+        self.paths = []
+        self.path_ids = {}
+        self.symbols = []
+        self.symbol_ids = {}
+        self.columns = {name: array('i') for name in ('file_ids', 'symbol_ids', 'start_lines', 'end_lines')}
+        self.offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def _intern(value, table, ids):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(value)
+        return index
+
+    def _append(self, file, start_line, end_line, symbol, data):
+        self.f.write(data)
+        columns = self.columns
+        columns['file_ids'].append(self._intern(file, self.paths, self.path_ids))
+        columns['symbol_ids'].append(self._intern(symbol, self.symbols, self.symbol_ids) if symbol else -1)
+        columns['start_lines'].append(start_line)
+        columns['end_lines'].append(end_line)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def add(self, chunk):
+        self._append(chunk.file, chunk.start_line, chunk.end_line, chunk.symbol,
+                     chunk.text.encode('utf-8', errors='ignore'))
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.add(chunk)
+
+    def copy_rows(self, store, rows):
+        """Переносит строки из другого ChunkStore без декодирования текста."""
+        for row in rows:
+            symbol_id = store.symbol_ids[row]
+            self._append(store.paths[store.file_ids[row]], int(store.start_lines[row]), int(store.end_lines[row]),
+                         store.symbols[symbol_id] if symbol_id >= 0 else None,
+                         store.buffer[int(store.offsets[row]):int(store.offsets[row + 1])])
+
+    def abort(self):
+        self.f.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def build(self):
+        if self.path:
+            # mmap берём с уже открытого дескриптора: так он переживёт и удаление файла
+            self.f.flush()
+            buffer = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b''
+            self.f.close()
+            self._cleanup()
+        else:
+            buffer = self.f.getvalue()
+
+        columns = {name: np.frombuffer(values, dtype=np.int32).copy() if len(values) else np.empty(0, dtype=np.int32)
+                   for name, values in self.columns.items()}
+        return ChunkStore(self.paths, self.symbols, offsets=np.array(self.offsets, dtype=np.int64),
+                          buffer=buffer, buffer_file=self.buffer_file, **columns)
+
+    def _cleanup(self):
+        """Удаляет старые файлы чанков (если ОС не даёт — удалим в следующий раз)."""
+        for name in os.listdir(self.directory):
+            if name.startswith(CHUNKS_PREFIX) and name.endswith(CHUNKS_SUFFIX) and name != self.buffer_file:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
@@ -0,0 +1,232 @@
+import ast
+import os
+import re
+
+from embedding_backend import approx_tokens
+
+# Бюджет одного чанка (~2000 символов, как раньше) и перекрытие при разрезании
+CHUNK_TOKENS = 500
+CHUNK_OVERLAP_LINES = 3
+# Сколько имён символов писать в заголовок склеенного чанка
+MAX_SYMBOLS = 3
+
+# Начало определения верхнего уровня для не-Python файлов (эвристики по строке)
+_DEF_PATTERNS = [
+    # JS/TS: function foo, export default async function foo, const foo = (...) =>
+    r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?function\*?\s+(\w+)",
+    r"^(?:export\s+)?(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>",
+    # Классы/интерфейсы/структуры в большинстве языков
+    r"^(?:export\s+)?(?:default\s+)?(?:public\s+|private\s+|protected\s+|internal\s+|abstract\s+|final\s+|"
+    r"sealed\s+|static\s+|data\s+|open\s+|partial\s+)*(?:class|interface|struct|enum|trait|object|record|impl|mod)\s+(\w+)",
+    # Go / Rust / Kotlin / Swift / Dart / PHP / Ruby / Lua / shell
+    r"^func\s+(?:\([^)]*\)\s*)?(\w+)",
+    r"^(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+(\w+)",
+    r"^(?:(?:public|private|protected|internal|override|suspend|inline|open|static)\s+)*fun\s+(?:<[^>]*>\s*)?(\w+)",
+    r"^(?:(?:public|private|protected|static|final|abstract)\s+)*function\s+&?(\w+)",
+    r"^def\s+(?:self\.)?(\w+)",
+    r"^(?:local\s+)?function\s+([\w.:]+)",
+    r"^(\w+)\s*\(\)\s*\{",
+    # C/C++/C#/Java: тип имя(...) без ';' в конце строки
+    r"^(?:[\w:<>\[\],\*&~]+\s+)+\*?&?(\w+)\s*\([^;]*$",
+]
+_DEF_RE = [re.compile(p) for p in _DEF_PATTERNS]
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)")
+
+_MARKDOWN_EXT = {'.md', '.rst', '.txt'}
+
+
+class Chunk:
+    """Кусок файла с метаданными. str(chunk) — текст для промпта, embedding_text() — для эмбеддинга."""
+    __slots__ = ('file', 'start_line', 'end_line', 'symbol', 'text')
+
+    def __init__(self, file, start_line, end_line, symbol, text):
+        self.file = file
+        self.start_line = start_line
+        self.end_line = end_line
+        self.symbol = symbol
+        self.text = text
+
+    def header(self):
+        symbol = f", {self.symbol}" if self.symbol else ""
+        return f"File: {self.file} (lines {self.start_line}-{self.end_line}{symbol})"
+
+    def __str__(self):
+        return f"{self.header()}\nCode:\n{self.text}"
+
+    def embedding_text(self):
+        """
+        Текст для эмбеддинга, BM25 и ключа кэша векторов: файл, символ и код, без номеров строк —
+        иначе строка, вставленная в начало файла, меняла бы ключи всех чанков ниже.
+        Номера строк хранятся отдельно (start_line / end_line) и попадают в промпт через str().
+        """
+        symbol = f" ({self.symbol})" if self.symbol else ""
+        return f"File: {self.file}{symbol}\nCode:\n{self.text}"
+
+    def __repr__(self):
+        return f"<Chunk {self.header()}>"
+
+
+def _python_units(lines, text):
+    """
+    Единицы разбиения Python-файла: функции и классы верхнего уровня (с декораторами)
+    и блоки кода между ними. Возвращает [(start, end, symbol, children)], строки с 1.
+    children — методы класса, если класс придётся резать.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+
+    def node_range(node):
+        start = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+        return start, node.end_lineno
+
+    units = []
+    prev_end = 0
+    for node in tree.body:
+        start, end = node_range(node)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if start > prev_end + 1:
+                units.append((prev_end + 1, start - 1, None, None))
+            children = None
+            if isinstance(node, ast.ClassDef):
+                children = [(*node_range(n), f"{node.name}.{n.name}")
+                            for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            units.append((start, end, node.name, children))
+            prev_end = end
+    if prev_end < len(lines):
+        units.append((prev_end + 1, len(lines), None, None))
+    return units
+
+
+def _heuristic_units(lines, ext):
+    """Единицы разбиения по эвристикам: заголовки Markdown или определения с нулевым отступом."""
+    starts = []
+    for i, line in enumerate(lines):
+        if ext in _MARKDOWN_EXT:
+            m = _HEADING_RE.match(line)
+            if m:
+                starts.append((i + 1, m.group(2).strip()[:60]))
+            continue
+        if not line or line[0].isspace():
+            continue
+        for regex in _DEF_RE:
+            m = regex.match(line)
+            if m:
+                starts.append((i + 1, m.group(1)))
+                break
+
+    # Комментарии/аннотации прямо над определением относятся к нему
+    adjusted = []
+    for start, symbol in starts:
+        s = start
+        floor = adjusted[-1][0] + 1 if adjusted else 1
+        if ext not in _MARKDOWN_EXT:
+            while s > floor and lines[s - 2].strip().startswith(('//', '/*', '*', '#', '@', '--')):
+                s -= 1
+        adjusted.append((s, symbol))
+
+    units = []
+    prev = 1
+    for i, (start, symbol) in enumerate(adjusted):
+        if start > prev:
+            units.append((prev, start - 1, None, None))
+        end = adjusted[i + 1][0] - 1 if i + 1 < len(adjusted) else len(lines)
+        units.append((start, end, symbol, None))
+        prev = end + 1
+    if prev <= len(lines):
+        units.append((prev, len(lines), None, None))
+    return [u for u in units if u[0] <= u[1]]
+
+
+def _span_tokens(lines, start, end):
+    return approx_tokens('\n'.join(lines[start - 1:end]))
+
+
+def _split_window(lines, start, end, symbol, max_tokens, overlap):
+    """Режет слишком длинный кусок по строкам; соседние окна перекрываются на overlap строк."""
+    pieces = []
+    s = start
+    while s <= end:
+        e = s
+        tokens = approx_tokens(lines[s - 1])
+        while e < end and tokens + approx_tokens(lines[e]) <= max_tokens:
+            tokens += approx_tokens(lines[e])
+            e += 1
+        pieces.append((s, e, symbol))
+        if e >= end:
+            break
+        s = max(s + 1, e + 1 - overlap)
+    return pieces
+
+
+def _fit(lines, units, max_tokens, overlap):
+    """Каждую единицу укладываем в бюджет: класс -> методы, остальное -> окна по строкам."""
+    pieces = []
+    for start, end, symbol, children in units:
+        if _span_tokens(lines, start, end) <= max_tokens:
+            pieces.append((start, end, symbol))
+            continue
+        if children:
+            sub_units = []
+            prev = start
+            for c_start, c_end, c_symbol in children:
+                if c_start > prev:
+                    # Заголовок класса подписываем именем класса, промежутки между методами — нет
+                    sub_units.append((prev, c_start - 1, symbol if prev == start else None, None))
+                sub_units.append((c_start, c_end, c_symbol, None))
+                prev = c_end + 1
+            if prev <= end:
+                sub_units.append((prev, end, None, None))
+            pieces.extend(_fit(lines, sub_units, max_tokens, overlap))
+            continue
+        pieces.extend(_split_window(lines, start, end, symbol, max_tokens, overlap))
+    return pieces
+
+
+def _merge_small(lines, pieces, max_tokens):
+    """
+    Склеивает соседние мелкие куски (импорты, короткие функции), пока влезают в бюджет.
+    Возвращает [(start, end, symbol)], symbol — до MAX_SYMBOLS имён через запятую.
+    """
+    merged = []
+    for start, end, symbol in pieces:
+        symbols = [symbol] if symbol else []
+        if merged:
+            m_start, m_end, m_symbols = merged[-1]
+            if start == m_end + 1 and _span_tokens(lines, m_start, end) <= max_tokens:
+                merged[-1] = (m_start, end, m_symbols + [s for s in symbols if s not in m_symbols])
+                continue
+        merged.append((start, end, symbols))
+
+    result = []
+    for start, end, symbols in merged:
+        name = ', '.join(symbols[:MAX_SYMBOLS]) + (', ...' if len(symbols) > MAX_SYMBOLS else '')
+        result.append((start, end, name or None))
+    return result
+
+
+def chunk_file(fname, text, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP_LINES):
+    """
+    Режет файл по границам определений: Python — через ast, остальные языки —
+    по регуляркам/отступам, Markdown — по заголовкам. Куски больше бюджета
+    делятся дальше (класс -> методы -> окна строк с перекрытием overlap).
+    """
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    if not lines:
+        return []
+
+    ext = os.path.splitext(fname)[1].lower()
+    units = _python_units(lines, text) if ext in ('.py', '.pyw') else None
+    if units is None:
+        units = _heuristic_units(lines, ext)
+
+    pieces = _merge_small(lines, _fit(lines, units, max_tokens, overlap), max_tokens)
+    chunks = []
+    for start, end, symbol in pieces:
+        body = '\n'.join(lines[start - 1:end])
+        if body.strip():
+            chunks.append(Chunk(fname, start, end, symbol, body))
+    return chunks
@@ -0,0 +1,174 @@
+import re
+import difflib
+
+SEARCH_MARK = "<<<<<<< SEARCH"
+DIVIDER_MARK = "======="
+REPLACE_MARK = ">>>>>>> REPLACE"
+# Минимальное сходство фрагмента файла с SEARCH для нечёткого совпадения
+FUZZY_THRESHOLD = 0.85
+
+_HUNK_HEADER_RE = re.compile(r"^@@ .* @@")
+_HUNK_COUNTS_RE = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """Хунк не удалось найти в файле — нужен полный перевыпуск файла."""
+
+
+def parse_hunks(body):
+    """
+    Хунки патча как пары (search, replace). Понимает два формата:
+    - SEARCH/REPLACE блоки (<<<<<<< SEARCH / ======= / >>>>>>> REPLACE);
+    - unified diff (@@ ... @@; строки ' ' и '-' — что было, ' ' и '+' — что стало).
+    """
+    lines = body.splitlines()
+    if any(l.strip() == SEARCH_MARK for l in lines):
+        return _parse_search_replace(lines)
+    if any(_HUNK_HEADER_RE.match(l) for l in lines):
+        return _parse_unified(lines)
+    raise PatchError("no hunks in patch")
+
+
+def _parse_search_replace(lines):
+    hunks, search, replace, state = [], [], [], None
+    for line in lines:
+        mark = line.strip()
+        if mark == SEARCH_MARK:
+            search, replace, state = [], [], 'search'
+        elif mark == DIVIDER_MARK and state == 'search':
+            state = 'replace'
+        elif mark == REPLACE_MARK and state == 'replace':
+            hunks.append(("\n".join(search), "\n".join(replace)))
+            state = None
+        elif state == 'search':
+            search.append(line)
+        elif state == 'replace':
+            replace.append(line)
+    if state is not None:
+        raise PatchError("unterminated SEARCH/REPLACE block")
+    return hunks
+
+
+def _hunk_counts(header):
+    """(строк было, строк стало) из заголовка @@ -a,b +c,d @@; None — модель написала голый @@."""
+    m = _HUNK_COUNTS_RE.match(header)
+    if not m:
+        return None
+    return int(m.group(1) or 1), int(m.group(2) or 1)
+
+
+def _parse_unified(lines):
+    """
+    Строки '--- ' / '+++ ' — заголовки файлов только вне хунка: внутри хунка '--- x' — это
+    удалённая строка '-- x' (комментарий SQL/Lua). Хунк кончается, когда израсходованы
+    счётчики строк из @@ (без счётчиков — на паре '--- ' + '+++ ' подряд). Остальные строки
+    после счётчиков всё ещё идут в хунк — модели часто ошибаются в числах.
+    """
+    hunks, old, new, inside, left = [], [], [], False, None
+    for i, line in enumerate(lines):
+        if _HUNK_HEADER_RE.match(line):
+            if inside:
+                hunks.append(("\n".join(old), "\n".join(new)))
+            old, new, inside, left = [], [], True, _hunk_counts(line)
+            continue
+        if not inside:
+            continue
+        if line.startswith(('--- ', '+++ ')):
+            if left is None:
+                header = line.startswith('--- ') and i + 1 < len(lines) and lines[i + 1].startswith('+++ ')
+            else:
+                header = left[0] <= 0 and left[1] <= 0
+            if header:
+                hunks.append(("\n".join(old), "\n".join(new)))
+                inside = False
+                continue
+        if line.startswith('\\'):
+            continue
+        if line.startswith('-'):
+            old.append(line[1:])
+            left = left and (left[0] - 1, left[1])
+        elif line.startswith('+'):
+            new.append(line[1:])
+            left = left and (left[0], left[1] - 1)
+        else:
+            # Контекст; модели часто теряют ведущий пробел у пустых строк
+            old.append(line[1:] if line.startswith(' ') else line)
+            new.append(line[1:] if line.startswith(' ') else line)
+            left = left and (left[0] - 1, left[1] - 1)
+    if inside:
+        hunks.append(("\n".join(old), "\n".join(new)))
+    return hunks
+
+
+def _indent(line):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _find(lines, search, start):
+    """
+    (позиция, длина, сдвиг отступа) фрагмента search в lines, начиная со start:
+    точное совпадение -> совпадение без учёта отступов -> нечёткое (difflib).
+    """
+    n = len(search)
+    if not n:
+        return None
+    candidates = range(start, len(lines) - n + 1)
+    for i in candidates:
+        if lines[i:i + n] == search:
+            return i, n, None
+    stripped = [l.strip() for l in search]
+    for i in candidates:
+        if [l.strip() for l in lines[i:i + n]] == stripped:
+            return i, n, (_indent(search[0]), _indent(lines[i]))
+    best, best_ratio = None, FUZZY_THRESHOLD
+    target = "\n".join(stripped)
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(target)
+    for size in {n - 1, n, n + 1} - {0}:
+        for i in range(start, len(lines) - size + 1):
+            matcher.set_seq1("\n".join(l.strip() for l in lines[i:i + size]))
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = (i, size, (_indent(search[0]), _indent(lines[i]))), ratio
+    return best
+
+
+def _reindent(lines, shift):
+    if not shift or shift[0] == shift[1]:
+        return lines
+    old, new = shift
+    return [new + l[len(old):] if l.startswith(old) else l for l in lines]
+
+
+def apply_hunks(original, hunks):
+    """
+    Применяет хунки по порядку к тексту файла. Пустой SEARCH — дописать в конец.
+    Если фрагмент не найден ни точно, ни нечётко — PatchError.
+    """
+    lines = original.split("\n")
+    pos = 0
+    for number, (search, replace) in enumerate(hunks, 1):
+        search_lines = search.split("\n") if search.strip() else []
+        replace_lines = replace.split("\n") if replace else []
+        if not search_lines:
+            if lines and lines[-1] == "":
+                lines[-1:] = replace_lines + [""]
+            else:
+                lines.extend(replace_lines)
+            continue
+        found = _find(lines, search_lines, pos)
+        if found is None and pos:
+            found = _find(lines, search_lines, 0)  # хунки могли прийти не по порядку
+        if found is None:
+            raise PatchError(f"hunk {number} not found: {search_lines[0].strip()[:60]!r}")
+        i, size, shift = found
+        replace_lines = _reindent(replace_lines, shift)
+        lines[i:i + size] = replace_lines
+        pos = i + len(replace_lines)
+    return "\n".join(lines)
+
+
+def apply_patch(original, body):
+    return apply_hunks(original, parse_hunks(body))
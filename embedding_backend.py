@@ -0,0 +1,87 @@
+import re
+import time
+import hashlib
+import threading
+import numpy as np
+
+# Используем модель text-embedding-004 (она стабильнее для кода)
+EMBEDDING_MODEL = 'models/text-embedding-004'
+
+# Лимиты одного batch-запроса (у Gemini не больше 100 текстов за раз)
+BATCH_MAX_ITEMS = 100
+BATCH_MAX_TOKENS = 20000
+
+
+def approx_tokens(text):
+    """Грубая оценка числа токенов (~4 символа на токен), без сети."""
+    return len(text) // 4 + 1
+
+
+def make_batches(texts, max_items=BATCH_MAX_ITEMS, max_tokens=BATCH_MAX_TOKENS):
+    """
+    Группирует тексты в пачки, ограниченные и по количеству, и по токенам.
+    Возвращает список списков индексов (порядок сохраняется).
+    Слишком большой текст уходит отдельной пачкой.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = approx_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class GeminiEmbeddingBackend:
+    """Эмбеддинги через google.generativeai. Принимает список текстов за один вызов."""
+
+    def __init__(self, model=EMBEDDING_MODEL):
+        import google.generativeai as genai  # только для живого API — офлайн-бэкенды работают без пакета
+        self.genai = genai
+        self.model = model
+
+    def embed(self, texts, task_type="retrieval_document"):
+        result = self.genai.embed_content(model=self.model, content=list(texts), task_type=task_type)
+        vectors = result.get('embedding') if result else None
+        if not vectors or len(vectors) != len(texts):
+            raise RuntimeError("Empty or partial embedding response")
+        return vectors
+
+
+class HashEmbeddingBackend:
+    """
+    Локальный детерминированный бэкенд (без сети) — для офлайн-проверок и бенчмарков.
+    Запоминает размеры пачек в batch_sizes; latency — искусственная задержка на вызов.
+    """
+
+    def __init__(self, model='local/hash-embedding', dim=256, latency=0.0):
+        self.model = model
+        self.dim = dim
+        self.latency = latency
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def embed(self, texts, task_type="retrieval_document"):
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def _vector(self, text):
+        # Feature hashing по словам: похожие тексты дают близкие вектора
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.md5(word.encode('utf-8')).digest()[:4], 'little')
+            vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec /= norm
+        return vec.tolist()
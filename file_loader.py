@@ -0,0 +1,60 @@
+import os
+import mmap
+import codecs
+
+# По сколько байт файл читается и дописывается в редактор
+FILE_CHUNK_BYTES = 256 * 1024
+# Файлы от этого размера читаются через mmap (без копии всего файла в памяти процесса)
+MMAP_MIN_BYTES = 1024 * 1024
+# Файлы меньше этого размера открываются сразу, без фоновой загрузки
+ASYNC_LOAD_MIN_BYTES = 256 * 1024
+# Выше этого размера подсветка синтаксиса выключается
+LARGE_FILE_BYTES = 2 * 1024 * 1024
+
+
+def tab_key(path):
+    """Ключ вкладки по пути: один и тот же файл под разными написаниями — одна вкладка."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def read_byte_chunks(path, chunk_size=FILE_CHUNK_BYTES):
+    """Байты файла кусками: большие файлы — через mmap, остальные — обычным чтением."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_MIN_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for start in range(0, len(m), chunk_size):
+                    yield m[start:start + chunk_size]
+            return
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+def _newlines(text):
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def read_text_chunks(path, chunk_size=FILE_CHUNK_BYTES, encoding='utf-8'):
+    """
+    Текст файла кусками — как open(path, 'r', encoding=...).read(), но по частям:
+    многобайтовые символы и \\r\\n на границе кусков не рвутся, переводы строк -> \\n.
+    Не UTF-8 — UnicodeDecodeError.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    carry = ""
+    for data in read_byte_chunks(path, chunk_size):
+        text = carry + decoder.decode(data)
+        # \r в конце куска может оказаться половиной \r\n — придержим до следующего
+        carry = "\r" if text.endswith("\r") else ""
+        text = text[:-1] if carry else text
+        if text:
+            yield _newlines(text)
+    text = carry + decoder.decode(b"", final=True)
+    if text:
+        yield _newlines(text)
+
+
+def read_text(path):
+    return "".join(read_text_chunks(path))
@@ -0,0 +1,177 @@
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Файлы больше этого размера (байт) не индексируем: минифицированный JS, дампы, логи
+MAX_FILE_SIZE = 1024 * 1024
+# Сколько байт смотрим, чтобы понять, что файл бинарный
+BINARY_PROBE = 8192
+# Параллельное чтение: потоки и размер окна "в полёте" (ограничивает память)
+READ_WORKERS = 8
+READ_WINDOW = 64
+
+
+def _gitignore_regex(pattern):
+    """Переводит один шаблон .gitignore в regex для пути относительно папки .gitignore."""
+    anchored = '/' in pattern.rstrip('/')
+    pattern = pattern.strip('/')
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                out.append(pattern[i:end + 1])
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    body = ''.join(out)
+    prefix = '^' if anchored else '^(?:.*/)?'
+    return re.compile(prefix + body + '$')
+
+
+class GitIgnore:
+    """Минимальная поддержка .gitignore: *, **, ?, [..], ! (отрицание), / в конце (только папки)."""
+
+    def __init__(self):
+        self.rules = []  # (base_rel_dir, regex, negate, dir_only)
+
+    def add_file(self, path, base_rel):
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            try:
+                self.rules.append((base_rel, _gitignore_regex(line), negate, dir_only))
+            except re.error:
+                continue
+
+    def ignored(self, rel_path, is_dir):
+        """rel_path — путь относительно корня проекта через '/'. Побеждает последнее совпавшее правило."""
+        result = False
+        for base, regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + '/'):
+                    continue
+                sub = rel_path[len(base) + 1:]
+            else:
+                sub = rel_path
+            if regex.match(sub):
+                result = not negate
+        return result
+
+
+def read_text(full_path, max_size=MAX_FILE_SIZE):
+    """Текст файла или None: пустой, слишком большой, бинарный или не читается."""
+    try:
+        if os.path.getsize(full_path) > max_size:
+            return None
+        with open(full_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        print(f"[ERROR] Не удалось прочитать файл {full_path}: {e}")
+        return None
+    if b'\0' in data[:BINARY_PROBE]:
+        return None
+    # Переводы строк как при открытии в текстовом режиме (ключи чанков не зависят от ОС)
+    text = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+    return text if text.strip() else None
+
+
+def iter_paths(root_path, extensions, is_skipped_dir, use_gitignore=True):
+    """
+    Генератор относительных путей подходящих файлов. Игнорируемые папки
+    вырезаются из dirs прямо в os.walk, поэтому в них даже не заходим.
+    """
+    gitignore = GitIgnore()
+    for root, dirs, files in os.walk(root_path):
+        rel_root = os.path.relpath(root, root_path).replace('\\', '/')
+        rel_root = '' if rel_root == '.' else rel_root
+        if use_gitignore and '.gitignore' in files:
+            gitignore.add_file(os.path.join(root, '.gitignore'), rel_root)
+
+        def rel(name):
+            return f"{rel_root}/{name}" if rel_root else name
+
+        dirs[:] = sorted(d for d in dirs
+                         if not is_skipped_dir(d) and not (use_gitignore and gitignore.ignored(rel(d), True)))
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in extensions:
+                continue
+            if use_gitignore and gitignore.ignored(rel(name), False):
+                continue
+            yield os.path.normpath(rel(name))
+
+
+def is_indexable(root_path, rel_path, extensions, is_skipped_dir, use_gitignore=True):
+    """
+    Прошёл бы файл фильтры обхода iter_paths: расширение, игнорируемые папки и .gitignore
+    (правила корня и всех папок по пути, проигнорированная папка скрывает всё внутри).
+    Для точечной переиндексации — чтобы она не добавляла файлы, которых нет при полной.
+    """
+    parts = rel_path.replace('\\', '/').strip('/').split('/')
+    if os.path.splitext(parts[-1])[1].lower() not in extensions:
+        return False
+    if any(is_skipped_dir(part) for part in parts[:-1]):
+        return False
+    if not use_gitignore:
+        return True
+    gitignore = GitIgnore()
+    for depth in range(len(parts)):
+        base = '/'.join(parts[:depth])
+        gitignore.add_file(os.path.join(root_path, base, '.gitignore'), base)
+        if gitignore.ignored('/'.join(parts[:depth + 1]), depth < len(parts) - 1):
+            return False
+    return True
+
+
+def scan_files(root_path, extensions, is_skipped_dir, max_size=MAX_FILE_SIZE,
+               workers=READ_WORKERS, window=READ_WINDOW, use_gitignore=True):
+    """
+    Потоково отдаёт (rel_path, text). Файлы читаются параллельно, но "в полёте"
+    не больше window штук — в памяти никогда нет всего репозитория сразу.
+    Порядок детерминированный (как у обхода).
+    """
+    paths = iter_paths(root_path, extensions, is_skipped_dir, use_gitignore)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for rel_path in paths:
+            pending.append((rel_path, pool.submit(read_text, os.path.join(root_path, rel_path), max_size)))
+            if len(pending) >= window:
+                rel, fut = pending.popleft()
+                text = fut.result()
+                if text:
+                    yield rel, text
+        while pending:
+            rel, fut = pending.popleft()
+            text = fut.result()
+            if text:
+                yield rel, text
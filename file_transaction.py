@@ -0,0 +1,281 @@
+import os
+import hashlib
+import tempfile
+from collections import namedtuple
+
+from code_patch import apply_patch
+
+FILE_START = "### FILE: "
+FILE_END = "### END_FILE"
+PATCH_START = "### PATCH: "
+PATCH_END = "### END_PATCH"
+# Маркер начала -> (вид блока, маркер конца)
+BLOCK_MARKERS = {FILE_START: ('file', FILE_END), PATCH_START: ('patch', PATCH_END)}
+_MAX_START = max(len(m) for m in BLOCK_MARKERS)
+
+_umask = None
+# Сколько байт начала файла смотрим, чтобы узнать его стиль переводов строк
+NEWLINE_PROBE = 64 * 1024
+
+# status: 'created' / 'updated' / 'unchanged'
+FileChange = namedtuple('FileChange', 'path status digest')
+# kind: 'file' (файл целиком) или 'patch' (хунки SEARCH/REPLACE или unified diff, см. code_patch)
+FileBlock = namedtuple('FileBlock', 'kind path content')
+
+
+def process_umask():
+    """
+    umask процесса — права новых файлов как у обычного open(..., 'w') (mkstemp создаёт 0600).
+    Читается один раз. На Linux — из /proc/self/status, без побочных эффектов. Иначе — через
+    os.umask(0) / os.umask(old): это на миг меняет umask всего процесса, поэтому main вызывает
+    функцию при старте в главном потоке, до запуска рабочих потоков.
+    """
+    global _umask
+    if _umask is None:
+        try:
+            with open('/proc/self/status') as f:
+                _umask = next(int(line.split()[1], 8) for line in f if line.startswith('Umask:'))
+        except (OSError, StopIteration, ValueError, IndexError):
+            current = os.umask(0)
+            os.umask(current)
+            _umask = current
+    return _umask
+
+
+def detect_newline(data, default=os.linesep):
+    """Переводы строк файла по первой строке: '\r\n' или '\n'; без переводов строк — default."""
+    end = data.find(b'\n')
+    if end < 0:
+        return default
+    return '\r\n' if data[end - 1:end] == b'\r' else '\n'
+
+
+def to_newline(text, newline):
+    """Текст с переводами строк newline (вход — с любыми: '\n' или '\r\n')."""
+    text = text.replace('\r\n', '\n')
+    return text if newline == '\n' else text.replace('\n', newline)
+
+
+def content_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def clean_block(content):
+    """Та же чистка, что была в process_files: маркдаун-обёртки внутри блока убираем."""
+    return content.replace("```python", "").replace("```", "").strip()
+
+
+class FileBlockParser:
+    """
+    Инкрементальный разбор блоков "### FILE: path ... ### END_FILE" и
+    "### PATCH: path ... ### END_PATCH" из потока ответа: feed(кусок) возвращает
+    блоки (FileBlock), которые закончились в этом куске.
+    Хранится только хвост после последнего закрытого блока.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._scan = 0  # с какой позиции буфера искать маркер конца (уже просмотренное не сканируем)
+
+    def _next_start(self):
+        found = [(self.buffer.find(m), m) for m in BLOCK_MARKERS]
+        found = [f for f in found if f[0] >= 0]
+        return min(found) if found else (-1, None)
+
+    def feed(self, piece):
+        self.buffer += piece
+        blocks = []
+        while True:
+            start, marker = self._next_start()
+            if start < 0:
+                # Вне блоков храним только хвост, где может начинаться обрезанный маркер
+                self.buffer = self.buffer[-(_MAX_START - 1):]
+                self._scan = 0
+                return blocks
+            if start:
+                self.buffer = self.buffer[start:]
+                self._scan = 0
+            kind, end_marker = BLOCK_MARKERS[marker]
+            header_end = self.buffer.find("\n")
+            end = self.buffer.find(end_marker, max(header_end, self._scan)) if header_end >= 0 else -1
+            if end < 0:
+                self._scan = max(len(self.buffer) - len(end_marker) + 1, 0)
+                return blocks
+            path = self.buffer[len(marker):header_end].strip()
+            body = self.buffer[header_end + 1:end]
+            blocks.append(FileBlock(kind, path, clean_block(body) if kind == 'file' else body.strip("\n")))
+            self.buffer = self.buffer[end + len(end_marker):]
+            self._scan = 0
+
+
+class Changeset:
+    """Итог транзакции — готовый вход для индексатора (changed) и для отчёта."""
+
+    def __init__(self):
+        self.changes = []
+        self.errors = []  # (path, сообщение)
+
+    def extend(self, other):
+        self.changes.extend(other.changes)
+        self.errors.extend(other.errors)
+
+    def paths(self, *statuses):
+        return [c.path for c in self.changes if c.status in statuses]
+
+    @property
+    def created(self):
+        return self.paths('created')
+
+    @property
+    def updated(self):
+        return self.paths('updated')
+
+    @property
+    def unchanged(self):
+        return self.paths('unchanged')
+
+    @property
+    def changed(self):
+        """Файлы, которые действительно изменились (их и надо переиндексировать)."""
+        return list(dict.fromkeys(self.paths('created', 'updated')))
+
+    def __bool__(self):
+        return bool(self.changes or self.errors)
+
+
+class WriteTransaction:
+    """
+    Пакетная запись файлов в папку проекта:
+    stage() сразу пишет содержимое во временный файл рядом с целевым (тот же диск),
+    файлы с тем же содержимым (по хэшу) пропускаются; commit() переносит все временные
+    файлы на место через os.replace — ни один файл не остаётся записанным наполовину.
+    rollback() (или исключение внутри with) удаляет временные файлы.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.staged = {}  # rel -> (temp, FileChange)
+        self.changeset = Changeset()
+        self.failed_patches = []  # (path, причина)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.rollback()
+        return False
+
+    def resolve(self, path):
+        rel = os.path.normpath(path.strip().replace('\\', '/')).replace(os.sep, '/')
+        full = os.path.abspath(os.path.join(self.root, rel))
+        if os.path.commonpath([self.root, full]) != self.root:
+            raise ValueError(f"path outside project: {path}")
+        return rel, full
+
+    def current(self, path):
+        """
+        Текущее содержимое файла с учётом уже подготовленных в этой транзакции записей.
+        Переводы строк — '\n' (хунки патча сопоставляются построчно); стиль файла
+        (например, CRLF) stage() вернёт при записи.
+        """
+        rel, full = self.resolve(path)
+        temp, change = self.staged.get(rel, (None, None))
+        source = temp or full
+        with open(source, 'rb') as f:
+            return to_newline(f.read().decode('utf-8'), '\n')
+
+    def stage_patch(self, path, body):
+        """
+        Применяет патч к текущей версии файла и готовит запись результата.
+        None — патч не применился: путь и причина попадают в failed_patches,
+        вызывающий перевыпускает такие файлы целиком (или сообщает об ошибке).
+        """
+        try:
+            new_content = apply_patch(self.current(path), body)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            self.failed_patches.append((path, str(e)))
+            return None
+        return self.stage(path, new_content)
+
+    def stage_block(self, block):
+        if block.kind == 'patch':
+            return self.stage_patch(block.path, block.content)
+        return self.stage(block.path, block.content)
+
+    def stage(self, path, content):
+        """
+        Готовит запись; возвращает FileChange (или None, если путь отклонён — см. changeset.errors).
+        Переводы строк — как в существующем файле; новый файл — os.linesep (как open(..., 'w')).
+        """
+        try:
+            rel, full = self.resolve(path)
+            self._drop(rel)
+            status, mode, data, digest = self._prepare(full, content)
+            if status == 'unchanged':
+                change = FileChange(rel, status, digest)
+                self.staged[rel] = (None, change)
+                return change
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(full), prefix=f".{os.path.basename(full)}.",
+                                        suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(temp, mode)
+            change = FileChange(rel, status, digest)
+            self.staged[rel] = (temp, change)
+            return change
+        except (OSError, ValueError) as e:
+            self.changeset.errors.append((path, str(e)))
+            return None
+
+    @staticmethod
+    def _prepare(full, content):
+        """
+        (статус, права, байты для записи, хэш). Нет файла -> created, другой размер -> updated;
+        целиком файл читается, только если размер совпал.
+        """
+        try:
+            f = open(full, 'rb')
+        except FileNotFoundError:
+            data = to_newline(content, os.linesep).encode('utf-8')
+            return 'created', 0o666 & ~process_umask(), data, content_digest(data)
+        with f:
+            st = os.fstat(f.fileno())
+            head = f.read(NEWLINE_PROBE)
+            data = to_newline(content, detect_newline(head)).encode('utf-8')
+            digest = content_digest(data)
+            mode = st.st_mode & 0o777
+            if st.st_size != len(data):
+                return 'updated', mode, data, digest
+            same = content_digest(head + f.read()) == digest
+        return ('unchanged' if same else 'updated'), mode, data, digest
+
+    def _drop(self, rel):
+        # Повторный блок того же файла в ответе — побеждает последний
+        temp, _ = self.staged.pop(rel, (None, None))
+        if temp:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+    def paths(self):
+        return list(self.staged)
+
+    def commit(self):
+        """Переносит все подготовленные файлы на место. Возвращает Changeset."""
+        for rel, (temp, change) in list(self.staged.items()):
+            if temp:
+                try:
+                    os.replace(temp, os.path.join(self.root, rel))
+                except OSError as e:
+                    self.changeset.errors.append((rel, str(e)))
+                    self._drop(rel)
+                    continue
+            self.changeset.changes.append(change)
+        self.staged.clear()
+        return self.changeset
+
+    def rollback(self):
+        for rel in list(self.staged):
+            self._drop(rel)
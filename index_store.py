@@ -0,0 +1,249 @@
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+
+# Папка с кэшем индекса внутри проекта
+INDEX_DIR_NAME = '.jarvis_index'
+META_FILE = 'meta.json'
+STORE_VERSION = 2
+VECTORS_PREFIX = 'vectors-'
+
+
+def chunk_key(text, model):
+    """Ключ чанка: хэш модели + содержимого. Меняется модель или текст -> новый ключ."""
+    h = hashlib.sha256()
+    h.update(model.encode('utf-8'))
+    h.update(b'\0')
+    h.update(text.encode('utf-8', errors='ignore'))
+    return h.hexdigest()
+
+
+def normalize_rows(matrix):
+    """Contiguous float32 с L2-нормированными строками (скалярное произведение = косинус)."""
+    matrix = np.array(matrix, dtype=np.float32, copy=True, ndmin=2, order='C')
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_indices(scores, k):
+    """
+    Индексы k лучших оценок по убыванию. scores — вектор (N,) или матрица (Q, N).
+    argpartition — O(N) вместо полной сортировки; сортируются только k кандидатов.
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        part = np.argpartition(scores, n - k, axis=-1)[..., n - k:]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(np.take_along_axis(scores, part, axis=-1), axis=-1)[..., ::-1]
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def _write_at(path, offset, data):
+    """Пишет data с позиции offset и обрезает файл за ней (хвост недописанного append)."""
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+
+
+class IndexStore:
+    """
+    Постоянное хранилище эмбеддингов на диске (.jarvis_index/).
+    Вектора лежат в плоском float32-файле, который открывается через np.memmap
+    (без парсинга при загрузке), ключи — построчно в .keys-файле рядом.
+    meta.json хранит, сколько строк обоих файлов действительны: append() дописывает
+    файлы в конец и только потом обновляет meta.json, недописанный хвост при загрузке
+    игнорируется. Вектора хранятся уже L2-нормированными.
+    """
+
+    def __init__(self, root_path, model):
+        self.dir = os.path.join(root_path, INDEX_DIR_NAME)
+        self.model = model
+        self.dim = 0
+        self.keys = []
+        self.rows = {}
+        self.vectors = None
+        self.vectors_file = None
+        self.keys_file = None
+        self.keys_size = 0  # байт действительного начала .keys-файла
+
+    def load(self):
+        """Загружает индекс с диска. Возвращает True, если кэш найден и подходит."""
+        meta_path = os.path.join(self.dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return False
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != STORE_VERSION or meta.get('model') != self.model:
+                print("[DEBUG] Кэш индекса от другой модели/версии, игнорируем.")
+                return False
+
+            n_rows = int(meta.get('rows', 0))
+            dim = int(meta.get('dim', 0))
+            if not n_rows or not dim:
+                return False
+            keys_size = int(meta['keys_size'])
+            with open(os.path.join(self.dir, meta['keys_file']), 'rb') as f:
+                keys = f.read(keys_size).decode('utf-8').split('\n')[:-1]
+            vec_path = os.path.join(self.dir, meta['vectors_file'])
+            if len(keys) != n_rows or os.path.getsize(vec_path) < n_rows * dim * 4:
+                print("[WARN] Файл векторов повреждён, игнорируем кэш.")
+                return False
+
+            self.keys_size = keys_size
+            self._install(keys, meta['vectors_file'], meta['keys_file'], dim, cleanup=False)
+            return True
+        except Exception as e:
+            print(f"[WARN] Не удалось загрузить кэш индекса: {e}")
+            return False
+
+    def get(self, key):
+        """Вектор из кэша или None."""
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return self.vectors[row]
+
+    def save(self, keys, vectors):
+        """Перезаписывает хранилище целиком (только актуальные ключи, старые выкидываются)."""
+        writer = self.writer()
+        writer.append(keys, vectors)
+        if not writer.commit():
+            raise ValueError("Nothing to save")
+
+    def append(self, keys, vectors):
+        """
+        Дописывает вектора в конец текущего файла, уже записанные строки не трогает
+        (открытые memmap продолжают их читать). Без файла — как save().
+        """
+        if not len(keys):
+            return
+        if self.vectors_file is None:
+            self.save(keys, vectors)
+            return
+        matrix = normalize_rows(vectors)
+        if matrix.shape != (len(keys), self.dim):
+            raise ValueError("keys/vectors size mismatch")
+        data = ''.join(f"{key}\n" for key in keys).encode('utf-8')
+        n_rows = len(self.keys)
+        _write_at(os.path.join(self.dir, self.vectors_file), n_rows * self.dim * 4, matrix.tobytes())
+        _write_at(os.path.join(self.dir, self.keys_file), self.keys_size, data)
+        self._write_meta(self.vectors_file, self.keys_file, self.dim, n_rows + len(keys),
+                         self.keys_size + len(data))
+
+        self.keys_size += len(data)
+        self.rows.update((key, n_rows + i) for i, key in enumerate(keys))
+        self.keys.extend(keys)
+        self.vectors = np.memmap(os.path.join(self.dir, self.vectors_file), dtype=np.float32, mode='r',
+                                 shape=(len(self.keys), self.dim))
+
+    def writer(self):
+        """Потоковая запись нового файла векторов (см. _StoreWriter)."""
+        return _StoreWriter(self)
+
+    def _write_meta(self, vectors_file, keys_file, dim, n_rows, keys_size):
+        """meta.json меняется атомарно (os.replace)."""
+        meta = {
+            'version': STORE_VERSION,
+            'model': self.model,
+            'dim': dim,
+            'rows': n_rows,
+            'vectors_file': vectors_file,
+            'keys_file': keys_file,
+            'keys_size': keys_size,
+        }
+        tmp_meta = os.path.join(self.dir, META_FILE + '.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, os.path.join(self.dir, META_FILE))
+
+    def _install(self, keys, vectors_file, keys_file, dim, cleanup=True):
+        self.vectors = np.memmap(os.path.join(self.dir, vectors_file), dtype=np.float32, mode='r',
+                                 shape=(len(keys), dim))
+        self.vectors_file = vectors_file
+        self.keys_file = keys_file
+        self.dim = dim
+        self.keys = keys
+        self.rows = {k: i for i, k in enumerate(keys)}
+        if cleanup:
+            self._cleanup()
+
+    def _cleanup(self):
+        """Удаляет старые файлы векторов и ключей (если ОС не даёт — удалим в следующий раз)."""
+        for name in os.listdir(self.dir):
+            if name.startswith(VECTORS_PREFIX) and name.endswith(('.f32', '.keys')) \
+                    and name not in (self.vectors_file, self.keys_file):
+                try:
+                    os.remove(os.path.join(self.dir, name))
+                except OSError:
+                    pass
+
+
+class _StoreWriter:
+    """
+    Пишет вектора в новый файл порциями, не держа всю матрицу в памяти.
+    Файл получает уникальное имя: старый memmap может ещё читаться из другого
+    потока, а на Windows открытый файл нельзя заменить. meta.json меняется
+    атомарно (os.replace) только в commit().
+    """
+
+    def __init__(self, store):
+        self.store = store
+        os.makedirs(store.dir, exist_ok=True)
+        name = f"{VECTORS_PREFIX}{uuid.uuid4().hex[:12]}"
+        self.vectors_file = name + '.f32'
+        self.keys_file = name + '.keys'
+        self.path = os.path.join(store.dir, self.vectors_file)
+        self.keys_path = os.path.join(store.dir, self.keys_file)
+        self.f = open(self.path, 'wb')
+        self.keys_f = open(self.keys_path, 'wb')
+        self.keys_size = 0
+        self.keys = []
+        self.dim = None
+
+    def append(self, keys, vectors):
+        if not len(keys):
+            return
+        matrix = normalize_rows(vectors)
+        if matrix.shape[0] != len(keys):
+            raise ValueError("keys/vectors size mismatch")
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+        elif matrix.shape[1] != self.dim:
+            raise ValueError("vector dimension changed")
+        matrix.tofile(self.f)
+        data = ''.join(f"{key}\n" for key in keys).encode('utf-8')
+        self.keys_f.write(data)
+        self.keys_size += len(data)
+        self.keys.extend(keys)
+
+    def abort(self):
+        self.f.close()
+        self.keys_f.close()
+        for path in (self.path, self.keys_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def commit(self):
+        """Фиксирует запись. False — если ничего не записано."""
+        if not self.keys:
+            self.abort()
+            return False
+        self.f.close()
+        self.keys_f.close()
+        store = self.store
+        store._write_meta(self.vectors_file, self.keys_file, self.dim, len(self.keys), self.keys_size)
+        store.keys_size = self.keys_size
+        store._install(self.keys, self.vectors_file, self.keys_file, self.dim)
+        return True
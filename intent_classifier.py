@@ -0,0 +1,219 @@
+import re
+import math
+import threading
+from collections import OrderedDict, Counter, namedtuple
+
+TASK = "TASK"
+QUESTION = "QUESTION"
+
+# Ниже этой уверенности решает LLM (если доступна)
+INTENT_CONFIDENCE_THRESHOLD = 0.5
+INTENT_CACHE_SIZE = 256
+# Локальная модель включается, когда LLM разметила столько запросов (обоих классов)
+MODEL_MIN_SAMPLES = 20
+
+# Основы глаголов "сделай что-то с проектом" (RU): создай, добавь, удали, перепиши, ...
+_RU_TASK_STEMS = (
+    'созда', 'сдела', 'добав', 'удал', 'измен', 'исправ', 'перепиш', 'напиш', 'допиш', 'реализу',
+    'переимену', 'обнов', 'замен', 'вынес', 'раздел', 'оптимизиру', 'отрефактор', 'сгенериру',
+    'подключ', 'настро', 'внедр', 'перенес', 'убер', 'почин', 'сократ', 'упрост', 'передела',
+    'поменя', 'поправ', 'сверста', 'покро', 'доба', 'собер', 'интегриру', 'мигриру',
+)
+_RU_TASK_RE = re.compile(r"^(?:%s)(?:й|ь|и|йте|ьте|ите|ть|ить)$" % '|'.join(_RU_TASK_STEMS))
+_EN_TASK_VERBS = {
+    'create', 'add', 'make', 'build', 'implement', 'write', 'fix', 'refactor', 'rename', 'remove',
+    'delete', 'update', 'change', 'modify', 'replace', 'generate', 'move', 'optimize', 'convert',
+    'extract', 'split', 'migrate', 'rewrite', 'introduce', 'setup', 'set', 'cover', 'drop', 'integrate',
+}
+# Вопросительные слова и "объясни" — по промпту это QUESTION
+_QUESTION_WORDS = {
+    'как', 'что', 'почему', 'зачем', 'где', 'когда', 'какой', 'какая', 'какое', 'какие', 'каким',
+    'сколько', 'чем', 'кто', 'ли', 'how', 'what', 'why', 'where', 'when', 'which', 'who', 'whose',
+}
+_EXPLAIN_WORDS = {
+    'объясни', 'поясни', 'расскажи', 'подскажи', 'опиши', 'explain', 'describe', 'tell', 'clarify',
+}
+_AUX_WORDS = {'is', 'are', 'does', 'do', 'did', 'should', 'will', 'was', 'were', 'has', 'have'}
+_POLITE_WORDS = {'можешь', 'можете', 'сможешь', 'могу', 'can', 'could', 'would', 'will'}
+_FILLER_WORDS = {'пожалуйста', 'плиз', 'давай', 'ну', 'теперь', 'а', 'и', 'please', 'now', 'also', 'then',
+                 'you', 'ты', 'вы', 'мне', 'нам'}
+_NEED_WORDS = {'нужно', 'надо', 'необходимо', 'хочу', 'требуется', 'need', 'want'}
+
+IntentDecision = namedtuple('IntentDecision', 'label confidence source')
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def _is_task_verb(word):
+    return word in _EN_TASK_VERBS or bool(_RU_TASK_RE.match(word))
+
+
+def rule_scores(text):
+    """
+    Оценки (task, question) по правилам: повелительный глагол в начале, вежливая просьба
+    ("можешь добавить"), "нужно ..." против вопросительных слов, "объясни" и '?' в конце.
+    """
+    words = _words(text)
+    head = [w for w in words if w not in _FILLER_WORDS]
+    task = question = 0.0
+    if not head:
+        return task, question
+
+    first = head[0]
+    if first in _QUESTION_WORDS:
+        question += 0.5
+    elif first in _EXPLAIN_WORDS:
+        question += 0.6
+    elif first in _AUX_WORDS and not (len(head) > 1 and head[1] in _POLITE_WORDS):
+        question += 0.4
+    elif first in _POLITE_WORDS and any(_is_task_verb(w) for w in head[1:4]):
+        task += 0.8
+    elif _is_task_verb(first):
+        task += 0.6
+    elif first in _NEED_WORDS and any(_is_task_verb(w) for w in head[1:4]):
+        task += 0.6
+
+    rest = head[1:]
+    if any(w in _QUESTION_WORDS for w in rest):
+        question += 0.2
+    if any(w in _EXPLAIN_WORDS for w in rest):
+        question += 0.3
+    if task == 0 and any(_is_task_verb(w) for w in rest):
+        task += 0.3
+    if text.rstrip().endswith('?'):
+        question += 0.3
+    return task, question
+
+
+class NaiveBayesIntentModel:
+    """
+    Крошечная модель (мультиномиальный наивный Байес по словам и биграммам),
+    обучается онлайн на решениях LLM — со временем всё больше запросов решается локально.
+    """
+
+    def __init__(self):
+        self.counts = {TASK: Counter(), QUESTION: Counter()}
+        self.totals = {TASK: 0, QUESTION: 0}
+        self.docs = {TASK: 0, QUESTION: 0}
+        self.vocab = set()
+
+    @staticmethod
+    def features(text):
+        words = _words(text)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    @property
+    def samples(self):
+        return self.docs[TASK] + self.docs[QUESTION]
+
+    @property
+    def ready(self):
+        return self.samples >= MODEL_MIN_SAMPLES and all(self.docs.values())
+
+    def learn(self, text, label):
+        feats = self.features(text)
+        self.counts[label].update(feats)
+        self.totals[label] += len(feats)
+        self.docs[label] += 1
+        self.vocab.update(feats)
+
+    def predict(self, text):
+        """(label, вероятность) или (None, 0.0), если модель ещё не обучена."""
+        if not self.ready:
+            return None, 0.0
+        feats = self.features(text)
+        v = len(self.vocab) + 1
+        logp = {}
+        for label in (TASK, QUESTION):
+            lp = math.log(self.docs[label] / self.samples)
+            counts, total = self.counts[label], self.totals[label]
+            for f in feats:
+                lp += math.log((counts[f] + 1) / (total + v))
+            logp[label] = lp
+        top = max(logp, key=logp.get)
+        other = QUESTION if top == TASK else TASK
+        return top, 1.0 / (1.0 + math.exp(logp[other] - logp[top]))
+
+
+class IntentClassifier:
+    """
+    TASK/QUESTION без сети для очевидных случаев: кэш -> правила -> локальная модель,
+    и только при уверенности ниже threshold — LLM (remote). stats() — откуда приходят решения.
+    """
+
+    def __init__(self, threshold=INTENT_CONFIDENCE_THRESHOLD, cache_size=INTENT_CACHE_SIZE, use_model=True):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.model = NaiveBayesIntentModel() if use_model else None
+        self._cache = OrderedDict()
+        self._sources = Counter()
+        self._lock = threading.Lock()
+
+    def classify(self, text, remote=None):
+        return self.decide(text, remote).label
+
+    def decide(self, text, remote=None):
+        """
+        remote(text) -> 'TASK' / 'QUESTION' или None (LLM недоступна). Без remote
+        (или если она не ответила) берётся лучшая локальная догадка.
+        """
+        key = ' '.join(text.lower().split())
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            return self._count(IntentDecision(cached, 1.0, 'cache'))
+
+        decision = self._local(text)
+        if decision.confidence < self.threshold and remote is not None:
+            label = remote(text)
+            if label in (TASK, QUESTION):
+                if self.model is not None:
+                    with self._lock:
+                        self.model.learn(text, label)
+                decision = IntentDecision(label, 1.0, 'llm')
+
+        if decision.confidence >= self.threshold:
+            with self._lock:
+                self._cache[key] = decision.label
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        print(f"[DEBUG] Intent: {decision.label} ({decision.source}, {decision.confidence:.2f})")
+        return self._count(decision)
+
+    def _local(self, text):
+        task, question = rule_scores(text)
+        label = TASK if task > question else QUESTION
+        decision = IntentDecision(label, min(1.0, round(abs(task - question), 3)), 'rules')
+        if decision.confidence < self.threshold and self.model is not None:
+            with self._lock:
+                model_label, prob = self.model.predict(text)
+            # Вероятность 0.5..1 -> уверенность 0..1
+            model_conf = 2 * prob - 1
+            if model_label and model_conf > decision.confidence:
+                decision = IntentDecision(model_label, model_conf, 'model')
+        if decision.confidence == 0:
+            # Ничего не сработало: по умолчанию вопрос (безопасно, файлы не трогаем)
+            decision = IntentDecision(QUESTION, 0.0, 'default')
+        return decision
+
+    def _count(self, decision):
+        with self._lock:
+            self._sources[decision.source] += 1
+        return decision
+
+    def stats(self):
+        """Сколько решений из каждого источника и доля решённых без сети."""
+        with self._lock:
+            sources = dict(self._sources)
+            total = sum(sources.values())
+            local = total - sources.get('llm', 0)
+            return {
+                'sources': sources,
+                'total': total,
+                'local_rate': round(local / total, 3) if total else 0.0,
+                'model_samples': self.model.samples if self.model is not None else 0,
+            }
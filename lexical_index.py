@@ -0,0 +1,208 @@
+import re
+import math
+from array import array
+from collections import Counter
+import numpy as np
+
+from index_store import top_k_indices
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Токены короче не индексируем (i, x, _ — шум)
+MIN_TOKEN_LEN = 2
+# Частота терма в чанке хранится в uint16
+TF_MAX = 65535
+
+_WORD_RE = re.compile(r"\w+")
+# getHTTPResponse2 -> get, HTTP, Response, 2
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def code_tokens(text):
+    """
+    Токены с учётом кода: идентификатор целиком (в нижнем регистре) плюс его части
+    по snake_case и camelCase. "getUserName" -> getusername, get, user, name.
+    Точное имя функции из чата совпадает и целиком, и по частям.
+    """
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        if len(word) >= MIN_TOKEN_LEN:
+            tokens.append(word.lower())
+        parts = [p for piece in word.split('_') for p in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts if len(p) >= MIN_TOKEN_LEN)
+    return tokens
+
+
+def _as_numpy(values, dtype):
+    return np.frombuffer(values, dtype=dtype).copy() if len(values) else np.empty(0, dtype=dtype)
+
+
+class LexicalIndex:
+    """
+    Обратный индекс BM25 в CSR-виде: словарь term -> id, постинги терма id лежат
+    в doc_ids/tfs[offsets[id]:offsets[id + 1]]. Строки совпадают со строками ChunkStore.
+    Работает полностью локально — поиск без сети за миллисекунды.
+    """
+
+    def __init__(self, vocab=None, offsets=None, doc_ids=None, tfs=None, doc_lens=None,
+                 k1=BM25_K1, b=BM25_B):
+        self.vocab = vocab or {}
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self.doc_ids = np.empty(0, dtype=np.int32) if doc_ids is None else doc_ids
+        self.tfs = np.empty(0, dtype=np.uint16) if tfs is None else tfs
+        self.doc_lens = np.empty(0, dtype=np.int32) if doc_lens is None else doc_lens
+        self.k1 = k1
+        self.b = b
+        self.avg_len = float(self.doc_lens.mean()) if len(self.doc_lens) else 0.0
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def scores(self, query):
+        """Вектор BM25-оценок по всем строкам (0 — нет ни одного совпадения)."""
+        n = len(self)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / max(self.avg_len, 1.0))
+        for term in set(code_tokens(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            df = end - start
+            if not df:
+                continue
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        return scores
+
+    def search(self, query, k, deleted=None):
+        """
+        Номера строк top-k по BM25 (только с ненулевой оценкой), по убыванию.
+        deleted — маска удалённых строк (tombstone), они в результат не попадают.
+        """
+        scores = self.scores(query)
+        if deleted is not None:
+            scores[deleted] = 0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return hits
+        return hits[top_k_indices(scores[hits], k)]
+
+    def appended(self, texts):
+        """
+        Новый индекс: эти строки и texts в конце. Постинги новых строк вставляются
+        в CSR за O(постингов) без пересортировки старых — для инкрементальных обновлений.
+        """
+        builder = LexicalIndexBuilder(self.k1, self.b)
+        builder.vocab = dict(self.vocab)
+        builder.extend(texts)
+        n_terms = len(builder.vocab)
+
+        new_terms = _as_numpy(builder.term_ids, np.int32)
+        order = np.argsort(new_terms, kind='stable')
+        new_terms = new_terms[order]
+        old_counts = np.zeros(n_terms, dtype=np.int64)
+        old_counts[:len(self.offsets) - 1] = np.diff(self.offsets)
+        new_counts = np.bincount(new_terms, minlength=n_terms)
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=offsets[1:])
+
+        # Постинги терма: сначала старые (на своих местах со сдвигом), затем новые
+        n_old = len(self.offsets) - 1
+        old_terms = np.repeat(np.arange(n_old), np.diff(self.offsets))
+        old_pos = np.arange(len(self.doc_ids)) + (offsets[:n_old] - self.offsets[:-1])[old_terms]
+        new_starts = np.concatenate([[0], np.cumsum(new_counts)[:-1]])
+        new_pos = np.arange(len(new_terms)) - new_starts[new_terms] + (offsets[:-1] + old_counts)[new_terms]
+
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        doc_ids[old_pos] = self.doc_ids
+        tfs[old_pos] = self.tfs
+        doc_ids[new_pos] = _as_numpy(builder.docs, np.int32)[order] + len(self)
+        tfs[new_pos] = _as_numpy(builder.tfs, np.uint16)[order]
+        doc_lens = np.concatenate([self.doc_lens, _as_numpy(builder.doc_lens, np.int32)])
+        return LexicalIndex(builder.vocab, offsets, doc_ids, tfs, doc_lens, self.k1, self.b)
+
+    def memory_bytes(self):
+        arrays = (self.offsets, self.doc_ids, self.tfs, self.doc_lens)
+        return sum(a.nbytes for a in arrays) + sum(len(t) for t in self.vocab)
+
+
+class LexicalIndexBuilder:
+    """
+    Собирает LexicalIndex: постинги копятся тройками (term_id, doc, tf) в компактных
+    array и сортируются по терму один раз в build(). copy_rows переносит строки
+    старого индекса векторно (для инкрементальных обновлений, как ChunkStoreBuilder).
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+        self.parts = []  # уже готовые numpy-тройки из copy_rows
+        self.copied_lens = np.empty(0, dtype=np.int32)
+        self.term_ids = array('i')
+        self.docs = array('i')
+        self.tfs = array('H')
+        self.doc_lens = array('i')
+
+    def __len__(self):
+        return len(self.copied_lens) + len(self.doc_lens)
+
+    def add(self, text):
+        counts = Counter(code_tokens(text))
+        vocab = self.vocab
+        for term in counts:
+            if term not in vocab:
+                vocab[term] = len(vocab)
+        self.term_ids.extend(vocab[term] for term in counts)
+        self.docs.extend([len(self)] * len(counts))
+        self.tfs.extend(min(tf, TF_MAX) for tf in counts.values())
+        self.doc_lens.append(sum(counts.values()))
+
+    def extend(self, texts):
+        for text in texts:
+            self.add(text)
+
+    def copy_rows(self, index, rows):
+        """Строки rows старого индекса становятся первыми строками нового (в том же порядке)."""
+        if len(self):
+            raise ValueError("copy_rows must be called before add()")
+        rows = np.asarray(rows, dtype=np.intp)
+        self.vocab = dict(index.vocab)
+        mapping = np.full(len(index), -1, dtype=np.int64)
+        mapping[rows] = np.arange(len(rows))
+        term_ids = np.repeat(np.arange(len(index.offsets) - 1, dtype=np.int32), np.diff(index.offsets))
+        docs = mapping[index.doc_ids]
+        alive = docs >= 0
+        self.parts.append((term_ids[alive], docs[alive].astype(np.int32), index.tfs[alive]))
+        self.copied_lens = index.doc_lens[rows]
+
+    def build(self):
+        parts = self.parts + [(_as_numpy(self.term_ids, np.int32), _as_numpy(self.docs, np.int32),
+                               _as_numpy(self.tfs, np.uint16))]
+        term_ids = np.concatenate([p[0] for p in parts])
+        order = np.argsort(term_ids, kind='stable')
+        term_ids = term_ids[order]
+        doc_ids = np.concatenate([p[1] for p in parts])[order]
+        tfs = np.concatenate([p[2] for p in parts])[order]
+
+        # Термы, у которых после удаления файлов не осталось постингов, выкидываем из словаря
+        counts = np.bincount(term_ids, minlength=len(self.vocab))
+        alive = counts > 0
+        vocab = self.vocab
+        if not alive.all():
+            new_ids = np.cumsum(alive) - 1
+            vocab = {term: int(new_ids[i]) for term, i in vocab.items() if alive[i]}
+            counts = counts[alive]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        doc_lens = np.concatenate([self.copied_lens, _as_numpy(self.doc_lens, np.int32)])
+        return LexicalIndex(vocab, offsets, doc_ids, tfs, doc_lens, self.k1, self.b)
@@ -1,9 +1,15 @@
 # llm_client.py
 import os
 import json
-import google.generativeai as genai
 import traceback
 
+from rate_limiter import limiter
+from llm_provider import make_provider, DEFAULT_PROVIDER
+from intent_classifier import IntentClassifier
+from response_cache import ResponseCache, response_key, RESPONSE_CACHE_FILE
+from embedding_backend import approx_tokens
+from prompt_builder import select_context, raw_tokens, log_prompt_size, CHAT_PROMPT_BUDGET, STEP_PROMPT_BUDGET
+
 # --- КОНФИГУРАЦИЯ ---
 try:
     # Пытаемся импортировать ключ из config.py
@@ -14,34 +20,118 @@ except ImportError:
 # !!! ВАЖНО: Используем существующую и быструю модель !!!
 # gemini-2.5-pro еще не вышла публично, используем 1.5-flash
 CHAT_MODEL_NAME = 'gemini-2.5-pro'
+# Параметры генерации (часть ключа кэша ответов)
+GENERATION_CONFIG = {}
+# Как агент меняет существующие файлы: 'patch' (хунки SEARCH/REPLACE) или 'full' (файл целиком)
+AGENT_EDIT_MODE = 'patch'
+# Функции, ответы которых кэшируются (детерминированные запросы, которые часто повторяются)
+CACHED_FUNCTIONS = {"classify_intent", "get_strategic_plan", "edit_code_fragment", "get_code_review"}
 
 # --- ИНИЦИАЛИЗАЦИЯ ---
 is_api_ready = False
-chat_model = None
+# Провайдер чата и эмбеддингов (llm_provider): gemini или local (офлайн), см. set_provider
+provider = None
+# Локальный классификатор намерений: кэш решений и статистика local/remote (stats())
+intent_classifier = IntentClassifier()
+# Кэш ответов LLM на диске (SQLite, LRU по размеру); статистика — response_cache.stats()
+response_cache = ResponseCache(os.environ.get("LLM_CACHE_PATH") or RESPONSE_CACHE_FILE, enabled=CACHED_FUNCTIONS)
 
 try:
     # Если ключ не в конфиге, ищем в переменных окружения
     if "ВАШ_" in API_KEY or not API_KEY:
         API_KEY = os.environ.get("GEMINI_API_KEY", "")
 
-    if API_KEY:
-        genai.configure(api_key=API_KEY)
-        chat_model = genai.GenerativeModel(CHAT_MODEL_NAME)
-        is_api_ready = True
-        print(f">>> LLM Client: Модель {CHAT_MODEL_NAME} готова к работе.")
+    if DEFAULT_PROVIDER == "gemini":
+        provider = make_provider("gemini", API_KEY, chat_model=CHAT_MODEL_NAME, generation_config=GENERATION_CONFIG)
+    else:
+        provider = make_provider(DEFAULT_PROVIDER)
+    is_api_ready = provider.ready
+    if is_api_ready:
+        print(f">>> LLM Client: Модель {provider.chat_model_name} готова к работе.")
     else:
         print(">>> LLM Client: API Key не найден.")
 except Exception as e:
     print(f"Init Error: {e}")
 
 
+def set_provider(new_provider):
+    """Подменяет провайдер (например, LocalProvider для офлайн-прогонов и бенчмарков)."""
+    global provider, is_api_ready
+    provider = new_provider
+    is_api_ready = bool(new_provider and new_provider.ready)
+
+
+def _generate(prompt):
+    """Все запросы к чат-модели идут через общий лимитер (квота, 429, backoff). Возвращает текст."""
+    return limiter.call(provider.chat_model_name, provider.generate, prompt)
+
+
+def _generate_text(prompt, cache_as=None, validate=None):
+    """
+    Текст ответа модели. cache_as — имя функции-вызывающего: если она в CACHED_FUNCTIONS,
+    ответ берётся из кэша без сети, а новый сохраняется (только если validate(text) не упал
+    и вернул True — битый ответ не должен "залипнуть" для повторных попыток).
+    """
+    key = response_key(provider.chat_model_name, prompt, GENERATION_CONFIG) if cache_as else None
+    if key:
+        cached = response_cache.get(key, cache_as)
+        if cached is not None:
+            return cached
+    text = _generate(prompt)
+    if key and _valid(text, validate):
+        response_cache.put(key, cache_as, text)
+    return text
+
+
+def _valid(text, validate):
+    if validate is None:
+        return True
+    try:
+        return bool(validate(text))
+    except Exception:
+        return False
+
+
+def _generate_stream(prompt, cache_as=None):
+    """
+    Потоковый запрос: генератор кусков текста по мере генерации.
+    Лимитер (и повторы при 429) — на открытие потока, первый кусок приходит за доли секунды.
+    Попадание в кэш (cache_as, как в _generate_text) отдаёт весь ответ одним куском;
+    в кэш попадает только ответ, дочитанный до конца.
+    """
+    key = response_key(provider.chat_model_name, prompt, GENERATION_CONFIG) if cache_as else None
+    if key:
+        cached = response_cache.get(key, cache_as)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    for text in limiter.call(provider.chat_model_name, provider.stream, prompt):
+        parts.append(text)
+        yield text
+    if key:
+        response_cache.put(key, cache_as, "".join(parts))
+
+
+def strip_code_fences(text: str, lang: str = "") -> str:
+    """Убирает markdown-обёртку ```lang ... ```, если модель её всё же добавила."""
+    if lang:
+        text = text.replace(f"```{lang}", "")
+    return text.replace("```", "").strip()
+
+
 # --- ФУНКЦИЯ 0: КЛАССИФИКАТОР НАМЕРЕНИЙ ---
 def classify_intent(user_request: str) -> str:
     """
     Определяет, что хочет пользователь: просто поговорить или изменить проект.
     Возвращает: 'TASK' (если нужно менять файлы) или 'QUESTION' (если просто ответ).
+    Очевидные случаи решаются локально (intent_classifier), LLM — только при низкой уверенности.
     """
-    if not is_api_ready: return "QUESTION"
+    return intent_classifier.classify(user_request, remote=_classify_intent_remote)
+
+def _classify_intent_remote(user_request: str):
+    """Классификация через LLM. None — модель недоступна или ответ не получен."""
+    if not is_api_ready: return None
 
     prompt = f"""
     Твоя задача — классифицировать запрос программиста.
@@ -59,13 +149,12 @@ def classify_intent(user_request: str) -> str:
     """
 
     try:
-        response = chat_model.generate_content(prompt)
-        result = response.text.strip().upper()
+        result = _generate_text(prompt, cache_as="classify_intent").strip().upper()
         # Если модель ответила лишнего, ищем ключевые слова
         if "TASK" in result: return "TASK"
         return "QUESTION"
     except:
-        return "QUESTION"  # По умолчанию считаем вопросом
+        return None  # Решит локальный классификатор (по умолчанию — вопрос)
 
 # ======================================================
 # 1. ФУНКЦИИ АГЕНТА (ПЛАНИРОВАНИЕ И ВЫПОЛНЕНИЕ)
@@ -74,8 +163,9 @@ def classify_intent(user_request: str) -> str:
 def get_strategic_plan(user_request: str) -> dict:
     """
     Анализирует запрос и создает пошаговый план разработки в формате JSON.
+    Шаги — граф: id, depends_on, files (разбирается plan_scheduler.parse_plan).
     """
-    if not is_api_ready or chat_model is None:
+    if not is_api_ready:
         return {"error": "API Key not set", "steps": []}
 
     prompt = f"""
@@ -88,40 +178,45 @@ def get_strategic_plan(user_request: str) -> dict:
     1. Верни ответ СТРОГО в формате JSON.
     2. Не пиши никакого кода, только план действий.
     3. Разбей задачу на 3-6 шагов (например: Структура проекта, База данных, Логика, UI).
+    4. Для каждого шага укажи "depends_on" — id шагов, результат которых ему НУЖЕН
+       (независимые шаги выполняются параллельно, поэтому не добавляй лишних зависимостей),
+       и "files" — пути файлов, которые шаг создаст или изменит.
 
     ФОРМАТ ОТВЕТА (JSON):
     {{
         "project_name": "Название проекта",
         "steps": [
-            "Шаг 1: Создать базовую структуру файлов...",
-            "Шаг 2: Реализовать модели данных...",
-            "Шаг 3: Настроить маршрутизацию..."
+            {{"id": 1, "title": "Создать базовую структуру файлов...", "depends_on": [], "files": ["app/__init__.py"]}},
+            {{"id": 2, "title": "Реализовать модели данных...", "depends_on": [1], "files": ["app/models.py"]}},
+            {{"id": 3, "title": "Настроить маршрутизацию...", "depends_on": [1], "files": ["app/routes.py"]}}
         ]
     }}
     """
 
     try:
-        response = chat_model.generate_content(prompt)
-        text = response.text
-        # Очистка от Markdown (если модель вернула ```json ... ```)
-        text = text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
+        return _parse_plan(_generate_text(prompt, cache_as="get_strategic_plan", validate=_parse_plan))
     except Exception as e:
         print(f"Plan Error: {e}")
         # Возвращаем аварийный план, чтобы программа не упала
         return {
             "project_name": "Task Execution",
-            "steps": [f"Выполнить задачу: {user_request}"]
+            "steps": [{"id": 1, "title": f"Выполнить задачу: {user_request}", "depends_on": [], "files": []}]
         }
 
 
-def execute_step(current_step: str, full_task: str, rag_context: list) -> str:
+def _parse_plan(text: str) -> dict:
+    # Очистка от Markdown (если модель вернула ```json ... ```)
+    text = text.replace("```json", "").replace("```", "").strip()
+    return json.loads(text)
+
+
+def _step_prompt(current_step: str, full_task: str, rag_context: list, budget: int = STEP_PROMPT_BUDGET,
+                 edit_mode: str = None) -> str:
     """
-    Пишет код для конкретного шага, учитывая найденный контекст (RAG).
+    Промпт исполнителя шага: задача + инструкция по формату файлов + контекст RAG
+    (без дублей и перекрытий, по релевантности, в пределах budget токенов).
+    edit_mode 'patch' — существующие файлы меняются хунками, ответ пропорционален изменению.
     """
-    if not is_api_ready or chat_model is None:
-        return "Error: API Key not set."
-
     # Собираем промпт для исполнителя
     parts = [
         "Ты — AI Developer (Cursor Agent). Мы разрабатываем проект поэтапно.",
@@ -139,54 +234,120 @@ def execute_step(current_step: str, full_task: str, rag_context: list) -> str:
         "   - Не используй ```python или ``` внутри блока ### FILE.",
         "   - Пиши полностью рабочий код."
     ]
+    if (edit_mode or AGENT_EDIT_MODE) == 'patch':
+        parts += [
+            "4. Существующие файлы НЕ переписывай целиком — меняй их патчем:",
+            "### PATCH: path/to/filename.ext",
+            "<<<<<<< SEARCH",
+            "точные строки из текущего файла (с отступами и 1-2 строками контекста, чтобы место было однозначным)",
+            "=======",
+            "новые строки",
+            ">>>>>>> REPLACE",
+            "### END_PATCH",
+            "   - В одном PATCH может быть несколько блоков SEARCH/REPLACE (по порядку в файле).",
+            "   - Пустой SEARCH — дописать в конец файла.",
+            "   - ### FILE — только для новых файлов или если меняется почти весь файл.",
+        ]
+
+    base = "\n".join(parts)
+    selection = select_context(rag_context, budget - approx_tokens(base))
 
     # Добавляем контекст из RAG (чтобы агент видел существующий код)
-    if rag_context:
+    if selection.rag:
         parts.append("\n=== 🗄️ КОНТЕКСТ ПРОЕКТА (Существующий код) ===")
         parts.append("(Используй этот код, чтобы понимать структуру и не дублировать файлы)")
-        for chunk in rag_context:
+        for chunk in selection.rag:
             parts.append(f"{chunk}\n---")
 
     prompt = "\n".join(parts)
+    log_prompt_size("step", raw_tokens(base, rag_context=rag_context), prompt, selection)
+    return prompt
+
+
+class StepError(RuntimeError):
+    """Шаг плана не выполнен (нет API или модель упала) — зависящие шаги надо пропустить."""
+
+
+def execute_step(current_step: str, full_task: str, rag_context: list) -> str:
+    """
+    Пишет код для конкретного шага, учитывая найденный контекст (RAG).
+    Ошибка — StepError (планировщик пропустит шаги, которые от этого зависят).
+    """
+    if not is_api_ready:
+        raise StepError("API Key not set.")
+
+    try:
+        return _generate(_step_prompt(current_step, full_task, rag_context))
+    except Exception as e:
+        traceback.print_exc()
+        raise StepError(f"Error executing step: {e}") from e
+
+
+def stream_execute_step(current_step: str, full_task: str, rag_context: list):
+    """
+    Потоковый вариант execute_step: отдаёт куски ответа по мере генерации.
+    При ошибке текст ошибки уходит в поток (его видно в логе), затем — StepError.
+    """
+    if not is_api_ready:
+        yield "Error: API Key not set."
+        raise StepError("API Key not set.")
 
     try:
-        response = chat_model.generate_content(prompt)
-        return response.text
+        yield from _generate_stream(_step_prompt(current_step, full_task, rag_context))
     except Exception as e:
         traceback.print_exc()
-        return f"Error executing step: {e}"
+        yield f"Error executing step: {e}"
+        raise StepError(f"Error executing step: {e}") from e
 
 
 # ======================================================
 # 2. ФУНКЦИИ ОБЫЧНОГО ЧАТА (HELPER METHODS)
 # ======================================================
 
-def get_chat_response(full_prompt: str) -> str:
+def get_chat_response(full_prompt: str, cache_as: str = None) -> str:
     """Базовая функция отправки сообщения (для простых вопросов)."""
-    if not is_api_ready or chat_model is None:
+    if not is_api_ready:
         return "⚠️ Ошибка: API Key не установлен."
 
     try:
-        response = chat_model.generate_content(full_prompt)
-        return response.text
+        return _generate_text(full_prompt, cache_as=cache_as)
     except Exception as e:
         traceback.print_exc()
         return f"API Error: {e}"
 
 
-def build_context_prompt(user_message: str, context_files: dict, active_file_data: tuple, rag_context: list) -> str:
+def stream_chat_response(full_prompt: str):
+    """Потоковый вариант get_chat_response: куски текста по мере генерации."""
+    if not is_api_ready:
+        yield "⚠️ Ошибка: API Key не установлен."
+        return
+
+    try:
+        yield from _generate_stream(full_prompt)
+    except Exception as e:
+        traceback.print_exc()
+        yield f"\n\nAPI Error: {e}"
+
+
+def build_context_prompt(user_message: str, context_files: dict, active_file_data: tuple, rag_context: list,
+                         budget: int = CHAT_PROMPT_BUDGET) -> str:
     """
     Собирает промпт для обычного режима чата (не агентного).
-    Принимает кортеж (имя_файла, код).
+    Принимает кортеж (имя_файла, код) или (имя_файла, код, (первая, последняя строка курсора/выделения)).
+    Активный файл урезается до окна вокруг курсора, RAG — без дублей и того, что уже есть
+    в окне; всё вместе укладывается в budget токенов.
     """
     active_filename = "None"
     active_code = ""
+    focus = None
 
     # Безопасная распаковка
     try:
         if active_file_data and isinstance(active_file_data, tuple):
             active_filename = active_file_data[0]
             active_code = active_file_data[1]
+            if len(active_file_data) > 2:
+                focus = active_file_data[2]
     except:
         pass
 
@@ -195,18 +356,26 @@ def build_context_prompt(user_message: str, context_files: dict, active_file_dat
         "Отвечай на вопросы пользователя, используя контекст.",
         f"Пользователь сейчас смотрит файл: {active_filename}"
     ]
+    question = f"\n=== ВОПРОС ===\n{user_message}"
+    fixed = approx_tokens("\n".join(parts)) + approx_tokens(question)
+    selection = select_context(rag_context, budget - fixed, active_code, focus)
 
-    if rag_context:
+    if selection.rag:
         parts.append("\n=== RAG Context ===")
-        for chunk in rag_context:
+        for chunk in selection.rag:
             parts.append(f"{chunk}\n---")
 
-    if active_code:
-        parts.append(f"\n=== Active File Content ({active_filename}) ===\n{active_code}")
+    if selection.active_code:
+        first, last = selection.active_lines
+        total = active_code.count("\n") + 1
+        where = "" if last - first + 1 >= total else f", lines {first + 1}-{last + 1} of {total}"
+        parts.append(f"\n=== Active File Content ({active_filename}{where}) ===\n{selection.active_code}")
 
-    parts.append(f"\n=== ВОПРОС ===\n{user_message}")
+    parts.append(question)
 
-    return "\n".join(parts)
+    prompt = "\n".join(parts)
+    log_prompt_size("chat", fixed + raw_tokens(active_code, rag_context=rag_context), prompt, selection)
+    return prompt
 
 
 def get_code_review(code: str) -> str:
@@ -217,16 +386,11 @@ def get_code_review(code: str) -> str:
         "Будь краток.\n\n"
         f"{code}"
     )
-    return get_chat_response(prompt)
-
+    return get_chat_response(prompt, cache_as="get_code_review")
 
-def edit_code_fragment(selection: str, instruction: str) -> str:
-    """
-    Редактирует выделенный кусок кода по инструкции.
-    """
-    if not is_api_ready: return ""
 
-    prompt = f"""
+def _edit_prompt(selection: str, instruction: str) -> str:
+    return f"""
     Ты — умный редактор кода.
 
     ЗАДАЧА: Измени следующий фрагмент кода согласно инструкции.
@@ -245,24 +409,65 @@ def edit_code_fragment(selection: str, instruction: str) -> str:
     4. Сохрани отступы как в исходнике.
     """
 
+
+def edit_code_fragment(selection: str, instruction: str) -> str:
+    """
+    Редактирует выделенный кусок кода по инструкции.
+    """
+    if not is_api_ready: return ""
+
     try:
-        response = chat_model.generate_content(prompt)
-        code = response.text
+        text = _generate_text(_edit_prompt(selection, instruction), cache_as="edit_code_fragment")
         # Чистим на случай, если модель всё же добавила маркдаун
-        code = code.replace("```python", "").replace("```", "").strip()
-        return code
+        return strip_code_fences(text, "python")
     except Exception as e:
         return f"# Error: {e}"
 
 
-# --- ФУНКЦИЯ 3: ФИНАЛЬНЫЙ ОТЧЕТ (REPORT) ---
-def generate_final_report(user_request: str, executed_steps: list, modified_files: list) -> str:
+def rewrite_file(path: str, current_code: str, current_step: str, full_task: str, reason: str) -> str:
     """
-    Генерирует итоговый отчет о проделанной работе.
+    Запасной путь для патча, который не удалось применить: файл целиком в новой версии.
+    Возвращает только код ("" или "# Error: ..." при ошибке).
     """
-    if not is_api_ready: return "<b>Mission Complete</b> (API unavailable for report)."
+    if not is_api_ready: return ""
 
     prompt = f"""
+    Ты — AI Developer. Патч к файлу не применился ({reason}).
+    ГЛАВНАЯ ЦЕЛЬ ПРОЕКТА: {full_task}
+    ТЕКУЩАЯ ЗАДАЧА (ЭТАП): {current_step}
+
+    ТЕКУЩИЙ ФАЙЛ {path}:
+    {current_code}
+
+    Верни ПОЛНЫЙ новый текст файла {path} с изменениями для этого этапа.
+    Только код, без markdown и пояснений.
+    """
+
+    try:
+        code = _generate(prompt).strip()
+        if code.startswith("```"):
+            code = code.partition("\n")[2]  # строка ```lang целиком — язык может быть любым
+        return strip_code_fences(code)
+    except Exception as e:
+        return f"# Error: {e}"
+
+
+def stream_edit_code_fragment(selection: str, instruction: str):
+    """
+    Потоковый вариант edit_code_fragment: сырые куски ответа (для предпросмотра).
+    Итоговый код — strip_code_fences("".join(куски), "python").
+    """
+    if not is_api_ready: return
+
+    try:
+        yield from _generate_stream(_edit_prompt(selection, instruction), cache_as="edit_code_fragment")
+    except Exception as e:
+        yield f"# Error: {e}"
+
+
+# --- ФУНКЦИЯ 3: ФИНАЛЬНЫЙ ОТЧЕТ (REPORT) ---
+def _report_prompt(user_request: str, executed_steps: list, modified_files: list) -> str:
+    return f"""
     Ты — Project Manager. Разработка завершена.
 
     ЗАДАЧА БЫЛА: {user_request}
@@ -298,10 +503,31 @@ def generate_final_report(user_request: str, executed_steps: list, modified_file
     Пиши на том же языке, на котором был запрос пользователя (Русский).
     """
 
+
+def generate_final_report(user_request: str, executed_steps: list, modified_files: list) -> str:
+    """
+    Генерирует итоговый отчет о проделанной работе.
+    """
+    if not is_api_ready: return "<b>Mission Complete</b> (API unavailable for report)."
+
     try:
-        response = chat_model.generate_content(prompt)
-        text = response.text.replace("```html", "").replace("```", "").strip()
-        return text
+        report = _generate(_report_prompt(user_request, executed_steps, modified_files))
+        return strip_code_fences(report, "html")
     except Exception as e:
         return f"<b style='color:green'>Done!</b> (Report error: {e})"
 
+
+def stream_final_report(user_request: str, executed_steps: list, modified_files: list):
+    """
+    Потоковый вариант generate_final_report: сырые куски HTML по мере генерации.
+    Итоговый текст — strip_code_fences("".join(куски), "html").
+    """
+    if not is_api_ready:
+        yield "<b>Mission Complete</b> (API unavailable for report)."
+        return
+
+    try:
+        yield from _generate_stream(_report_prompt(user_request, executed_steps, modified_files))
+    except Exception as e:
+        yield f"<b style='color:green'>Done!</b> (Report error: {e})"
+
@@ -0,0 +1,152 @@
+import os
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+
+from embedding_backend import GeminiEmbeddingBackend, HashEmbeddingBackend, EMBEDDING_MODEL
+
+GEMINI_CHAT_MODEL = 'gemini-2.5-pro'
+LOCAL_CHAT_MODEL = 'local/echo'
+LOCAL_EMBEDDING_MODEL = 'local/hash-embedding'
+# По сколько символов локальный провайдер отдаёт ответ в потоке
+LOCAL_STREAM_CHUNK = 24
+# Провайдер по умолчанию: "gemini" или "local" (офлайн)
+DEFAULT_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini")
+
+
+class ProviderError(RuntimeError):
+    """Ошибка провайдера (в том числе искусственная у LocalProvider)."""
+
+
+class GeminiProvider:
+    """
+    google.generativeai за общим интерфейсом провайдера:
+    generate(prompt) -> str, stream(prompt) -> итератор кусков, embed(texts) / embed_one(text).
+    Провайдер сам является бэкендом эмбеддингов для ProjectIndexer (model + embed).
+    genai конфигурируется один раз, здесь.
+    """
+    name = 'gemini'
+
+    def __init__(self, api_key=None, chat_model=GEMINI_CHAT_MODEL, embedding_model=EMBEDDING_MODEL,
+                 generation_config=None):
+        import google.generativeai as genai  # офлайн-провайдеру пакет не нужен
+        self.chat_model_name = chat_model
+        self.model = embedding_model
+        self._embedder = GeminiEmbeddingBackend(embedding_model)
+        self._chat = None
+        if api_key:
+            genai.configure(api_key=api_key.strip())
+            self._chat = genai.GenerativeModel(chat_model, generation_config=generation_config or None)
+
+    @property
+    def ready(self):
+        return self._chat is not None
+
+    def generate(self, prompt):
+        return self._chat.generate_content(prompt).text
+
+    def stream(self, prompt):
+        """Открывает поток сразу (ошибки и 429 — здесь), куски текста отдаёт генератор."""
+        return self._texts(self._chat.generate_content(prompt, stream=True))
+
+    @staticmethod
+    def _texts(response):
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # кусок без текста (например, только finish_reason)
+            if text:
+                yield text
+
+    def embed(self, texts, task_type="retrieval_document"):
+        return self._embedder.embed(texts, task_type)
+
+    def embed_one(self, text, task_type="retrieval_query"):
+        return self.embed([text], task_type)[0]
+
+
+class LocalProvider:
+    """
+    Детерминированный офлайн-провайдер для профилирования и регрессионных прогонов
+    агента и индексации без сети.
+    - ответы: responses — {подстрока промпта: ответ} или callable(prompt) -> str;
+      без совпадения — эхо хвоста промпта;
+    - эмбеддинги: feature hashing (HashEmbeddingBackend);
+    - latency — задержка до ответа / первого куска, chunk_latency — между кусками потока,
+      embed_latency — на вызов эмбеддингов;
+    - error_rate — доля вызовов, падающих с error (по умолчанию 503 — лимитер его повторит),
+      случайность с фиксированным seed.
+    calls — счётчики вызовов по типам.
+    """
+    name = 'local'
+    ready = True
+
+    def __init__(self, responses=None, latency=0.0, chunk_latency=0.0, embed_latency=0.0, error_rate=0.0,
+                 error="503 Service Unavailable (injected)", seed=0, dim=256,
+                 chat_model=LOCAL_CHAT_MODEL, embedding_model=LOCAL_EMBEDDING_MODEL):
+        self.chat_model_name = chat_model
+        self.model = embedding_model
+        self.responses = responses or {}
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.error_rate = error_rate
+        self.error = error
+        self.calls = Counter()
+        self._embedder = HashEmbeddingBackend(model=embedding_model, dim=dim, latency=embed_latency)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.calls['errors'] += 1
+        if failed:
+            raise ProviderError(self.error)
+
+    def reply(self, prompt):
+        if callable(self.responses):
+            return self.responses(prompt)
+        for key, text in self.responses.items():
+            if key in prompt:
+                return text
+        tail = prompt.strip()[-200:]
+        return f"[{self.chat_model_name} {hashlib.md5(prompt.encode('utf-8')).hexdigest()[:8]}] {tail}"
+
+    def generate(self, prompt):
+        self._call('generate')
+        if self.latency:
+            time.sleep(self.latency)
+        return self.reply(prompt)
+
+    def stream(self, prompt):
+        self._call('stream')
+        if self.latency:
+            time.sleep(self.latency)
+        return self._pieces(self.reply(prompt))
+
+    def _pieces(self, text):
+        for i in range(0, len(text), LOCAL_STREAM_CHUNK):
+            if i and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield text[i:i + LOCAL_STREAM_CHUNK]
+
+    def embed(self, texts, task_type="retrieval_document"):
+        self._call('embed')
+        return self._embedder.embed(texts, task_type)
+
+    def embed_one(self, text, task_type="retrieval_query"):
+        return self.embed([text], task_type)[0]
+
+
+def make_provider(name=DEFAULT_PROVIDER, api_key=None, **kwargs):
+    """Провайдер по имени: "gemini" (живой API) или "local" (офлайн)."""
+    if name == 'local':
+        return LocalProvider(**kwargs)
+    if name == 'gemini':
+        return GeminiProvider(api_key, **kwargs)
+    raise ValueError(f"Unknown LLM provider: {name}")
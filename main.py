@@ -1,40 +1,34 @@
 import sys
 import os
-import re
-import time
 import shutil
+import threading
+from html import escape
 
-# Проверка библиотеки для красоты текста
-try:
-    import markdown
-except ImportError:
-    # Если нет библиотеки, используем заглушку, чтобы программа не упала
-    print("Warning: 'markdown' library not found. Install with: pip install markdown")
-
-
-    class markdown:
-        @staticmethod
-        def markdown(text, **kwargs): return text
-
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget,
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget,
                              QFileDialog, QTextBrowser, QLineEdit, QPushButton,
                              QTreeView, QTabWidget, QSplitter, QLabel,
                              QCompleter, QMessageBox, QMenu, QInputDialog, QFileIconProvider)
 from PyQt6.QtGui import QAction, QFileSystemModel, QColor, QFont, QKeySequence, QPixmap, QPainter, QIcon
-from PyQt6.QtCore import Qt, QDir, QStringListModel, QThread, pyqtSignal, QProcess
+from PyQt6.QtCore import Qt, QDir, QStringListModel, QThread, pyqtSignal, QProcess, QTimer
 
 from PyQt6.Qsci import QsciScintilla, QsciLexerPython, QsciLexerJavaScript, QsciLexerHTML, QsciLexerCPP
 
 # Импорты модулей
 import llm_client
-from llm_client import get_chat_response, build_context_prompt, API_KEY
+from llm_client import build_context_prompt, API_KEY
 from rag_engine import ProjectIndexer
+from request_executor import RequestExecutor
+from plan_scheduler import parse_plan, run_dag, FileWriteTracker
+from file_transaction import WriteTransaction, FileBlockParser, Changeset, process_umask
+from chat_log import ChatLog
+from markdown_renderer import renderer as markdown_renderer
+from file_loader import read_text, read_text_chunks, tab_key, ASYNC_LOAD_MIN_BYTES, LARGE_FILE_BYTES
 
 # ==========================================
 # 0. СТИЛИ (CSS)
 # ==========================================
+# Задаётся один раз как defaultStyleSheet документа чата (ChatLog), а не в каждом сообщении
 CHAT_CSS = """
-<style>
     body { font-family: 'Segoe UI', sans-serif; font-size: 13px; color: #d4d4d4; background-color: #1e1e1e; }
     h1, h2, h3 { color: #4ec9b0; margin-top: 12px; margin-bottom: 6px; }
     strong, b { color: #569cd6; font-weight: bold; }
@@ -46,15 +40,99 @@ CHAT_CSS = """
     li { margin-bottom: 4px; }
     a { color: #3794ff; text-decoration: none; }
     hr { border: 0; border-top: 1px solid #333; margin: 15px 0; }
-</style>
 """
 
+# Потоковый вывод: перерисовка не чаще раза в N мс, в логе агента видны последние строки кода
+STREAM_RENDER_MS = 80
+STREAM_PREVIEW_LINES = 12
+# Итоговый Markdown рисуется в отдельном пуле, чтобы не ждать за долгими LLM-потоками
+MARKDOWN_RENDER_THREADS = 1
+# Фоновая загрузка больших файлов во вкладки
+FILE_LOAD_THREADS = 1
+# Как показывать в логе агента результат записи файла
+FILE_STATUS_STYLE = {
+    'created': ("✨ Created", "#98c379"),
+    'updated': ("📝 Updated", "#e5c07b"),
+    'unchanged': ("＝ Unchanged", "#888888"),
+}
+
+
+def render_markdown(text):
+    """HTML готового ответа модели (общий парсер с кэшем); поток рисует markdown_stream."""
+    return f"<div>{markdown_renderer.render(text)}</div><hr>"
+
+
+def markdown_stream():
+    """render для StreamView: пока идёт поток, заново парсится только последний недописанный блок."""
+    incremental = markdown_renderer.stream()
+
+    def render(text, final=True):
+        return render_markdown(text) if final else f"<div>{incremental.render(text)}</div>"
+
+    return render
+
+
+def render_code_preview(text, final=True):
+    """Поток кода от агента: пока пишется — хвост ответа, по завершении — одна строка-итог."""
+    lines = text.rstrip("\n").split("\n")
+    if final:
+        return f"<small style='color:gray'>✍️ {len(lines)} lines generated</small>"
+    tail = escape("\n".join(lines[-STREAM_PREVIEW_LINES:]))
+    return (f"<pre style='color:#9cdcfe; background:#252526; font-family:Consolas; font-size:11px;'>{tail}</pre>"
+            f"<small style='color:gray'>✍️ {len(lines)} lines...</small>")
+
+
+class StreamView:
+    """
+    Ответ модели, который дописывается в ленту чата (ChatLog) по мере прихода кусков.
+    Ответ — отдельное "живое" сообщение и перерисовывается (не чаще STREAM_RENDER_MS),
+    поэтому несколько потоков и обычные сообщения в том же чате друг другу не мешают.
+    По умолчанию — Markdown (markdown_stream). С executor итоговая отрисовка идёт в пуле,
+    а GUI-поток только вставляет готовый HTML.
+    """
+
+    def __init__(self, log, render=None, executor=None):
+        self.log = log
+        self.render = render or markdown_stream()
+        self.executor = executor
+        self.text = ""
+        self.message = log.begin_message()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(STREAM_RENDER_MS)
+        self.timer.timeout.connect(self.flush)
+
+    def feed(self, piece):
+        self.text += piece
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self, final=False):
+        self.show(self.render(self.text, final), final)
+
+    def show(self, html, final=False):
+        self.log.update_message(self.message, html, final)
+        self.log.verticalScrollBar().setValue(self.log.verticalScrollBar().maximum())
+
+    def finish(self, text=None):
+        self.timer.stop()
+        if text is not None:
+            self.text = text
+        if self.executor is None:
+            self.flush(final=True)
+            return
+        self.executor.submit(self.render, self.text, True, on_result=lambda html: self.show(html, True))
+
 
 # ==========================================
 # 1. ВОРКЕР АГЕНТА
 # ==========================================
 class AgentWorker(QThread):
     log_signal = pyqtSignal(str)
+    # Потоковый ответ модели: начало (режим 'code' / 'markdown'), куски, итоговый текст
+    stream_start_signal = pyqtSignal(str)
+    stream_signal = pyqtSignal(str)
+    stream_end_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
     def __init__(self, user_request, project_path, rag_engine):
@@ -63,6 +141,20 @@ class AgentWorker(QThread):
         self.path = project_path
         self.rag_engine = rag_engine
         self.all_modified_files = []
+        self.changes = Changeset()  # все записи агента — вход для точечной переиндексации
+        self._cancel = threading.Event()
+        self._files_lock = threading.Lock()
+        # Живой поток в чате один: параллельные шаги показываются целиком, когда он освободится
+        self._stream_lock = threading.Lock()
+        self.writes = FileWriteTracker()
+
+    def cancel(self):
+        """Остановка: текущие ответы модели обрываются, следующие шаги не начинаются."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
 
     def run(self):
         # 1. ПЛАНИРОВАНИЕ
@@ -70,7 +162,7 @@ class AgentWorker(QThread):
             f"<div style='background:#2d2d2d; border-left:4px solid #a371f7; padding:10px;'><b>🧠 PLANNING PHASE:</b> <i style='color:#ccc'>Architecture design...</i></div>")
 
         plan_data = llm_client.get_strategic_plan(self.request)
-        steps = plan_data.get("steps", [])
+        steps = parse_plan(plan_data)
         proj_name = plan_data.get("project_name", "Project")
 
         if not steps:
@@ -79,61 +171,159 @@ class AgentWorker(QThread):
             self.finished_signal.emit()
             return
 
-        steps_html = "".join([f"<li>{s}</li>" for s in steps])
+        steps_html = "".join([f"<li>{self.step_label(s)}</li>" for s in steps])
         self.log_signal.emit(
             f"<div style='border:1px solid #444; background:#1e1e1e; padding:10px; margin:10px 0;'><h3 style='margin:0; color:#a371f7'>📋 {proj_name}</h3><ul style='color:#ccc; padding-left:20px;'>{steps_html}</ul></div>")
 
-        # 2. ВЫПОЛНЕНИЕ
-        total_steps = len(steps)
-        for i, step in enumerate(steps):
-            self.log_signal.emit(f"<hr><div style='color:#61afef'><b>🚀 PHASE {i + 1}/{total_steps}:</b> {step}</div>")
-
-            rag_context = []
-            if self.rag_engine.is_indexed:
-                rag_context = self.rag_engine.search(step, top_k=4)
+        # 2. ВЫПОЛНЕНИЕ: независимые шаги идут параллельно (граф depends_on)
+        # Контекст для всех шагов одним запросом
+        self.step_contexts = {s.id: [] for s in steps}
+        if self.rag_engine.is_indexed:
+            contexts = self.rag_engine.search_many([s.title for s in steps], top_k=4)
+            self.step_contexts = {s.id: ctx for s, ctx in zip(steps, contexts)}
 
-            response_text = llm_client.execute_step(step, self.request, rag_context)
-            self.process_files(response_text)
+        self.total_steps = len(steps)
+        run_dag(steps, self.run_step, should_stop=lambda: self.cancelled,
+                on_skip=lambda s: self.log_signal.emit(
+                    f"<div style='color:#e5c07b'>⏭ Skipped {self.step_label(s)} (dependency failed)</div>"))
 
-            time.sleep(1.5)  # Пауза
+        if self.cancelled:
+            self.log_signal.emit("<i style='color:#e5c07b'>⏹ Agent stopped.</i>")
+            self.finished_signal.emit()
+            return
 
-        # 3. ОТЧЕТ
+        # 3. ОТЧЕТ (Markdown/HTML рендерится по мере прихода)
         self.log_signal.emit("<br><i>📊 Generating final report...</i>")
-        report_html = llm_client.generate_final_report(self.request, steps, self.all_modified_files)
-
-        # Рендер Markdown отчета
-        try:
-            rendered_report = markdown.markdown(report_html, extensions=['fenced_code'])
-            self.log_signal.emit(CHAT_CSS + f"<div>{rendered_report}</div>")
-        except:
-            self.log_signal.emit(report_html)
+        self.stream('markdown', llm_client.stream_final_report(self.request, [s.title for s in steps],
+                                                                self.all_modified_files),
+                    lambda report: llm_client.strip_code_fences(report, "html"))
 
         self.finished_signal.emit()
 
-    def process_files(self, text):
-        pattern = re.compile(r"### FILE: (.*?)\n(.*?)### END_FILE", re.DOTALL)
-        matches = list(pattern.finditer(text))
-
-        if not matches: return
-
-        for m in matches:
-            fn = m.group(1).strip()
-            content = m.group(2).replace("```python", "").replace("```", "").strip()
-            full_p = os.path.join(self.path, fn)
+    @staticmethod
+    def step_label(step):
+        deps = f" <span style='color:#888'>(after {', '.join(step.depends_on)})</span>" if step.depends_on else ""
+        return f"<b>{step.id}.</b> {step.title}{deps}"
 
+    def run_step(self, step):
+        """Один шаг плана (в потоке планировщика): генерация кода и запись файлов."""
+        if self.cancelled:
+            return
+        self.log_signal.emit(
+            f"<hr><div style='color:#61afef'><b>🚀 PHASE {step.id}/{self.total_steps}:</b> {step.title}</div>")
+        started = self.writes.snapshot()
+        # Блоки ### FILE разбираются и пишутся во временные файлы прямо во время потока
+        # (выход из with без commit — например, при остановке — удаляет временные файлы)
+        with WriteTransaction(self.path) as tx:
+            pieces = self.staged_pieces(llm_client.stream_execute_step(step.title, self.request,
+                                                                       self.step_contexts[step.id]), tx)
+            if self._stream_lock.acquire(blocking=False):
+                try:
+                    response_text = self.stream('code', pieces)
+                finally:
+                    self._stream_lock.release()
+            else:
+                try:
+                    response_text = self.collect(pieces)
+                except llm_client.StepError as e:
+                    self.log_signal.emit(f"<span style='color:red'>{escape(str(e))}</span>")
+                    raise
+                with self._stream_lock:
+                    self.stream_start_signal.emit('code')
+                    self.stream_end_signal.emit(response_text)
+            if self.cancelled: return  # оборванный ответ не применяем
+            self.rewrite_failed_patches(tx, step)
+            if self.cancelled: return
+            self.commit_files(tx, step, started)
+
+    def rewrite_failed_patches(self, tx, step):
+        """Патч не нашёл своё место в файле — просим у модели файл целиком."""
+        for path, reason in tx.failed_patches:
+            if self.cancelled: return
+            self.log_signal.emit(
+                f"<div style='margin-left:15px; color:#e5c07b'>🩹 Patch for {escape(path)} did not apply ({escape(reason)}), requesting full file...</div>")
             try:
-                os.makedirs(os.path.dirname(full_p), exist_ok=True)
-                status = "📝 Updated" if os.path.exists(full_p) else "✨ Created"
-                color = "#e5c07b" if os.path.exists(full_p) else "#98c379"
-
-                with open(full_p, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                self.all_modified_files.append(fn)
-
+                current = tx.current(path)
+            except (OSError, UnicodeDecodeError, ValueError):
+                current = ""
+            content = llm_client.rewrite_file(path, current, step.title, self.request, reason)
+            if not content or content.startswith("# Error"):
+                tx.changeset.errors.append((path, f"patch failed: {reason}"))
+            else:
+                tx.stage(path, content)
+        tx.failed_patches.clear()
+
+    @staticmethod
+    def staged_pieces(pieces, tx):
+        """Пропускает куски дальше, попутно отдавая законченные блоки (файлы и патчи) в транзакцию."""
+        parser = FileBlockParser()
+        try:
+            for piece in pieces:
+                yield piece
+                for block in parser.feed(piece):
+                    tx.stage_block(block)
+        finally:
+            pieces.close()
+
+    def stream(self, mode, pieces, finalize=None):
+        """
+        Пробрасывает куски ответа в лог по мере генерации, возвращает полный текст.
+        finalize — чистка итогового текста перед финальной отрисовкой.
+        """
+        self.stream_start_signal.emit(mode)
+        parts = []
+        try:
+            for piece in pieces:
+                if self.cancelled:
+                    pieces.close()
+                    break
+                parts.append(piece)
+                self.stream_signal.emit(piece)
+        finally:
+            # И при ошибке генерации (StepError) поток в логе закрывается — уже пришедшее остаётся
+            text = "".join(parts)
+            self.stream_end_signal.emit(finalize(text) if finalize else text)
+        return text
+
+    def collect(self, pieces):
+        """Ответ целиком, без вывода (пока чат занят потоком другого шага)."""
+        parts = []
+        for piece in pieces:
+            if self.cancelled:
+                pieces.close()
+                break
+            parts.append(piece)
+        return "".join(parts)
+
+    def commit_files(self, tx, step, started):
+        """
+        Применяет файлы шага одним пакетом (os.replace). Параллельные шаги пишут один файл
+        строго по очереди; неизменённые файлы не трогаются и не переиндексируются.
+        """
+        paths = sorted(tx.paths())
+        locks = [self.writes.lock(p) for p in paths]  # всегда в одном порядке — без взаимоблокировок
+        for lock in locks:
+            lock.acquire()
+        try:
+            changes = tx.commit()
+            conflicts = {c.path: self.writes.record(c.path, step.id, started)
+                         for c in changes.changes if c.status != 'unchanged'}
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        with self._files_lock:
+            self.changes.extend(changes)
+            self.all_modified_files = self.changes.changed
+
+        for change in changes.changes:
+            status, color = FILE_STATUS_STYLE[change.status]
+            self.log_signal.emit(
+                f"<div style='margin-left:15px; border-left:3px solid {color}; padding-left:8px; background:#252526;'><b style='color:{color}'>{status}:</b> <span style='font-family:Consolas;'>{change.path}</span></div>")
+            if conflicts.get(change.path):
                 self.log_signal.emit(
-                    f"<div style='margin-left:15px; border-left:3px solid {color}; padding-left:8px; background:#252526;'><b style='color:{color}'>{status}:</b> <span style='font-family:Consolas;'>{fn}</span></div>")
-            except Exception as e:
-                self.log_signal.emit(f"<span style='color:red'>Error writing {fn}: {e}</span>")
+                    f"<div style='margin-left:15px; color:#e06c75'>⚠ Conflict: {change.path} was also written by parallel step {conflicts[change.path]}; step {step.id} overwrote it</div>")
+        for fn, error in changes.errors:
+            self.log_signal.emit(f"<span style='color:red'>Error writing {fn}: {error}</span>")
 
 
 # ==========================================
@@ -179,6 +369,24 @@ class IndexerWorker(QThread):
         self.finished_signal.emit("Done")
 
 
+class IndexUpdateWorker(QThread):
+    """Точечное обновление индекса: только изменённые/удалённые файлы."""
+    finished_signal = pyqtSignal(str)
+
+    def __init__(self, indexer, paths, removed=False):
+        super().__init__()
+        self.indexer = indexer
+        self.paths = list(paths)
+        self.removed = removed
+
+    def run(self):
+        if self.removed:
+            result = self.indexer.remove_files(self.paths)
+        else:
+            result = self.indexer.update_files(self.paths)
+        self.finished_signal.emit(result)
+
+
 class CodeEditor(QsciScintilla):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -189,6 +397,32 @@ class CodeEditor(QsciScintilla):
         self.setColor(QColor("#d4d4d4"));
         self.setPaper(QColor("#1e1e1e"))
         self.setCaretForegroundColor(QColor("white"))
+        self.path_key = None  # ключ вкладки (file_loader.tab_key)
+        self.loader = None    # фоновая загрузка файла (Request), пока идёт
+
+    # --- ФОНОВАЯ ЗАГРУЗКА ---
+    # Пока файл дописывается кусками, редактор только для чтения и без истории undo
+    # (иначе Ctrl+Z "отматывал" бы загрузку)
+    def begin_load(self, request=None):
+        self.loader = request
+        self.setReadOnly(True)
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, 0)
+
+    def load_chunk(self, text):
+        self.setReadOnly(False)
+        self.append(text)
+        self.setReadOnly(True)
+
+    def end_load(self):
+        self.loader = None
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, 1)
+        self.SendScintilla(QsciScintilla.SCI_EMPTYUNDOBUFFER)
+        self.setModified(False)
+        self.setReadOnly(False)
+
+    @property
+    def loading(self):
+        return self.loader is not None
 
     def set_lexer_by_filename(self, filename):
         ext = os.path.splitext(filename)[1].lower()
@@ -263,10 +497,19 @@ class AIEditorWindow(QMainWindow):
         self.setWindowTitle("Cursor Clone (Ultimate)")
         self.resize(1400, 900)
         self.current_project_path = None
-        self.rag_engine = ProjectIndexer(llm_client.API_KEY)
+        self.rag_engine = ProjectIndexer(llm_client.API_KEY, backend=llm_client.provider)
 
         # !!! ЗАЩИТА ОТ СБОРЩИКА МУСОРА (FIX CRASH) !!!
         self.active_threads = []
+        # Все LLM/RAG-запросы чата идут через пул, GUI-поток только рисует
+        self.executor = RequestExecutor(parent=self)
+        self.render_executor = RequestExecutor(MARKDOWN_RENDER_THREADS, parent=self)
+        self.io_executor = RequestExecutor(FILE_LOAD_THREADS, parent=self)
+        self.open_tabs = {}  # tab_key(путь) -> CodeEditor
+        self.chat_requests = []  # запросы текущего хода чата (их отменяет Stop)
+        self.chat_view = None    # ответ чата, который сейчас дописывается (StreamView)
+        # Поток агента в логе (StreamView)
+        self.stream_view = None
 
         self.v_split = QSplitter(Qt.Orientation.Vertical);
         self.setCentralWidget(self.v_split)
@@ -290,20 +533,27 @@ class AIEditorWindow(QMainWindow):
         self.tabs = QTabWidget();
         self.tabs.setTabsClosable(True);
         self.tabs.setDocumentMode(True)
-        self.tabs.tabCloseRequested.connect(lambda i: self.tabs.removeTab(i))
+        self.tabs.tabCloseRequested.connect(self.close_tab)
         self.top_split.addWidget(self.tabs)
 
         # Chat
         chat_w = QWidget();
         cl = QVBoxLayout(chat_w);
         cl.setContentsMargins(5, 5, 5, 5)
-        self.chat_out = QTextBrowser();
-        self.chat_out.setOpenLinks(False)
+        self.chat_out = ChatLog(CHAT_CSS)
         cl.addWidget(self.chat_out)
         self.chat_in = QLineEdit();
         self.chat_in.setPlaceholderText("Ask or Assign Task...")
         self.chat_in.returnPressed.connect(self.start_agent)
-        cl.addWidget(self.chat_in)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setToolTip("Stop generation (Esc)")
+        self.stop_btn.setShortcut("Esc")
+        self.stop_btn.clicked.connect(self.stop_requests)
+        self.stop_btn.setVisible(False)
+        input_row = QHBoxLayout()
+        input_row.addWidget(self.chat_in)
+        input_row.addWidget(self.stop_btn)
+        cl.addLayout(input_row)
         self.top_split.addWidget(chat_w)
         self.top_split.setSizes([250, 800, 400])
 
@@ -317,6 +567,16 @@ class AIEditorWindow(QMainWindow):
             "QMainWindow {background:#252526; color:#ccc;} QTextBrowser {font-family:'Segoe UI'; font-size:13px;}")
         self.tree.setRootIndex(self.fmodel.index(os.getcwd()))
 
+    def closeEvent(self, event):
+        for t in self.active_threads:
+            if isinstance(t, AgentWorker): t.cancel()
+        self.executor.shutdown()
+        self.render_executor.shutdown()
+        self.io_executor.shutdown()
+        self.rag_engine.query_cache.save()  # кэш запросов — на диск до следующей сессии
+        self.chat_out.history.close()  # временный файл со старыми сообщениями чата
+        super().closeEvent(event)
+
     # --- ИСПРАВЛЕННОЕ МЕНЮ (FIX TYPE ERROR) ---
     def _create_menu(self):
         m = self.menuBar().addMenu("&File")
@@ -351,51 +611,99 @@ class AIEditorWindow(QMainWindow):
         text = self.chat_in.text().strip()
         if not text: return
 
+        self.chat_in.clear();
+        self.append_msg("You", text, True);
+        self.set_busy(True)
+
         if not self.current_project_path:
             # Режим чата без проекта
-            self.chat_in.clear();
-            self.append_msg("You", text, True)
-            QApplication.processEvents()
-            resp = llm_client.get_chat_response(text)
-            self.append_msg("AI", resp, False)
+            self.start_chat_stream(text)
             return
 
-        self.chat_in.clear();
-        self.append_msg("You", text, True);
-        self.chat_in.setEnabled(False)
-
-        # РОУТЕР: Вопрос или Задача?
-        intent = llm_client.classify_intent(text)
+        # РОУТЕР: Вопрос или Задача? (классификация — в пуле, ответ придёт сигналом)
+        self.submit_chat(llm_client.classify_intent, text,
+                         on_result=lambda intent: self.route_request(text, intent))
 
+    def route_request(self, text, intent):
         if intent == "QUESTION":
             self.chat_out.append("<i>🔎 Searching codebase...</i>")
-            QApplication.processEvents()
-
-            rag_ctx = self.rag_engine.search(text, top_k=5) if self.rag_engine.is_indexed else []
-            active_info = self.get_active_file_info()
-            prompt = build_context_prompt(text, {}, active_info, rag_ctx)
-
-            resp = get_chat_response(prompt)
-            self.process_simple_response(resp)  # Красивый Markdown
-            self.chat_in.setEnabled(True);
-            self.chat_in.setFocus()
+            active_info = self.get_active_file_info()  # виджеты читаем только в GUI-потоке
+            self.submit_chat(self.build_question_prompt, text, active_info, on_result=self.start_chat_stream)
 
         else:
             # АГЕНТ (Задача)
             self.chat_out.append("<i>🤖 Initializing Agent...</i>")
             worker = AgentWorker(text, self.current_project_path, self.rag_engine)
             worker.log_signal.connect(self.append_html)
+            worker.stream_start_signal.connect(self.begin_stream)
+            worker.stream_signal.connect(self.feed_stream)
+            worker.stream_end_signal.connect(self.end_stream)
             worker.finished_signal.connect(lambda: self.on_agent_done(worker))
 
             # Добавляем в список активных потоков (FIX 0xC0000409)
             self.active_threads.append(worker)
             worker.start()
 
+    def build_question_prompt(self, text, active_info):
+        """Выполняется в пуле: поиск по индексу + сборка промпта (без обращения к виджетам)."""
+        rag_ctx = self.rag_engine.search(text, top_k=5) if self.rag_engine.is_indexed else []
+        return build_context_prompt(text, {}, active_info, rag_ctx)
+
+    def start_chat_stream(self, prompt):
+        """Ответ чата в фоне: куски сразу рисуются в чате, в конце — финальный Markdown."""
+        view = self.chat_view = StreamView(self.chat_out, executor=self.render_executor)
+        self.submit_chat(llm_client.stream_chat_response, prompt, stream=True, on_chunk=view.feed,
+                         on_result=lambda text: self.on_chat_stream_done(view, text))
+
+    def on_chat_stream_done(self, view, text):
+        self.process_simple_response(text, view)  # Красивый Markdown (закрывает поток)
+        self.chat_view = None
+        self.set_busy(False)
+
+    # --- ЗАПРОСЫ ЧАТА (ВНЕ GUI-ПОТОКА) ---
+    def submit_chat(self, fn, *args, **kwargs):
+        """Запрос текущего хода чата через пул; ошибка возвращает чат в рабочее состояние."""
+        kwargs.setdefault('on_error', self.on_chat_error)
+        request = self.executor.submit(fn, *args, **kwargs)
+        self.chat_requests.append(request)
+        request.signals.done.connect(lambda: self.chat_requests.remove(request) if request in self.chat_requests else None)
+        return request
+
+    def on_chat_error(self, error):
+        if self.chat_view:
+            self.chat_view.finish()
+            self.chat_view = None
+        self.append_html(f"<span style='color:red'>Error: {escape(str(error))}</span>")
+        self.set_busy(False)
+
+    def stop_requests(self):
+        """Stop/Esc: отменяет запросы чата (уже полученный текст остаётся) и агента."""
+        for request in self.chat_requests:
+            self.executor.cancel(request)
+        self.chat_requests.clear()
+        if self.chat_view:
+            self.chat_view.finish(self.chat_view.text + "\n\n*⏹ Stopped*")
+            self.chat_view = None
+        agents = [t for t in self.active_threads if isinstance(t, AgentWorker)]
+        for agent in agents:
+            agent.cancel()  # on_agent_done вернёт поле ввода, когда поток остановится
+        if not agents:
+            self.set_busy(False)
+
+    def set_busy(self, busy):
+        self.chat_in.setEnabled(not busy)
+        self.stop_btn.setVisible(busy)
+        if not busy:
+            self.chat_in.setFocus()
+
     def on_agent_done(self, worker):
-        self.chat_in.setEnabled(True);
-        self.chat_in.setFocus()
+        self.set_busy(False)
         if worker in self.active_threads: self.active_threads.remove(worker)
-        self.start_indexing(self.current_project_path)  # Обновляем память
+        # Обновляем память: только файлы, которые трогал агент
+        if self.rag_engine.is_indexed:
+            if worker.changes.changed: self.start_index_update(worker.changes.changed)
+        else:
+            self.start_indexing(self.current_project_path)
 
     def start_indexing(self, path):
         idx = IndexerWorker(self.rag_engine, path)
@@ -403,6 +711,13 @@ class AIEditorWindow(QMainWindow):
         idx.finished.connect(lambda: self.active_threads.remove(idx) if idx in self.active_threads else None)
         idx.start()
 
+    def start_index_update(self, paths, removed=False):
+        if not self.current_project_path or not self.rag_engine.is_indexed: return
+        upd = IndexUpdateWorker(self.rag_engine, paths, removed)
+        self.active_threads.append(upd)
+        upd.finished.connect(lambda: self.active_threads.remove(upd) if upd in self.active_threads else None)
+        upd.start()
+
     # --- КРАСИВЫЙ ВЫВОД ---
     def append_msg(self, role, text, is_user):
         style = "background:#0e639c; color:white; padding:8px; border-radius:8px;" if is_user else ""
@@ -416,15 +731,31 @@ class AIEditorWindow(QMainWindow):
 
         self.chat_out.verticalScrollBar().setValue(self.chat_out.verticalScrollBar().maximum())
 
-    def process_simple_response(self, text):
-        # Рендеринг Markdown
-        try:
-            html_content = markdown.markdown(text, extensions=['fenced_code', 'tables'])
-        except:
-            html_content = text
+    def process_simple_response(self, text, view=None):
+        # Если ответ шёл потоком — перерисовываем его область начисто, иначе добавляем
+        if view:
+            view.finish(text)
+            return
+        StreamView(self.chat_out, executor=self.render_executor).finish(text)
+
+    # --- ПОТОКОВЫЙ ВЫВОД АГЕНТА ---
+    def begin_stream(self, mode='markdown'):
+        if self.stream_view:
+            self.stream_view.finish()
+        if mode == 'code':
+            self.stream_view = StreamView(self.chat_out, render_code_preview)
+        else:
+            self.stream_view = StreamView(self.chat_out, executor=self.render_executor)
 
-        full_html = CHAT_CSS + f"<div>{html_content}</div><hr>"
-        self.append_html(full_html)
+    def feed_stream(self, piece):
+        if not self.stream_view:
+            self.begin_stream()
+        self.stream_view.feed(piece)
+
+    def end_stream(self, text=None):
+        if self.stream_view:
+            self.stream_view.finish(text)
+            self.stream_view = None
 
     def append_html(self, html):
         self.chat_out.append(html)
@@ -436,29 +767,68 @@ class AIEditorWindow(QMainWindow):
         if not os.path.isdir(p): self.add_tab(p)
 
     def add_tab(self, path):
-        for i in range(self.tabs.count()):
-            if self.tabs.tabToolTip(i) == path: self.tabs.setCurrentIndex(i); return
-        ed = CodeEditor();
-        ed.set_lexer_by_filename(path)
+        key = tab_key(path)
+        if key in self.open_tabs:
+            self.tabs.setCurrentWidget(self.open_tabs[key]); return
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                ed.setText(f.read())
-            self.tabs.addTab(ed, os.path.basename(path))
-            self.tabs.setTabToolTip(self.tabs.count() - 1, path)
-            self.tabs.setCurrentWidget(ed)
-        except:
-            pass
+            size = os.path.getsize(path)
+            ed = CodeEditor()
+            if size > LARGE_FILE_BYTES:
+                ed.setLexer(None)  # подсветка многомегабайтного файла подвешивает редактор
+            else:
+                ed.set_lexer_by_filename(path)
+            if size < ASYNC_LOAD_MIN_BYTES:
+                ed.setText(read_text(path))
+        except (OSError, UnicodeDecodeError):
+            return
+        ed.path_key = key
+        self.open_tabs[key] = ed
+        self.tabs.addTab(ed, os.path.basename(path))
+        self.tabs.setTabToolTip(self.tabs.count() - 1, path)
+        self.tabs.setCurrentWidget(ed)
+        if size >= ASYNC_LOAD_MIN_BYTES:
+            self.load_tab(ed, path)
+
+    def load_tab(self, ed, path):
+        """Большой файл читается в фоне, куски текста дописываются в редактор — GUI не замирает."""
+        # Куски приходят через очередь событий — не раньше, чем begin_load переведёт редактор в режим загрузки
+        ed.begin_load(self.io_executor.submit(read_text_chunks, path, stream=True, on_chunk=ed.load_chunk,
+                                              on_error=lambda e: self.on_tab_load_error(ed, path, e),
+                                              on_done=ed.end_load))
+
+    def on_tab_load_error(self, ed, path, error):
+        index = self.tabs.indexOf(ed)
+        if index >= 0:
+            self.close_tab(index)
+        self.append_html(f"<span style='color:red'>Cannot open {escape(os.path.basename(path))}: "
+                         f"{escape(str(error))}</span>")
+
+    def close_tab(self, index):
+        ed = self.tabs.widget(index)
+        self.tabs.removeTab(index)
+        self.open_tabs.pop(getattr(ed, 'path_key', None), None)
+        if getattr(ed, 'loading', False):
+            self.io_executor.cancel(ed.loader)
 
     def save_file(self):
         ed = self.tabs.currentWidget()
+        if ed and ed.loading:
+            self.chat_out.append("<small style='color:gray'>File is still loading</small>")
+            return
         if ed:
-            with open(self.tabs.tabToolTip(self.tabs.currentIndex()), 'w', encoding='utf-8') as f: f.write(ed.text())
+            path = self.tabs.tabToolTip(self.tabs.currentIndex())
+            with open(path, 'w', encoding='utf-8') as f: f.write(ed.text())
             self.chat_out.append("<small style='color:gray'>Saved</small>")
+            self.start_index_update([path])
 
     def get_active_file_info(self):
+        """(имя файла, код, (первая, последняя строка выделения или строка курсора)) — для окна в промпте."""
         w = self.tabs.currentWidget()
-        if w: return (os.path.basename(self.tabs.tabToolTip(self.tabs.currentIndex())), w.text())
-        return None
+        if not w: return None
+        line_from, _, line_to, _ = w.getSelection()
+        if line_from < 0:
+            line_from = line_to = w.getCursorPosition()[0]
+        return (os.path.basename(self.tabs.tabToolTip(self.tabs.currentIndex())), w.text(), (line_from, line_to))
 
     def open_context_menu(self, pos):
         idx = self.tree.indexAt(pos);
@@ -475,6 +845,7 @@ class AIEditorWindow(QMainWindow):
                     shutil.rmtree(path)
                 else:
                     os.remove(path)
+                self.start_index_update([path], removed=True)
 
     def open_ai_edit_dialog(self):
         ed = self.tabs.currentWidget()
@@ -492,15 +863,24 @@ class AIEditorWindow(QMainWindow):
         l.addWidget(b)
         if d.exec() == QDialog.DialogCode.Accepted and i.text():
             self.chat_out.append("<i>Editing...</i>");
-            QApplication.processEvents()
-            try:
-                nc = llm_client.edit_code_fragment(ed.selectedText(), i.text())
-                if nc: ed.replaceSelectedText(nc)
-            except:
-                pass
+            selection = ed.getSelection()
+            view = StreamView(self.chat_out, render_code_preview)
+            self.executor.submit(llm_client.stream_edit_code_fragment, ed.selectedText(), i.text(), stream=True,
+                                 on_chunk=view.feed, on_result=lambda text: self.apply_ai_edit(ed, selection, view, text))
+
+    def apply_ai_edit(self, ed, selection, view, text):
+        view.finish(text)
+        nc = llm_client.strip_code_fences(text, "python")
+        try:
+            if nc:
+                ed.setSelection(*selection)  # пока шёл ответ, курсор могли сдвинуть
+                ed.replaceSelectedText(nc)
+        except RuntimeError:
+            pass  # вкладку уже закрыли
 
 
 if __name__ == '__main__':
+    process_umask()  # до рабочих потоков (см. file_transaction.process_umask)
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     w = AIEditorWindow()
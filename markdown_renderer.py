@@ -0,0 +1,136 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Проверка библиотеки для красоты текста
+try:
+    import markdown
+except ImportError:
+    # Если нет библиотеки — отдаём текст как есть, чтобы программа не упала
+    print("Warning: 'markdown' library not found. Install with: pip install markdown")
+    markdown = None
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables']
+# Сколько отрисованных текстов (по хэшу) держим в LRU-кэше
+MARKDOWN_CACHE_SIZE = 256
+
+FENCE = "```"
+# Строки, перед которыми поток нельзя резать: продолжение списка / отступ (иначе список
+# распадётся на несколько и нумерация начнётся заново)
+_CONTINUATION_RE = re.compile(r"^(\s|[*+-]\s|\d+[.)]\s)")
+
+
+def close_fence(text):
+    """Недописанный блок ``` временно закрываем, чтобы код не "растекался"."""
+    return text + "\n" + FENCE if text.count(FENCE) % 2 else text
+
+
+class MarkdownRenderer:
+    """
+    Markdown -> HTML с переиспользуемым парсером: markdown.Markdown с расширениями создаётся
+    один раз на поток (экземпляр не потокобезопасен) и сбрасывается reset() между вызовами.
+    Готовый HTML кэшируется по хэшу текста (LRU) — повторная отрисовка того же ответа бесплатна.
+    Можно вызывать из пула потоков.
+    """
+
+    def __init__(self, extensions=MARKDOWN_EXTENSIONS, cache_size=MARKDOWN_CACHE_SIZE):
+        self.extensions = list(extensions)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _parser(self):
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = markdown.Markdown(extensions=self.extensions)
+        return parser
+
+    def convert(self, text):
+        """Разбор без кэша."""
+        if markdown is None:
+            return text
+        try:
+            return self._parser().reset().convert(text)
+        except Exception:
+            self._local.parser = None  # после сбоя состояние парсера не доверяем
+            return text
+
+    def render(self, text, cache=True):
+        """HTML текста; cache=False — для промежуточных кусков потока, чтобы не вытеснять готовые."""
+        if not cache:
+            return self.convert(text)
+        key = hashlib.sha1(text.encode('utf-8')).digest()
+        with self._lock:
+            html = self.cache.get(key)
+            if html is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        html = self.convert(text)
+        with self._lock:
+            self.cache[key] = html
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return html
+
+    def stream(self):
+        return IncrementalMarkdown(self)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self.cache), 'hits': self.hits, 'misses': self.misses}
+
+
+class IncrementalMarkdown:
+    """
+    Отрисовка потока Markdown: текст режется на блоки по пустым строкам вне ```;
+    законченные блоки парсятся один раз и их HTML копится, при каждом обновлении
+    заново парсится только последний (недописанный) блок.
+    Результат совпадает с разбором всего текста (см. tests/test_markdown_renderer.py), кроме
+    конструкций, связывающих блоки: ссылка [текст][id] с определением [id]: url в другом
+    блоке останется текстом. Поэтому готовый ответ всё равно рисуется целиком (renderer.render).
+    """
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.done = 0      # длина уже отрисованного начала текста
+        self.prefix = ""   # само это начало (проверка, что текст только дописывался)
+        self.parts = []    # HTML законченных блоков
+
+    def reset(self):
+        self.done, self.prefix, self.parts = 0, "", []
+
+    def _last_boundary(self, text):
+        """Начало последнего законченного блока после done (или None)."""
+        pos, fence, blank, boundary = self.done, False, False, None
+        while True:
+            end = text.find("\n", pos)
+            if end < 0:
+                return boundary  # последняя строка ещё дописывается
+            line = text[pos:end]
+            if blank and not fence and line.strip() and not _CONTINUATION_RE.match(line):
+                boundary = pos
+            if line.lstrip().startswith(FENCE):
+                fence = not fence
+            blank = not line.strip()
+            pos = end + 1
+
+    def render(self, text):
+        if not text.startswith(self.prefix):
+            self.reset()  # текст заменили целиком (например, "Stopped")
+        boundary = self._last_boundary(text)
+        if boundary is not None and boundary > self.done:
+            self.parts.append(self.renderer.render(text[self.done:boundary], cache=False))
+            self.done, self.prefix = boundary, text[:boundary]
+        tail = text[self.done:]
+        parts = self.parts + [self.renderer.render(close_fence(tail), cache=False)] if tail.strip() else self.parts
+        return "\n".join(parts)
+
+
+# Общий экземпляр для GUI
+renderer = MarkdownRenderer()
@@ -0,0 +1,188 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Сколько шагов плана агент выполняет одновременно
+MAX_PARALLEL_STEPS = 3
+
+
+class PlanStep:
+    """Шаг плана: id, текст задачи, id шагов, от которых зависит, и файлы, которые он пишет."""
+    __slots__ = ('id', 'title', 'depends_on', 'files')
+
+    def __init__(self, id, title, depends_on=(), files=()):
+        self.id = id
+        self.title = title
+        self.depends_on = list(depends_on)
+        self.files = list(files)
+
+    def __str__(self):
+        return self.title
+
+    def __repr__(self):
+        return f"<PlanStep {self.id} deps={self.depends_on} files={self.files}>"
+
+
+def _norm_path(path):
+    path = str(path).strip().replace('\\', '/')
+    while path.startswith('./'):
+        path = path[2:]
+    return path.lstrip('/')
+
+
+def parse_plan(plan_data):
+    """
+    Шаги из ответа get_strategic_plan. Поддерживаются оба формата:
+    - объекты {"id", "title", "depends_on", "files"} — граф зависимостей;
+    - просто строки (старый формат) — цепочка, каждый шаг после предыдущего.
+    Ссылки на несуществующие шаги отбрасываются; шаги, объявившие один и тот же файл,
+    упорядочиваются по порядку в плане; при цикле весь план выполняется последовательно.
+    """
+    steps = []
+    for i, raw in enumerate(plan_data.get("steps", [])):
+        if isinstance(raw, dict):
+            title = str(raw.get("title") or raw.get("step") or raw.get("description") or "").strip()
+            deps = raw.get("depends_on") or []
+            files = raw.get("files") or []
+            step_id = str(raw.get("id", i + 1))
+        else:
+            title, files, step_id = str(raw).strip(), [], str(i + 1)
+            deps = [steps[-1].id] if steps else []
+        if not title:
+            continue
+        if not isinstance(deps, list):
+            deps = [deps]
+        if not isinstance(files, list):
+            files = [files]
+        steps.append(PlanStep(step_id, title, [str(d) for d in deps], [_norm_path(f) for f in files if f]))
+
+    # Дубликаты id (модель иногда нумерует заново) — переименовываем по позиции
+    seen = set()
+    for i, step in enumerate(steps):
+        if step.id in seen:
+            step.id = f"{step.id}#{i + 1}"
+        seen.add(step.id)
+
+    ids = {s.id for s in steps}
+    for step in steps:
+        step.depends_on = [d for d in dict.fromkeys(step.depends_on) if d in ids and d != step.id]
+
+    # Запись в один файл — строго по порядку плана (если зависимость не задана явно)
+    last_writer = {}
+    for step in steps:
+        for path in step.files:
+            prev = last_writer.get(path)
+            if prev is not None and prev not in step.depends_on:
+                step.depends_on.append(prev)
+            last_writer[path] = step.id
+
+    if topological_order(steps) is None:
+        print("[WARN] Plan has a dependency cycle, running steps sequentially")
+        for i, step in enumerate(steps):
+            step.depends_on = [steps[i - 1].id] if i else []
+    return steps
+
+
+def topological_order(steps):
+    """Порядок Кана (стабильный по порядку плана) или None, если в графе есть цикл."""
+    pending = {s.id: set(s.depends_on) for s in steps}
+    order = []
+    while pending:
+        ready = [s for s in steps if s.id in pending and not pending[s.id]]
+        if not ready:
+            return None
+        for step in ready:
+            del pending[step.id]
+            order.append(step)
+        for deps in pending.values():
+            deps.difference_update(s.id for s in ready)
+    return order
+
+
+class FileWriteTracker:
+    """
+    Сериализует запись в один файл из параллельных шагов и ловит конфликты:
+    если файл записал шаг, закончившийся после старта текущего (т.е. не его предок
+    по графу), текущий шаг генерировал код по устаревшей версии файла.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file_locks = {}
+        self._writes = {}  # path -> (step_id, seq)
+        self._seq = 0
+
+    def snapshot(self):
+        """Метка начала шага: все записи до неё шаг уже "видел"."""
+        with self._lock:
+            return self._seq
+
+    def lock(self, path):
+        with self._lock:
+            return self._file_locks.setdefault(_norm_path(path), threading.Lock())
+
+    def record(self, path, step_id, started):
+        """Регистрирует запись; возвращает id конфликтующего шага или None."""
+        path = _norm_path(path)
+        with self._lock:
+            prev = self._writes.get(path)
+            self._seq += 1
+            self._writes[path] = (step_id, self._seq)
+        if prev and prev[0] != step_id and prev[1] > started:
+            return prev[0]
+        return None
+
+
+def run_dag(steps, run_step, max_workers=MAX_PARALLEL_STEPS, should_stop=None, on_skip=None):
+    """
+    Выполняет шаги по графу: всё, у чего зависимости выполнены, запускается параллельно
+    (не больше max_workers). Время всего плана ~ длина критического пути.
+    run_step(step) -> результат; если шаг упал, зависящие от него шаги пропускаются (on_skip).
+    Возвращает {step_id: результат или исключение}.
+    """
+    by_id = {s.id: s for s in steps}
+    waiting = {s.id: set(s.depends_on) for s in steps}
+    dependents = {s.id: [] for s in steps}
+    for step in steps:
+        for dep in step.depends_on:
+            dependents[dep].append(step.id)
+
+    results = {}
+    running = {}
+
+    def skip(step_id):
+        # Каскадно: шаг без выполненной зависимости и все его потомки
+        stack = [step_id]
+        while stack:
+            sid = stack.pop()
+            if sid in waiting:
+                del waiting[sid]
+                results[sid] = None
+                if on_skip:
+                    on_skip(by_id[sid])
+                stack.extend(dependents[sid])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while waiting or running:
+            if should_stop and should_stop():
+                break
+            ready = [s for s in steps if s.id in waiting and not waiting[s.id]]
+            for step in ready:
+                del waiting[step.id]
+                running[pool.submit(run_step, step)] = step.id
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                error = future.exception()
+                results[step_id] = error if error is not None else future.result()
+                if error is not None:
+                    print(f"[WARN] Plan step {step_id} failed: {error}")
+                    for child in dependents[step_id]:
+                        skip(child)
+                    continue
+                for child in dependents[step_id]:
+                    if child in waiting:
+                        waiting[child].discard(step_id)
+        # Остановка: ещё не начатые шаги не запускаем, начатые дожидаемся (выход из with)
+    return results
@@ -0,0 +1,108 @@
+from collections import namedtuple
+
+from embedding_backend import approx_tokens
+
+# Бюджеты промптов (в приблизительных токенах, см. approx_tokens)
+CHAT_PROMPT_BUDGET = 12000
+STEP_PROMPT_BUDGET = 16000
+# Активный файл занимает не больше этой доли бюджета — остальное для RAG
+ACTIVE_FILE_SHARE = 0.5
+# Чанк считается дублем уже выбранного, если перекрывается с ним больше чем на эту долю строк
+OVERLAP_DROP_RATIO = 0.5
+
+ContextSelection = namedtuple('ContextSelection', 'rag active_code active_lines dropped')
+
+
+def active_window(code, focus=None, max_tokens=None):
+    """
+    Окно активного файла вокруг курсора/выделения, не больше max_tokens.
+    focus — (первая, последняя) строка (0-based) или None (тогда окно от начала файла).
+    Возвращает (текст, (first, last)) — строки 0-based включительно.
+    """
+    lines = code.splitlines()
+    if not lines:
+        return "", (0, 0)
+    if max_tokens is None or approx_tokens(code) <= max_tokens:
+        return code, (0, len(lines) - 1)
+
+    first, last = focus if focus else (0, 0)
+    first = min(max(first, 0), len(lines) - 1)
+    last = min(max(last, first), len(lines) - 1)
+    # Выделение больше бюджета — берём его начало
+    used = sum(approx_tokens(l) for l in lines[first:last + 1])
+    while used > max_tokens and last > first:
+        used -= approx_tokens(lines[last])
+        last -= 1
+
+    # Расширяем поровну вверх и вниз, пока влезает
+    grew = True
+    while grew:
+        grew = False
+        for step in (-1, 1):
+            i = first - 1 if step < 0 else last + 1
+            if 0 <= i < len(lines):
+                cost = approx_tokens(lines[i])
+                if used + cost <= max_tokens:
+                    used += cost
+                    if step < 0:
+                        first = i
+                    else:
+                        last = i
+                    grew = True
+    return "\n".join(lines[first:last + 1]), (first, last)
+
+
+def _chunk_text(chunk):
+    return getattr(chunk, 'text', chunk if isinstance(chunk, str) else str(chunk))
+
+
+def _overlaps(chunk, kept):
+    """Чанк почти целиком повторяет строки уже выбранного чанка того же файла."""
+    file = getattr(chunk, 'file', None)
+    if file is None:
+        return False
+    start, end = chunk.start_line, chunk.end_line
+    for other in kept:
+        if getattr(other, 'file', None) != file:
+            continue
+        common = min(end, other.end_line) - max(start, other.start_line) + 1
+        if common > 0 and common > OVERLAP_DROP_RATIO * (end - start + 1):
+            return True
+    return False
+
+
+def select_context(rag_context, budget, active_code="", focus=None, active_share=ACTIVE_FILE_SHARE):
+    """
+    Контекст под бюджет токенов:
+    1) окно активного файла вокруг курсора (не больше active_share бюджета);
+    2) чанки RAG в порядке релевантности, без точных дублей, без перекрытий
+       с уже выбранными и без кода, который уже есть в окне активного файла,
+       пока влезают в остаток бюджета.
+    """
+    window, lines = "", None
+    if active_code:
+        window, lines = active_window(active_code, focus, int(budget * active_share))
+    left = budget - approx_tokens(window)
+
+    kept, seen, dropped = [], set(), 0
+    for chunk in rag_context or []:
+        text = _chunk_text(chunk).strip()
+        cost = approx_tokens(str(chunk))
+        if not text or text in seen or (window and text in window) or _overlaps(chunk, kept) or cost > left:
+            dropped += 1
+            continue
+        seen.add(text)
+        kept.append(chunk)
+        left -= cost
+    return ContextSelection(kept, window, lines, dropped)
+
+
+def raw_tokens(*parts, rag_context=()):
+    """Размер промпта "как раньше" — всё подряд без ограничений (для лога)."""
+    return sum(approx_tokens(p) for p in parts if p) + sum(approx_tokens(str(c)) for c in rag_context or [])
+
+
+def log_prompt_size(name, before, prompt, selection):
+    after = approx_tokens(prompt)
+    print(f"[DEBUG] Prompt {name}: ~{before} -> ~{after} tokens "
+          f"(RAG chunks kept {len(selection.rag)}, dropped {selection.dropped})")
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE_TTL = 24 * 3600   # сек
+QUERY_CACHE_FILE = 'query_cache.npz'
+SAVE_INTERVAL = 30.0          # не чаще раза в N секунд
+
+
+def normalize_query(text):
+    """Нормализация запроса для ключа кэша: схлопываем пробелы/переносы."""
+    return ' '.join(text.split())
+
+
+class QueryEmbeddingCache:
+    """
+    LRU-кэш эмбеддингов запросов с TTL. Ключ — (модель, нормализованный текст).
+    Повторный поиск того же запроса не ходит в сеть. Может сохраняться
+    на диск (.jarvis_index/query_cache.npz) между сессиями.
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # (model, text) -> (timestamp, vector)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+
+    def get(self, text, model):
+        key = (model, normalize_query(text))
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and time.time() - item[0] > self.ttl:
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, text, model, vector):
+        key = (model, normalize_query(text))
+        with self._lock:
+            self._items[key] = (time.time(), np.asarray(vector, dtype=np.float32))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            self._dirty = True
+        if self.path and time.monotonic() - self._last_save > SAVE_INTERVAL:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+    # --- ПЕРСИСТЕНТНОСТЬ ---
+    def attach(self, index_dir):
+        """Привязывает кэш к папке индекса проекта и подгружает сохранённые запросы."""
+        if self.path:
+            self.save()
+        self.path = os.path.join(index_dir, QUERY_CACHE_FILE)
+        with self._lock:
+            self._items.clear()
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                entries = json.loads(str(data['entries']))
+                vectors = data['vectors']
+            now = time.time()
+            with self._lock:
+                for (model, text, ts), vec in zip(entries, vectors):
+                    if now - ts <= self.ttl:
+                        self._items[(model, text)] = (ts, vec)
+            print(f"[DEBUG] Кэш запросов: загружено {len(self._items)}")
+        except Exception as e:
+            print(f"[WARN] Не удалось загрузить кэш запросов: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            items = list(self._items.items())
+            self._dirty = False
+        self._last_save = time.monotonic()
+        if not items:
+            return
+        try:
+            # np.stack требует одну размерность: оставляем вектора той же размерности, что и последний
+            dim = len(items[-1][1][1])
+            items = [it for it in items if len(it[1][1]) == dim]
+            entries = [[model, text, ts] for (model, text), (ts, _) in items]
+            vectors = np.stack([vec for _, (_, vec) in items])
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp.npz'
+            np.savez(tmp, entries=np.array(json.dumps(entries)), vectors=vectors)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[WARN] Не удалось сохранить кэш запросов: {e}")
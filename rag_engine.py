@@ -1,186 +1,571 @@
 import os
-import google.generativeai as genai
 import numpy as np
-import traceback
+import threading
 import time
-
-# Используем модель text-embedding-004 (она стабильнее для кода)
-EMBEDDING_MODEL = 'models/text-embedding-004'
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+
+from index_store import IndexStore, chunk_key, normalize_rows, INDEX_DIR_NAME
+from vector_index import ExactIndex
+from query_cache import QueryEmbeddingCache
+from file_scanner import scan_files, read_text, is_indexable
+from chunker import chunk_file
+from chunk_store import ChunkStore, ChunkStoreBuilder
+from lexical_index import LexicalIndex, LexicalIndexBuilder
+from rate_limiter import limiter
+from embedding_backend import make_batches, BATCH_MAX_ITEMS, BATCH_MAX_TOKENS
+from llm_provider import GeminiProvider
+
+# Сколько запросов эмбеддингов может быть "в полёте" одновременно
+EMBED_CONCURRENCY = 4
+
+
+# Какие файлы индексируем
+EXTENSIONS = {
+    # Python & Backend
+    '.py', '.pyw',
+    # Web & React (JS/TS)
+    '.js', '.jsx', '.ts', '.tsx', '.vue', '.svelte',
+    '.html', '.css', '.scss', '.less',
+    # Android & Mobile
+    '.java', '.kt', '.kts', '.xml', '.gradle', '.properties',
+    '.dart', '.swift',
+    # C/C++/C#
+    '.c', '.cpp', '.h', '.hpp', '.cs',
+    # Config & Data
+    '.json', '.yaml', '.yml', '.toml', '.ini', '.env.example',
+    # Docs
+    '.md', '.txt', '.rst',
+    # Scripts
+    '.sh', '.bat', '.ps1',
+    # Other common langs
+    '.go', '.rs', '.php', '.rb', '.lua'
+}
+
+# Папки, которые не индексируем
+SKIP_DIRS = frozenset({'.git', '__pycache__', 'node_modules', 'venv', '.venv', '.idea', INDEX_DIR_NAME})
+
+# Сколько чанков копим перед отправкой на эмбеддинг при полной индексации
+INDEX_WINDOW = 2000
+# update_files / remove_files только помечают старые строки удалёнными (tombstone);
+# когда таких больше этой доли, индекс пересобирается без них (O(N))
+COMPACT_GARBAGE_RATIO = 0.25
+
+# Поиск: 'hybrid' (эмбеддинги + BM25), 'vector' или 'lexical' (без сети)
+SEARCH_MODE = 'hybrid'
+# Константа RRF: вклад документа на позиции r — 1 / (RRF_K + r)
+RRF_K = 60
+# Сколько кандидатов (top_k * HYBRID_DEPTH) берём из каждого списка перед слиянием
+HYBRID_DEPTH = 4
+# Дольше ждать эмбеддинг запроса не имеет смысла — отвечаем по BM25
+QUERY_EMBED_TIMEOUT = 3.0
+# После сбоя эмбеддинга запросов столько секунд ищем только лексически
+VECTOR_RETRY_INTERVAL = 60.0
+
+
+def is_skipped_dir(name):
+    """Игнорируемая папка (точное совпадение имени: .github/ или venv_tools/ индексируются)."""
+    return name in SKIP_DIRS
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Слияние ранжированных списков строк: score = sum 1 / (k + позиция). Шкалы оценок не важны."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            row = int(row)
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
 
 
 class ProjectIndexer:
-    def __init__(self, api_key):
-        self.chunks = []
+    def __init__(self, api_key, backend=None, batch_size=BATCH_MAX_ITEMS, batch_tokens=BATCH_MAX_TOKENS,
+                 concurrency=EMBED_CONCURRENCY, vector_index=None, search_mode=SEARCH_MODE):
+        self.chunks = ChunkStore()  # колоночная таблица чанков, self.chunks[i] -> ChunkRecord
+        self.lexical = LexicalIndex()  # BM25 по тем же строкам, что и self.chunks
+        self.chunk_keys = []   # ключ в IndexStore для каждого чанка
+        self.vector_rows = np.empty(0, dtype=np.intp)  # строка чанка для каждой строки embeddings
         self.embeddings = []
+        self.deleted = np.zeros(0, dtype=bool)  # удалённые (tombstone) строки чанков
+        self.deleted_vectors = np.zeros(0, dtype=bool)  # то же для строк embeddings
+        self.n_deleted = 0
         self.is_indexed = False
-
-        # Чистим ключ и инициализируем
-        if api_key:
-            genai.configure(api_key=api_key.strip())
+        self.root_path = None
+        self.store = None
+
+        # Бэкенд эмбеддингов: провайдер из llm_provider (gemini / local) или любой объект
+        # с model и embed(texts, task_type). Без него — Gemini с этим ключом (configure — там же)
+        self.backend = backend or GeminiProvider(api_key)
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        # Векторный индекс: точный скан по умолчанию, IVFIndex — для больших монорепо,
+        # Int8Index/PQIndex — сжатые коды в памяти + точный re-rank
+        self.vector_index = vector_index or ExactIndex()
+        # Эмбеддинги повторных запросов берутся из LRU-кэша, без сети
+        self.query_cache = QueryEmbeddingCache()
+        self.search_mode = search_mode
+        self._query_pool = ThreadPoolExecutor(max_workers=2)
+        self._vector_down_until = 0.0
+        self.last_stats = {}
+        self._stats_lock = threading.Lock()
+        # Защищает замену chunks/embeddings, пока search читает из другого потока
+        self._index_lock = threading.RLock()
 
     def index_project(self, root_path, progress_callback=None):
         print("\n=== НАЧАЛО ИНДЕКСАЦИИ (RETRY MODE) ===")
-        self.chunks = []
-        self.embeddings = []
-        self.is_indexed = False
-
-        extensions = {
-            # Python & Backend
-            '.py', '.pyw',
-            # Web & React (JS/TS)
-            '.js', '.jsx', '.ts', '.tsx', '.vue', '.svelte',
-            '.html', '.css', '.scss', '.less',
-            # Android & Mobile
-            '.java', '.kt', '.kts', '.xml', '.gradle', '.properties',
-            '.dart', '.swift',
-            # C/C++/C#
-            '.c', '.cpp', '.h', '.hpp', '.cs',
-            # Config & Data
-            '.json', '.yaml', '.yml', '.toml', '.ini', '.env.example',
-            # Docs
-            '.md', '.txt', '.rst',
-            # Scripts
-            '.sh', '.bat', '.ps1',
-            # Other common langs
-            '.go', '.rs', '.php', '.rb', '.lua'
-        }
+        with self._index_lock:
+            self.chunks = ChunkStore()
+            self.lexical = LexicalIndex()
+            self.chunk_keys = []
+            self.vector_rows = np.empty(0, dtype=np.intp)
+            self.embeddings = []
+            self.deleted = np.zeros(0, dtype=bool)
+            self.deleted_vectors = np.zeros(0, dtype=bool)
+            self.n_deleted = 0
+            self.is_indexed = False
+            self.root_path = root_path
 
         if progress_callback: progress_callback("Scanning files...")
-
-        files_content = []
         print(f"[DEBUG] Сканирование папки: {root_path}")
 
-        # 1. Сбор файлов
-        for root, _, files in os.walk(root_path):
-            if '.git' in root or '__pycache__' in root or 'node_modules' in root or 'venv' in root or '.idea' in root:
-                continue
+        self.store = IndexStore(root_path, self.backend.model)
+        self.query_cache.attach(self.store.dir)
+        if self.store.load():
+            self.vector_index.load(self.store.dir, self.store.vectors_file, self.store.keys)
+        self._reset_stats()
+
+        # 1-4. Потоковый конвейер: файлы читаются параллельно, режутся на чанки
+        # и уходят на эмбеддинг окнами по INDEX_WINDOW чанков. Текст файлов не копится,
+        # вектора сразу пишутся в новый файл хранилища. Чанки без эмбеддинга
+        # (сеть недоступна) остаются в индексе — их найдёт лексический поиск.
+        writer = self.store.writer()
+        chunks = ChunkStoreBuilder(self.store.dir)
+        lexical = LexicalIndexBuilder()
+        keys = []
+        vector_rows = []
+        window_chunks = []
+        n_files = 0
+        total_chunks = 0
+
+        def flush():
+            window_keys, vectors = self._vectors_for(window_chunks, progress_callback)
+            valid = [i for i, vec in enumerate(vectors) if vec is not None]
+            writer.append([window_keys[i] for i in valid], [vectors[i] for i in valid])
+            vector_rows.extend(len(chunks) + i for i in valid)
+            chunks.extend(window_chunks)
+            lexical.extend(chunk.embedding_text() for chunk in window_chunks)
+            keys.extend(window_keys)
+            window_chunks.clear()
 
-            for file in files:
-                if os.path.splitext(file)[1].lower() in extensions:
-                    full_path = os.path.join(root, file)
-                    try:
-                        with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            text = f.read()
-                            if text.strip():
-                                rel_path = os.path.relpath(full_path, root_path)
-                                files_content.append((rel_path, text))
-                    except Exception as e:
-                        print(f"[ERROR] Не удалось прочитать файл {file}: {e}")
-
-        if not files_content:
+        try:
+            for fname, text in scan_files(root_path, EXTENSIONS, is_skipped_dir):
+                n_files += 1
+                window_chunks.extend(chunk_file(fname, text))
+                total_chunks = len(chunks) + len(window_chunks)
+                if len(window_chunks) >= INDEX_WINDOW:
+                    flush()
+                    if progress_callback: progress_callback(f"Indexed {n_files} files, {total_chunks} chunks...")
+            if window_chunks:
+                flush()
+        except Exception:
+            writer.abort()
+            chunks.abort()
+            raise
+
+        if not n_files or not len(chunks):
+            writer.abort()
+            chunks.abort()
             print("[DEBUG] Файлы кода не найдены.")
             return "No code files found."
 
-        print(f"[DEBUG] Найдено {len(files_content)} файлов.")
-
-        # 2. Чанкинг (Разбиение на части)
-        if progress_callback: progress_callback(f"Chunking {len(files_content)} files...")
-
-        temp_chunks = []
-        CHUNK_SIZE = 2000
-
-        for fname, text in files_content:
-            if len(text) < CHUNK_SIZE:
-                formatted = f"File: {fname}\nCode:\n{text}"
-                temp_chunks.append(formatted)
-            else:
-                for i in range(0, len(text), CHUNK_SIZE):
-                    chunk_text = text[i:i + CHUNK_SIZE]
-                    formatted = f"File: {fname}\nCode:\n{chunk_text}"
-                    temp_chunks.append(formatted)
-
-        total_chunks = len(temp_chunks)
-        print(f"[DEBUG] Создано {total_chunks} чанков. Начинаем отправку...")
-
-        if progress_callback: progress_callback(f"Embedding {total_chunks} chunks...")
-
-        valid_embeddings = []
-        valid_chunks = []
-
-        # 3. Отправка с повторными попытками (Retry Logic)
-        for i, chunk in enumerate(temp_chunks):
-            file_name_in_chunk = chunk.split('\n')[0]
-
-            # --- ЦИКЛ ПОВТОРНЫХ ПОПЫТОК ---
-            max_retries = 3
-            success = False
-
-            for attempt in range(max_retries):
-                try:
-                    # Лог текущей попытки
-                    attempt_msg = f"(Попытка {attempt + 1})" if attempt > 0 else ""
-                    print(f"[DEBUG] {i + 1}/{total_chunks} | {file_name_in_chunk} {attempt_msg} ... ", end='')
-
-                    if progress_callback and attempt == 0:
-                        progress_callback(f"Embedding: {i + 1}/{total_chunks}...")
-                    elif progress_callback and attempt > 0:
-                        progress_callback(f"Retrying {i + 1}/{total_chunks} (Error 500/429)...")
-
-                    # Пауза: 1.5 сек обычно, 5 сек если была ошибка
-                    wait_time = 1.5 if attempt == 0 else 5.0
-                    time.sleep(wait_time)
-
-                    print("API... ", end='')
-
-                    # ЗАПРОС К GOOGLE
-                    result = genai.embed_content(
-                        model=EMBEDDING_MODEL,
-                        content=chunk,
-                        task_type="retrieval_document"
-                    )
-
-                    if 'embedding' in result:
-                        print("OK!")
-                        embedding = result['embedding']
-                        valid_embeddings.append(embedding)
-                        valid_chunks.append(chunk)
-                        success = True
-                        break  # Выходим из цикла attempt, идем к следующему чанку
-                    else:
-                        print("FAIL (Empty response)")
-                        # Если ответ пустой, пробуем еще раз (цикл продолжится)
-
-                except Exception as e:
-                    error_str = str(e)
-                    print(f"\n   [WARN] Ошибка API: {error_str}")
-                    # Если это последняя попытка, то всё, сдаемся по этому чанку
-                    if attempt == max_retries - 1:
-                        print(f"   [ERROR] Пропуск чанка {i + 1} после {max_retries} попыток.")
-                    else:
-                        print("   [INFO] Ждем 5 секунд и пробуем снова...")
-
-            if not success:
-                # Если даже после 3 попыток не вышло, идем дальше, но в лог записали
-                pass
-
         # Итог
-        print(f"[DEBUG] ИТОГ: Успешно {len(valid_embeddings)} из {total_chunks}")
-
-        if valid_embeddings:
-            self.embeddings = np.array(valid_embeddings)
-            self.chunks = valid_chunks
-            self.is_indexed = True
-            return f"Success! Indexed {len(self.chunks)} chunks."
+        print(f"[DEBUG] Файлов: {n_files}. ИТОГ: Успешно {len(vector_rows)} из {total_chunks} ({self.last_stats})")
+        print(f"[DEBUG] Лимитер: {limiter.stats().get(self.backend.model)}")
+
+        embeddings = self.store.vectors if writer.commit() else []
+        self._install(chunks.build(), lexical.build(), keys, np.asarray(vector_rows, dtype=np.intp), embeddings)
+        if len(embeddings):
+            self._save_vector_index()
+        print(f"[DEBUG] Чанки: {len(self.chunks)} шт. из {len(self.chunks.paths)} файлов, колонки "
+              f"{self.chunks.memory_bytes() / 1024:.0f} КБ, текст {self.chunks.offsets[-1] / 1024:.0f} КБ (mmap), "
+              f"BM25: {len(self.lexical.vocab)} термов, {self.lexical.memory_bytes() / 1024:.0f} КБ")
+        if not len(embeddings):
+            return f"Indexed {len(self.chunks)} chunks (lexical search only)."
+        return f"Success! Indexed {len(self.chunks)} chunks."
+
+    # --- ИНКРЕМЕНТАЛЬНОЕ ОБНОВЛЕНИЕ ---
+    def update_files(self, paths, progress_callback=None):
+        """
+        Переиндексирует только указанные файлы (абсолютные или относительно проекта):
+        их старые чанки выкидываются, новые эмбеддятся (с учётом кэша) и добавляются.
+        Удалённые файлы просто убираются из индекса. Фильтры — те же, что при полной
+        индексации (is_indexable): файл под .gitignore в индекс не попадает.
+        Старые строки только помечаются удалёнными, новые дописываются (см. _update);
+        индекс целиком (O(N)) пересобирается лишь после COMPACT_GARBAGE_RATIO удалённых.
+        """
+        if not self.is_indexed or not self.root_path:
+            return "Not indexed."
+
+        rel_paths = {self._rel(p) for p in paths if p}
+        rel_paths = {p for p in rel_paths if not p.startswith('..')}
+        if not rel_paths:
+            return "Nothing to update."
+        self._reset_stats()
+
+        new_chunks = []
+        for rel in sorted(rel_paths):
+            full_path = os.path.join(self.root_path, rel)
+            if not is_indexable(self.root_path, rel, EXTENSIONS, is_skipped_dir):
+                continue
+            if not os.path.isfile(full_path):
+                continue
+            text = read_text(full_path)
+            if not text:
+                continue
+            new_chunks.extend(chunk_file(rel, text))
+
+        keys, vectors = self._vectors_for(new_chunks, progress_callback)
+
+        with self._index_lock:
+            keep = self.chunks.rows_except(lambda f: f in rel_paths)
+            self._update(self._tombstones(keep), new_chunks, keys, vectors)
+
+        print(f"[DEBUG] Обновлено файлов: {len(rel_paths)}, новых чанков: {len(new_chunks)}, "
+              f"всего: {len(self.chunks) - self.n_deleted}")
+        return f"Updated {len(rel_paths)} files."
+
+    def remove_files(self, paths):
+        """Убирает из индекса файлы и папки (всё, что лежит внутри)."""
+        if not self.is_indexed or not self.root_path:
+            return "Not indexed."
+
+        prefixes = {self._rel(p) for p in paths if p}
+        with self._index_lock:
+            keep = self.chunks.rows_except(
+                lambda f: any(f == p or f.startswith(p + os.sep) for p in prefixes))
+            deleted = self._tombstones(keep)
+            if deleted.sum() == self.n_deleted:
+                return "Nothing to remove."
+            self._update(deleted)
+        return f"Removed {len(prefixes)} paths."
+
+    def _rel(self, path):
+        full_path = path if os.path.isabs(path) else os.path.join(self.root_path, path)
+        return os.path.normpath(os.path.relpath(full_path, self.root_path))
+
+    def _vectors_for(self, chunks, progress_callback=None):
+        """
+        Ключи и вектора для чанков: готовые берутся из self.store,
+        остальные (без дублей) отправляются в API. None — если эмбеддинг не получен.
+        """
+        texts = [chunk.embedding_text() for chunk in chunks]
+        keys = [chunk_key(text, self.backend.model) for text in texts]
+        to_embed = {}
+        for i, key in enumerate(keys):
+            if self.store.get(key) is None and key not in to_embed:
+                to_embed[key] = i
+
+        print(f"[DEBUG] Из кэша: {len(chunks) - len(to_embed)}, к отправке: {len(to_embed)}")
+        if progress_callback: progress_callback(f"Embedding {len(to_embed)} of {len(chunks)} chunks...")
+
+        # Отправка пачками, до self.concurrency запросов одновременно
+        embedded = dict(zip(to_embed, self._embed_texts([texts[i] for i in to_embed.values()], progress_callback)))
+
+        vectors = []
+        for key in keys:
+            vec = self.store.get(key)
+            vectors.append(vec if vec is not None else embedded.get(key))
+        return keys, vectors
+
+    def _tombstones(self, keep):
+        """Маска удалённых строк чанков: уже удалённые плюс все, кроме keep."""
+        deleted = np.ones(len(self.chunks), dtype=bool)
+        deleted[keep] = False
+        return deleted | self.deleted
+
+    def _update(self, deleted, new_chunks=(), new_keys=(), new_vectors=()):
+        """
+        Применяет удаление строк (маска deleted) и добавление новых чанков (под _index_lock).
+        Строки не копируются: удалённые помечаются (поиск их пропускает), новые дописываются
+        в конец хранилища векторов, ChunkStore, BM25 и векторного индекса. Вектор чанка,
+        который не изменился, берётся у его удалённой строки, а не пишется заново.
+        Если удалённых больше COMPACT_GARBAGE_RATIO — _rebuild без них.
+        """
+        n_rows = len(self.chunks)
+        total = n_rows + len(new_chunks)
+        n_deleted = int(deleted.sum())
+        if n_deleted > total * COMPACT_GARBAGE_RATIO:
+            self._rebuild(np.flatnonzero(~deleted), new_chunks, new_keys, new_vectors)
+            return
+
+        # Векторы строк, удалённых сейчас, по ключу — для тех же чанков на новом месте
+        vector_rows = self.vector_rows.copy()
+        dying = np.flatnonzero((deleted & ~self.deleted)[vector_rows])
+        reusable = {self.chunk_keys[vector_rows[v]]: v for v in dying}
+        fresh_rows, fresh_keys, fresh_vectors = [], [], []
+        for i, (key, vec) in enumerate(zip(new_keys, new_vectors)):
+            if vec is None:
+                continue
+            v = reusable.pop(key, None)
+            if v is not None:
+                vector_rows[v] = n_rows + i
+            else:
+                fresh_rows.append(n_rows + i)
+                fresh_keys.append(key)
+                fresh_vectors.append(vec)
+
+        embeddings = self.embeddings
+        if fresh_vectors:
+            # Дописывать можно, только если embeddings — это файл хранилища строка в строку
+            if embeddings is not self.store.vectors:
+                self._rebuild(np.flatnonzero(~deleted), new_chunks, new_keys, new_vectors)
+                return
+            try:
+                self.store.append(fresh_keys, fresh_vectors)
+            except Exception as e:
+                print(f"[WARN] Не удалось дописать вектора, пересобираем индекс: {e}")
+                self._rebuild(np.flatnonzero(~deleted), new_chunks, new_keys, new_vectors)
+                return
+            embeddings = self.store.vectors
+            vector_rows = np.concatenate([vector_rows, np.asarray(fresh_rows, dtype=np.intp)])
+
+        chunks = self.chunks.appended(new_chunks, self.store.dir)
+        lexical = self.lexical.appended(chunk.embedding_text() for chunk in new_chunks)
+        keys = self.chunk_keys + list(new_keys)
+        deleted = np.concatenate([deleted, np.zeros(len(new_chunks), dtype=bool)])
+        # ivf.npz / коды на диске не переписываем: они покрывают начало файла векторов,
+        # остальное при загрузке досчитается (см. load в vector_index)
+        self._install(chunks, lexical, keys, vector_rows, embeddings, deleted, extend=True)
+
+    def _rebuild(self, keep, new_chunks=(), new_keys=(), new_vectors=()):
+        """
+        Новый индекс из строк keep текущего и новых чанков (вызывать под _index_lock).
+        Строки копируются без декодирования текста; чанки с вектором None
+        попадают только в лексический индекс. Копируется всё — O(N) по размеру
+        индекса (вектора на диск, колонки, BM25, векторный индекс), поэтому
+        обновления идут через _update, а сюда — только сжатие удалённых строк.
+        """
+        chunks = ChunkStoreBuilder(self.store.dir)
+        chunks.copy_rows(self.chunks, keep)
+        chunks.extend(new_chunks)
+        lexical = LexicalIndexBuilder()
+        lexical.copy_rows(self.lexical, keep)
+        lexical.extend(chunk.embedding_text() for chunk in new_chunks)
+
+        # Строки эмбеддингов ссылаются на строки чанков — перенумеровываем
+        kept = np.zeros(len(self.chunks), dtype=bool)
+        kept[keep] = True
+        new_row = np.cumsum(kept) - 1
+        vec_keep = np.flatnonzero(kept[self.vector_rows])
+        valid = [i for i, vec in enumerate(new_vectors) if vec is not None]
+        vector_rows = np.concatenate([new_row[self.vector_rows[vec_keep]],
+                                      len(keep) + np.asarray(valid, dtype=np.intp)]).astype(np.intp)
+        matrix = np.asarray(self.embeddings, dtype=np.float32)[vec_keep]
+        if valid:
+            fresh = np.asarray([new_vectors[i] for i in valid], dtype=np.float32)
+            matrix = np.vstack([matrix, fresh]) if len(matrix) else fresh
+
+        keys = [self.chunk_keys[i] for i in keep] + list(new_keys)
+        self._commit(chunks.build(), lexical.build(), keys, vector_rows, matrix)
+
+    def _commit(self, chunks, lexical, keys, vector_rows, vectors):
+        """Сохраняет вектора на диск и атомарно подменяет индекс в памяти."""
+        saved = False
+        if len(vectors):
+            try:
+                self.store.save([keys[r] for r in vector_rows], vectors)
+                embeddings = self.store.vectors  # memmap float32
+                saved = True
+            except Exception as e:
+                print(f"[WARN] Не удалось сохранить индекс на диск: {e}")
+                embeddings = normalize_rows(vectors)
         else:
-            return "Indexing failed."
+            embeddings = []
+        self._install(chunks, lexical, keys, vector_rows, embeddings)
+        if saved:
+            self._save_vector_index()
+
+    def _install(self, chunks, lexical, keys, vector_rows, embeddings, deleted=None, extend=False):
+        """
+        Подменяет индекс. deleted — маска удалённых строк чанков (None — нет удалённых);
+        extend=True — в embeddings только дописаны строки в конец, векторный индекс
+        дополняется, а не строится заново.
+        """
+        if deleted is None:
+            deleted = np.zeros(len(chunks), dtype=bool)
+        with self._index_lock:
+            if extend:
+                self.vector_index.extend(embeddings, [keys[r] for r in vector_rows])
+            else:
+                self.vector_index.build(embeddings, [keys[r] for r in vector_rows])
+            self.chunks = chunks
+            self.lexical = lexical
+            self.chunk_keys = keys
+            self.vector_rows = vector_rows
+            self.embeddings = embeddings
+            self.deleted = deleted
+            self.deleted_vectors = deleted[vector_rows]
+            self.n_deleted = int(deleted.sum())
+            # Проект проиндексирован, даже если удаления опустошили индекс: новые файлы
+            # по-прежнему добавляются через update_files, без полной переиндексации
+            self.is_indexed = self.root_path is not None
+
+    def _save_vector_index(self):
+        try:
+            self.vector_index.save(self.store.dir, self.store.vectors_file)
+        except Exception as e:
+            print(f"[WARN] Не удалось сохранить {self.vector_index.kind}-индекс: {e}")
+
+    def _reset_stats(self):
+        self.last_stats = {'chunks': 0, 'batches': 0, 'failed_chunks': 0, 'split_batches': 0}
+
+    def _embed_texts(self, texts, progress_callback=None):
+        """
+        Эмбеддинг списка текстов пачками. Сеть — основное время, поэтому пачки
+        отправляются параллельно (не больше self.concurrency в полёте — backpressure).
+        Возвращает вектора в исходном порядке; None — для чанков, которые не удалось получить.
+        """
+        batches = make_batches(texts, self.batch_size, self.batch_tokens)
+        results = [None] * len(texts)
+        self.last_stats['chunks'] += len(texts)
+        self.last_stats['batches'] += len(batches)
+        if not batches:
+            return results
+        print(f"[DEBUG] {len(texts)} чанков -> {len(batches)} запросов, параллельно: {self.concurrency}")
+
+        def run(batch):
+            return batch, self._embed_batch([texts[j] for j in batch])
+
+        def collect(batch, vectors):
+            for j, vec in zip(batch, vectors):
+                results[j] = vec
+                if vec is None:
+                    self.last_stats['failed_chunks'] += 1
+
+        done = 0
+        if self.concurrency <= 1:
+            for batch in batches:
+                collect(*run(batch))
+                done += 1
+                if progress_callback: progress_callback(f"Embedding: batch {done}/{len(batches)}...")
+            return results
 
-    def search(self, query, top_k=4):
-        if not self.is_indexed or len(self.embeddings) == 0:
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            queue = iter(batches)
+            for batch in queue:
+                pending.add(pool.submit(run, batch))
+                if len(pending) >= self.concurrency:
+                    break
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    collect(*fut.result())
+                    done += 1
+                    if progress_callback: progress_callback(f"Embedding: batch {done}/{len(batches)}...")
+                    nxt = next(queue, None)
+                    if nxt is not None:
+                        pending.add(pool.submit(run, nxt))
+        return results
+
+    def _embed_batch(self, batch_texts):
+        """
+        Отправляет одну пачку через общий лимитер (квоты, 429 и повторы — там).
+        Если пачка так и не прошла, пробуем её чанки по одному, чтобы один
+        "плохой" чанк не утянул за собой всю пачку. Возвращает список (вектор или None).
+        """
+        try:
+            vectors = limiter.call(self.backend.model, self.backend.embed, batch_texts,
+                                   task_type="retrieval_document")
+            print(f"[DEBUG] Пачка ({len(batch_texts)} шт.) OK!")
+            return vectors
+        except Exception as e:
+            print(f"   [WARN] Пачка ({len(batch_texts)} шт.) не прошла: {e}")
+            if len(batch_texts) == 1:
+                return [None]
+
+        with self._stats_lock:
+            self.last_stats['split_batches'] += 1
+        vectors = []
+        for text in batch_texts:
+            try:
+                vectors.append(limiter.call(self.backend.model, self.backend.embed, [text],
+                                            task_type="retrieval_document", max_retries=2)[0])
+            except Exception as e:
+                print(f"   [ERROR] Пропуск чанка ({text.partition(chr(10))[0]}): {e}")
+                vectors.append(None)
+        return vectors
+
+    def search(self, query, top_k=4, mode=None):
+        results = self.search_many([query], top_k, mode)
+        return results[0] if results else []
+
+    def _embed_queries(self, queries):
+        """Эмбеддинги запросов: из кэша, в сеть — только промахи (одним запросом)."""
+        model = self.backend.model
+        vectors = [self.query_cache.get(q, model) for q in queries]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = limiter.call(model, self.backend.embed, [queries[i] for i in missing],
+                                 task_type="retrieval_query", max_retries=2)
+            for i, vec in zip(missing, fresh):
+                self.query_cache.put(queries[i], model, vec)
+                vectors[i] = vec
+        return vectors
+
+    def _try_embed_queries(self, queries):
+        """
+        Эмбеддинги запросов или None, если API недоступно или не ответило за
+        QUERY_EMBED_TIMEOUT. После сбоя VECTOR_RETRY_INTERVAL секунд в сеть не ходим —
+        поиск сразу лексический. Опоздавший ответ всё равно попадёт в query_cache.
+        """
+        if time.monotonic() < self._vector_down_until:
+            return None
+        future = self._query_pool.submit(self._embed_queries, queries)
+        try:
+            return future.result(timeout=QUERY_EMBED_TIMEOUT)
+        except Exception as e:
+            reason = "timeout" if isinstance(e, FutureTimeoutError) else e
+            print(f"[WARN] Эмбеддинг запроса недоступен ({reason}), только лексический поиск")
+            self._vector_down_until = time.monotonic() + VECTOR_RETRY_INTERVAL
+            return None
+
+    def search_many(self, queries, top_k=4, mode=None):
+        """
+        Поиск сразу по нескольким запросам. mode (по умолчанию self.search_mode):
+          'vector'  — только эмбеддинги (один batch-запрос + один проход по индексу),
+          'lexical' — только BM25, без сети,
+          'hybrid'  — оба списка, объединённые через reciprocal rank fusion.
+        Если эмбеддинги недоступны, 'vector' и 'hybrid' откатываются на BM25.
+        Возвращает список результатов (ChunkRecord) на каждый запрос.
+        """
+        queries = list(queries)
+        if not queries:
             return []
+        if not self.is_indexed or len(self.chunks) == self.n_deleted:
+            return [[] for _ in queries]
+        mode = mode or self.search_mode
         try:
-            query_emb = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=query,
-                task_type="retrieval_query"
-            )['embedding']
-
-            scores = np.dot(self.embeddings, np.array(query_emb))
-            top_indices = np.argsort(scores)[-top_k:][::-1]
-
-            results = []
-            for idx in top_indices:
-                results.append(self.chunks[idx])
-            return results
+            query_embs = None
+            if mode != 'lexical' and len(self.embeddings):
+                query_embs = self._try_embed_queries(queries)
+
+            with self._index_lock:
+                # Удалённые (tombstone) строки пропускаются обоими поисками
+                deleted = self.deleted if self.n_deleted else None
+                deleted_vectors = self.deleted_vectors if self.n_deleted else None
+                if query_embs is None:
+                    return [[self.chunks[idx] for idx in self.lexical.search(q, top_k, deleted)] for q in queries]
+
+                # Точный скан или ANN — зависит от self.vector_index
+                depth = top_k if mode == 'vector' else top_k * HYBRID_DEPTH
+                vector_hits = [self.vector_rows[row] for row in
+                               self.vector_index.search(normalize_rows(query_embs), depth, deleted_vectors)]
+                if mode == 'vector':
+                    return [[self.chunks[idx] for idx in rows] for rows in vector_hits]
+                return [[self.chunks[idx] for idx in
+                         reciprocal_rank_fusion([rows, self.lexical.search(q, depth, deleted)], top_k)]
+                        for q, rows in zip(queries, vector_hits)]
         except Exception as e:
             print(f"Search error: {e}")
-            return []
\ No newline at end of file
+            return [[] for _ in queries]
@@ -0,0 +1,215 @@
+import re
+import time
+import random
+import threading
+from collections import deque
+
+# Квоты (запросов в минуту) для моделей. None — без ограничения.
+# Модели с префиксом 'local/' — локальные, их не ограничиваем.
+MODEL_LIMITS = {
+    'models/text-embedding-004': 1500,
+    'gemini-2.5-pro': 150,
+}
+DEFAULT_RPM = 60
+
+# Параметры backoff
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+MAX_RETRIES = 5
+
+# Окно (секунд) для requests_per_min в stats()
+STATS_WINDOW = 60
+
+# HTTP-коды и классы исключений (google.api_core и др.), которые имеет смысл повторить
+RETRYABLE_CODES = frozenset((429, 500, 502, 503, 504))
+RETRYABLE_ERRORS = frozenset(('ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+                              'DeadlineExceeded', 'InternalServerError', 'GatewayTimeout'))
+# Если ни код, ни класс не известны — признаки в тексте ошибки; коды только целым словом,
+# чтобы "input exceeds 5000 tokens" не считался ошибкой 500
+RETRYABLE_TEXT_RE = re.compile(
+    r"\b(?:429|50[0234])\b|ResourceExhausted|Unavailable|DeadlineExceeded|InternalServerError"
+    r"|quota|rate limit", re.IGNORECASE)
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: acquire() сразу "занимает" токен и возвращает,
+    сколько нужно подождать. Так параллельные потоки не толкаются под локом.
+    Скорость адаптивная: после 429 падает вдвое, после успехов медленно растёт до квоты.
+    """
+
+    def __init__(self, rpm, burst=None):
+        self.max_rate = rpm / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst or max(1, int(rpm // 12))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def on_throttled(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = deque()
+        self.total_calls = 0
+        self.throttled = 0
+        self.failed = 0
+        self.wait_time = 0.0
+
+    def prune(self, now):
+        """Выкидывает отметки вызовов старше STATS_WINDOW (вызывать под локом лимитера)."""
+        while self.calls and now - self.calls[0] > STATS_WINDOW:
+            self.calls.popleft()
+
+
+def is_retryable(error):
+    """Ошибки квоты/сервера, которые имеет смысл повторить."""
+    code = getattr(error, 'code', None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    if any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__):
+        return True
+    # code может быть и не числом (grpc StatusCode.UNAVAILABLE) — тогда смотрим его текст
+    text = f"{error}" if code is None else f"{code} {error}"
+    return bool(RETRYABLE_TEXT_RE.search(text))
+
+
+def parse_retry_after(error):
+    """Достаёт Retry-After (сек) из исключения: атрибут, заголовок ответа или текст ошибки."""
+    value = getattr(error, 'retry_after', None)
+    if value is None:
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers:
+            value = headers.get('Retry-After') or headers.get('retry-after')
+    if value is None:
+        text = str(error)
+        m = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", text) or \
+            re.search(r"retry in ([\d.]+)\s*s", text, re.IGNORECASE)
+        if m:
+            value = m.group(1)
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Общий лимитер для всех запросов к Gemini: bucket на модель + backoff с jitter."""
+
+    def __init__(self, limits=None, default_rpm=DEFAULT_RPM):
+        self.limits = dict(MODEL_LIMITS if limits is None else limits)
+        self.default_rpm = default_rpm
+        self.buckets = {}
+        self._stats = {}
+        self.lock = threading.Lock()
+
+    def configure(self, model, rpm, burst=None):
+        """Задать квоту модели (rpm=None — без ограничения)."""
+        with self.lock:
+            self.limits[model] = rpm
+            self.buckets[model] = TokenBucket(rpm, burst) if rpm else None
+            self._stats.setdefault(model, _ModelStats())
+
+    def _bucket(self, model):
+        with self.lock:
+            if model not in self.buckets:
+                if model.startswith('local/'):
+                    rpm = None
+                else:
+                    rpm = self.limits.get(model, self.default_rpm)
+                self.buckets[model] = TokenBucket(rpm) if rpm else None
+                self._stats.setdefault(model, _ModelStats())
+            return self.buckets[model]
+
+    def _sleep(self, model, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            self._stats[model].wait_time += seconds
+        time.sleep(seconds)
+
+    def acquire(self, model):
+        """Ждёт свободный слот для одного запроса."""
+        bucket = self._bucket(model)
+        if bucket:
+            self._sleep(model, bucket.acquire())
+        with self.lock:
+            stats = self._stats[model]
+            now = time.monotonic()
+            stats.calls.append(now)
+            stats.prune(now)  # окно не растёт, даже если stats() никто не вызывает
+            stats.total_calls += 1
+
+    def call(self, model, fn, *args, max_retries=MAX_RETRIES, **kwargs):
+        """
+        Выполняет fn(*args, **kwargs) с учётом квоты модели.
+        Повторяет при 429/5xx: ждёт Retry-After, иначе экспоненциальный backoff с jitter.
+        """
+        bucket = self._bucket(model)
+        for attempt in range(max_retries + 1):
+            self.acquire(model)
+            try:
+                result = fn(*args, **kwargs)
+                if bucket:
+                    bucket.on_success()
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt == max_retries:
+                    with self.lock:
+                        self._stats[model].failed += 1
+                    raise
+                with self.lock:
+                    self._stats[model].throttled += 1
+                if bucket:
+                    bucket.on_throttled()
+                delay = parse_retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                print(f"[LIMIT] {model}: {type(e).__name__}, повтор через {delay:.1f}s "
+                      f"(попытка {attempt + 2}/{max_retries + 1})")
+                self._sleep(model, delay)
+
+    def stats(self):
+        """Статистика по моделям: текущий rpm, число throttled-вызовов, время ожидания."""
+        now = time.monotonic()
+        report = {}
+        with self.lock:
+            for model, s in self._stats.items():
+                s.prune(now)
+                bucket = self.buckets.get(model)
+                report[model] = {
+                    'requests_per_min': len(s.calls),
+                    'total_calls': s.total_calls,
+                    'throttled': s.throttled,
+                    'failed': s.failed,
+                    'wait_time': round(s.wait_time, 3),
+                    'allowed_rpm': round(bucket.rate * 60, 1) if bucket else None,
+                }
+        return report
+
+
+# Общий экземпляр на всё приложение
+limiter = RateLimiter()
@@ -0,0 +1,130 @@
+import threading
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+# Сколько запросов (LLM/RAG) может выполняться одновременно
+MAX_REQUEST_THREADS = 4
+
+
+class _RequestSignals(QObject):
+    # Создаётся в GUI-потоке, поэтому сигналы из пула доходят до слотов через очередь событий Qt
+    chunk = pyqtSignal(object)
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    done = pyqtSignal()
+
+
+class Request(QRunnable):
+    """
+    Один вызов fn(*args, **kwargs) в пуле потоков.
+    stream=True: fn возвращает генератор кусков текста — каждый уходит в signals.chunk,
+    в signals.result приходит весь текст. Отмена: cancel() — генератор закрывается
+    на следующем куске, результат и ошибки отменённого запроса в GUI не доставляются.
+    """
+
+    def __init__(self, fn, args, kwargs, stream=False):
+        super().__init__()
+        # Жизнью объекта управляет RequestExecutor, а не Qt
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.stream = stream
+        self.signals = _RequestSignals()
+        self.on_done = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+            result = self.fn(*self.args, **self.kwargs)
+            if self.stream:
+                result = self._consume(result)
+            if not self.cancelled:
+                self.signals.result.emit(result)
+        except Exception as e:
+            traceback.print_exc()
+            if not self.cancelled:
+                self.signals.error.emit(e)
+        finally:
+            self.signals.done.emit()
+
+    def _consume(self, pieces):
+        parts = []
+        try:
+            for piece in pieces:
+                if self.cancelled:
+                    break
+                parts.append(piece)
+                self.signals.chunk.emit(piece)
+        finally:
+            close = getattr(pieces, 'close', None)
+            if close:
+                close()  # для генераторов llm_client — закрывает и HTTP-поток
+        return "".join(parts)
+
+
+class RequestExecutor(QObject):
+    """
+    Слой выполнения запросов вне GUI-потока (QThreadPool + QRunnable).
+    submit() сразу возвращает Request; колбэки вызываются в GUI-потоке через сигналы.
+    Несколько запросов могут быть "в полёте" одновременно.
+    """
+
+    def __init__(self, max_threads=MAX_REQUEST_THREADS, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.active = set()
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_chunk=None, on_done=None,
+               stream=False, **kwargs):
+        request = Request(fn, args, kwargs, stream)
+
+        def guarded(callback):
+            # Ответ мог уже стоять в очереди событий, когда запрос отменили
+            return lambda value: None if request.cancelled else callback(value)
+
+        if on_chunk:
+            request.signals.chunk.connect(guarded(on_chunk))
+        if on_result:
+            request.signals.result.connect(guarded(on_result))
+        if on_error:
+            request.signals.error.connect(guarded(on_error))
+        request.on_done = on_done
+        request.signals.done.connect(lambda: self._finish(request))
+
+        self.active.add(request)
+        self.pool.start(request)
+        return request
+
+    def cancel(self, request):
+        request.cancel()
+        # Ещё не начатый запрос просто убираем из очереди — done от него уже не придёт
+        if self.pool.tryTake(request):
+            self._finish(request)
+
+    def cancel_all(self):
+        for request in list(self.active):
+            self.cancel(request)
+
+    def shutdown(self, timeout_ms=2000):
+        """Отменяет всё и ждёт потоки (сетевой вызов может не прерваться — ждём не дольше timeout_ms)."""
+        self.cancel_all()
+        self.pool.waitForDone(timeout_ms)
+
+    def _finish(self, request):
+        if request not in self.active:
+            return
+        self.active.discard(request)
+        if request.on_done:
+            request.on_done()
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+
+RESPONSE_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".jarvis_cache", "llm_responses.sqlite3")
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Сколько самых старых записей удаляется за один проход вытеснения
+EVICT_BATCH = 64
+
+
+def response_key(model, prompt, config=None):
+    """Адрес ответа: sha256 от модели, конфигурации генерации и промпта."""
+    payload = json.dumps([model, config or {}, prompt], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed кэш ответов LLM в SQLite с LRU-вытеснением по суммарному размеру.
+    Попадание не ходит в сеть вообще. Кэшируются только вызовы из функций,
+    включённых явно (enabled); stats() — попадания по функциям.
+    Файл БД создаётся при первом get/put, а не при создании объекта (импорт llm_client
+    ничего не пишет в домашнюю папку).
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, max_bytes=RESPONSE_CACHE_MAX_BYTES, enabled=()):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = set(enabled)
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._db = None
+        self._opened = False
+        self._total = 0
+
+    def _connect(self):
+        """БД (или None, если кэш недоступен). Открывается один раз; вызывать под self._lock."""
+        if self._opened:
+            return self._db
+        self._opened = True
+        try:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, func TEXT, value TEXT, size INTEGER, last_used REAL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_used)")
+            self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        except (sqlite3.Error, OSError) as e:
+            print(f"[WARN] Response cache disabled ({self.path}): {e}")
+            self._db = None
+        return self._db
+
+    def active(self, func):
+        return func in self.enabled
+
+    def get(self, key, func):
+        if not self.active(func):
+            return None
+        with self._lock:
+            if self._connect() is None:
+                return None
+            try:
+                row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                print(f"[WARN] Response cache read failed: {e}")
+                row = None
+            if row is None:
+                self.misses[func] += 1
+                return None
+            self.hits[func] += 1
+        print(f"[DEBUG] LLM cache hit: {func}")
+        return row[0]
+
+    def put(self, key, func, value):
+        if not self.active(func) or not value:
+            return
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._connect() is None:
+                return
+            try:
+                old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                 (key, func, value, size, time.time()))
+                self._total += size - (old[0] if old else 0)
+                self._evict()
+            except sqlite3.Error as e:
+                print(f"[WARN] Response cache write failed: {e}")
+
+    def _evict(self):
+        # LRU: выкидываем давно не использованные, пока суммарный размер больше лимита
+        while self._total > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT ?",
+                                    (EVICT_BATCH,)).fetchall()
+            if not rows:
+                self._total = 0
+                return
+            for key, size in rows:
+                if self._total <= self.max_bytes:
+                    return
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total -= size
+
+    def clear(self):
+        with self._lock:
+            if self._connect() is None:
+                return
+            self._db.execute("DELETE FROM responses")
+            self._total = 0
+
+    def stats(self):
+        """Пока кэш не открывался (не было get/put) — записи и размер на диске не считаются."""
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self._db else 0
+            return {
+                'entries': entries,
+                'bytes': self._total,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                'by_function': {f: {'hits': self.hits[f], 'misses': self.misses[f]}
+                                for f in sorted(set(self.hits) | set(self.misses))},
+            }
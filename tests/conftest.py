@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Модули проекта лежат плоско в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты не ходят в сеть и не пишут кэш ответов LLM в домашнюю папку
+os.environ.setdefault("LLM_PROVIDER", "local")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="llm-cache-"), "responses.sqlite3"))
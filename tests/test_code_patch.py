@@ -0,0 +1,41 @@
+from code_patch import parse_hunks, apply_patch
+
+SQL = "SELECT 1;\n-- comment\nSELECT 2;\n"
+
+
+def test_removed_sql_comment_inside_hunk_is_not_a_header():
+    body = "--- a/q.sql\n+++ b/q.sql\n@@ -1,3 +1,2 @@\n SELECT 1;\n--- comment\n SELECT 2;\n"
+
+    assert apply_patch(SQL, body) == "SELECT 1;\nSELECT 2;\n"
+
+
+def test_removed_comment_in_hunk_without_counts():
+    body = "@@ ... @@\n SELECT 1;\n--- comment\n SELECT 2;\n"
+
+    assert parse_hunks(body) == [("SELECT 1;\n-- comment\nSELECT 2;", "SELECT 1;\nSELECT 2;")]
+
+
+def test_file_headers_after_exhausted_hunk():
+    body = "@@ -1 +1 @@\n-a\n+b\n--- a/z\n+++ b/z\n@@ -3,1 +3,1 @@\n-c\n+d\n"
+
+    assert parse_hunks(body) == [("a", "b"), ("c", "d")]
+
+
+def test_file_headers_between_hunks_without_counts():
+    body = "--- a/x\n+++ b/x\n@@ ... @@\n a\n-b\n+B\n--- a/y\n+++ b/y\n@@ ... @@\n c\n"
+
+    assert parse_hunks(body) == [("a\nb", "a\nB"), ("c", "c")]
+
+
+def test_search_replace_in_crlf_file_keeps_crlf(tmp_path):
+    from file_transaction import WriteTransaction
+
+    path = tmp_path / "m.py"
+    path.write_bytes(b"def f():\r\n    return 1\r\n\r\ndef g():\r\n    return 2\r\n")
+    body = "<<<<<<< SEARCH\ndef g():\n    return 2\n=======\ndef g():\n    return 3\n>>>>>>> REPLACE"
+
+    with WriteTransaction(str(tmp_path)) as tx:
+        assert tx.stage_patch("m.py", body).status == 'updated'
+        tx.commit()
+
+    assert path.read_bytes() == b"def f():\r\n    return 1\r\n\r\ndef g():\r\n    return 3\r\n"
@@ -0,0 +1,94 @@
+import math
+import threading
+
+from embedding_backend import make_batches, approx_tokens, HashEmbeddingBackend
+from rag_engine import ProjectIndexer
+
+
+class RecordingBackend(HashEmbeddingBackend):
+    """Фейковый бэкенд: запоминает каждый вызов embed (тексты одной пачки)."""
+
+    def __init__(self):
+        super().__init__(model='local/test-recording')
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def embed(self, texts, task_type="retrieval_document"):
+        with self._calls_lock:
+            self.calls.append(list(texts))
+        return super().embed(texts, task_type)
+
+
+def make_project(root, n_files):
+    for i in range(n_files):
+        (root / f"module_{i}.py").write_text(f"def function_{i}(value):\n    return value * {i}\n",
+                                             encoding='utf-8')
+
+
+def test_index_project_embeds_in_batches(tmp_path):
+    make_project(tmp_path, 230)
+    backend = RecordingBackend()
+    indexer = ProjectIndexer(None, backend=backend, batch_size=50)
+
+    indexer.index_project(str(tmp_path))
+
+    chunks = len(indexer.chunks)
+    assert chunks >= 230
+    # O(chunks / N) запросов вместо одного на чанк
+    assert len(backend.calls) == math.ceil(chunks / 50)
+    assert sum(len(c) for c in backend.calls) == chunks
+    assert max(len(c) for c in backend.calls) <= 50
+
+
+def test_reindex_uses_stored_vectors(tmp_path):
+    make_project(tmp_path, 40)
+    backend = RecordingBackend()
+    ProjectIndexer(None, backend=backend).index_project(str(tmp_path))
+    first = len(backend.calls)
+
+    ProjectIndexer(None, backend=backend).index_project(str(tmp_path))
+
+    assert first == 1
+    assert len(backend.calls) == first
+
+
+def test_update_files_batches_only_changed_chunks(tmp_path):
+    make_project(tmp_path, 30)
+    backend = RecordingBackend()
+    indexer = ProjectIndexer(None, backend=backend, batch_size=10)
+    indexer.index_project(str(tmp_path))
+    backend.calls.clear()
+
+    changed = []
+    for i in range(12):
+        path = tmp_path / f"module_{i}.py"
+        path.write_text(f"def changed_{i}():\n    return {i}\n", encoding='utf-8')
+        changed.append(str(path))
+    indexer.update_files(changed)
+
+    assert [len(c) for c in backend.calls] == [10, 2]
+
+
+def test_make_batches_respects_item_limit():
+    batches = make_batches(["x"] * 250, max_items=100, max_tokens=10 ** 6)
+
+    assert [len(b) for b in batches] == [100, 100, 50]
+    assert [i for b in batches for i in b] == list(range(250))
+
+
+def test_make_batches_respects_token_limit():
+    texts = ["a" * 400, "b" * 400, "c" * 400, "d" * 40, "e" * 4000]
+    max_tokens = 250
+
+    batches = make_batches(texts, max_items=100, max_tokens=max_tokens)
+
+    assert [i for b in batches for i in b] == list(range(len(texts)))
+    for batch in batches:
+        tokens = sum(approx_tokens(texts[i]) for i in batch)
+        # Текст больше лимита уходит отдельной пачкой
+        assert tokens <= max_tokens or len(batch) == 1
+    assert [4] in batches
+
+
+def test_make_batches_empty():
+    assert make_batches([]) == []
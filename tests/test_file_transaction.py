@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from file_transaction import WriteTransaction, FileBlockParser, FileBlock
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+def stage_and_commit(root, path, content):
+    with WriteTransaction(str(root)) as tx:
+        change = tx.stage(path, content)
+        tx.commit()
+    return change
+
+
+def test_same_text_in_crlf_file_is_unchanged(tmp_path):
+    path = write(tmp_path, "a.py", b"x = 1\r\ny = 2\r\n")
+    mtime = os.stat(path).st_mtime_ns
+
+    change = stage_and_commit(tmp_path, "a.py", "x = 1\ny = 2\n")
+
+    assert change.status == 'unchanged'
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_update_keeps_crlf(tmp_path):
+    path = write(tmp_path, "a.py", b"x = 1\r\n")
+
+    change = stage_and_commit(tmp_path, "a.py", "x = 2\ny = 3\n")
+
+    assert change.status == 'updated'
+    assert path.read_bytes() == b"x = 2\r\ny = 3\r\n"
+
+
+def test_update_keeps_lf(tmp_path):
+    path = write(tmp_path, "a.py", b"x = 1\n")
+
+    stage_and_commit(tmp_path, "a.py", "x = 2\r\ny = 3\r\n")
+
+    assert path.read_bytes() == b"x = 2\ny = 3\n"
+
+
+def test_new_file_uses_platform_newlines(tmp_path):
+    change = stage_and_commit(tmp_path, "pkg/new.py", "a = 1\nb = 2\n")
+
+    assert change.status == 'created'
+    assert (tmp_path / "pkg" / "new.py").read_bytes() == f"a = 1{os.linesep}b = 2{os.linesep}".encode()
+
+
+RESPONSE = (
+    "Создаю модуль.\n"
+    "### FILE: app/main.py\n"
+    "```python\n"
+    "def main():\n"
+    "    print('hi')\n"
+    "```\n"
+    "### END_FILE\n"
+    "И правлю конфиг.\n"
+    "### PATCH: app/config.py\n"
+    "<<<<<<< SEARCH\n"
+    "DEBUG = False\n"
+    "=======\n"
+    "DEBUG = True\n"
+    ">>>>>>> REPLACE\n"
+    "### END_PATCH\n"
+    "Готово."
+)
+
+EXPECTED_BLOCKS = [
+    FileBlock('file', 'app/main.py', "def main():\n    print('hi')"),
+    FileBlock('patch', 'app/config.py', "<<<<<<< SEARCH\nDEBUG = False\n=======\nDEBUG = True\n>>>>>>> REPLACE"),
+]
+
+
+def parse_pieces(pieces):
+    parser = FileBlockParser()
+    return [block for piece in pieces for block in parser.feed(piece)]
+
+
+def test_parser_chunk_split_inside_file_header():
+    header = RESPONSE.index("### FILE")
+    pieces = [RESPONSE[:header + 5], RESPONSE[header + 5:header + 12], RESPONSE[header + 12:]]
+    assert pieces[0].endswith("### F") and pieces[1] == "ILE: ap"
+
+    assert parse_pieces(pieces) == EXPECTED_BLOCKS
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 24, len(RESPONSE)])
+def test_parser_any_chunk_size(size):
+    assert parse_pieces([RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]) == EXPECTED_BLOCKS
+
+
+def test_parser_every_two_way_split():
+    for cut in range(1, len(RESPONSE)):
+        assert parse_pieces([RESPONSE[:cut], RESPONSE[cut:]]) == EXPECTED_BLOCKS, cut
+
+
+def test_parser_returns_block_as_soon_as_it_ends():
+    end = RESPONSE.index("### END_FILE") + len("### END_FILE")
+    parser = FileBlockParser()
+
+    assert parser.feed(RESPONSE[:end]) == EXPECTED_BLOCKS[:1]
+    assert parser.feed(RESPONSE[end:]) == EXPECTED_BLOCKS[1:]
+
+
+def test_staged_blocks_commit_file_and_patch(tmp_path):
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "config.py").write_bytes(b"DEBUG = False\n")
+
+    with WriteTransaction(str(tmp_path)) as tx:
+        for block in parse_pieces([RESPONSE]):
+            tx.stage_block(block)
+        changes = tx.commit()
+
+    assert sorted(changes.changed) == ["app/config.py", "app/main.py"]
+    assert (tmp_path / "app" / "config.py").read_bytes() == b"DEBUG = True\n"
@@ -0,0 +1,130 @@
+from embedding_backend import HashEmbeddingBackend
+from rag_engine import ProjectIndexer
+
+
+def test_project_stays_indexed_after_removing_every_file(tmp_path):
+    (tmp_path / "only.py").write_text("def only():\n    return 1\n", encoding='utf-8')
+    indexer = ProjectIndexer(None, backend=HashEmbeddingBackend(model='local/test-hash'))
+    indexer.index_project(str(tmp_path))
+
+    (tmp_path / "only.py").unlink()
+    indexer.remove_files([str(tmp_path / "only.py")])
+
+    assert indexer.is_indexed
+    assert len(indexer.chunks) == 0
+    assert indexer.search("only") == []
+
+    created = tmp_path / "fresh.py"
+    created.write_text("def fresh_function():\n    return 2\n", encoding='utf-8')
+    assert indexer.update_files([str(created)]) == "Updated 1 files."
+    assert [c.file for c in indexer.search("fresh_function", top_k=1)] == ["fresh.py"]
+
+
+
+def test_update_files_skips_gitignored_paths(tmp_path):
+    (tmp_path / ".gitignore").write_text("build/\n", encoding='utf-8')
+    (tmp_path / "app.py").write_text("def app():\n    return 1\n", encoding='utf-8')
+    indexer = ProjectIndexer(None, backend=HashEmbeddingBackend(model='local/test-hash'))
+    indexer.index_project(str(tmp_path))
+
+    (tmp_path / "build").mkdir()
+    generated = tmp_path / "build" / "generated.py"
+    generated.write_text("def generated():\n    return 2\n", encoding='utf-8')
+    indexer.update_files([str(generated)])
+
+    assert {indexer.chunks[i].file for i in range(len(indexer.chunks))} == {"app.py"}
+
+
+def test_inserting_a_line_reembeds_only_the_changed_chunk(tmp_path):
+    from test_embedding_batching import RecordingBackend
+
+    functions = "".join(f"def function_{i}(value):\n" + "".join(
+        f"    value = value * {j} + {i}  # step {j}\n" for j in range(60)) + "    return value\n\n\n"
+        for i in range(15))
+    source = tmp_path / "big.py"
+    source.write_text(functions, encoding='utf-8')
+    backend = RecordingBackend()
+    indexer = ProjectIndexer(None, backend=backend)
+    indexer.index_project(str(tmp_path))
+    assert len(indexer.chunks) >= 15
+    backend.calls.clear()
+
+    source.write_text("import os\n" + functions, encoding='utf-8')
+    indexer.update_files([str(source)])
+
+    embedded = [text for call in backend.calls for text in call]
+    assert len(embedded) == 1
+    assert "import os" in embedded[0]
+    # Номера строк остались в метаданных и сдвинулись
+    assert indexer.search("function_14", top_k=1)[0].start_line > 1
+
+
+def make_modules(root, n_files):
+    for i in range(n_files):
+        (root / f"module_{i}.py").write_text(f"def function_{i}(value):\n    return value * {i}\n",
+                                             encoding='utf-8')
+
+
+def test_update_appends_to_the_store_instead_of_rewriting_it(tmp_path):
+    make_modules(tmp_path, 20)
+    indexer = ProjectIndexer(None, backend=HashEmbeddingBackend(model='local/test-hash'))
+    indexer.index_project(str(tmp_path))
+    vectors_file, n_rows = indexer.store.vectors_file, len(indexer.store.keys)
+
+    (tmp_path / "module_3.py").write_text("def renamed_three(value):\n    return value - 3\n", encoding='utf-8')
+    indexer.update_files([str(tmp_path / "module_3.py")])
+
+    assert indexer.store.vectors_file == vectors_file
+    assert len(indexer.store.keys) == n_rows + 1
+    assert indexer.n_deleted == 1
+    for mode in ('vector', 'lexical', 'hybrid'):
+        assert indexer.search("renamed_three", top_k=1, mode=mode)[0].file == "module_3.py"
+        found = [c.text for c in indexer.search("function_3", top_k=20, mode=mode)]
+        assert not any("function_3(" in text for text in found)
+
+
+def test_unchanged_chunks_keep_their_vectors(tmp_path):
+    make_modules(tmp_path, 20)
+    indexer = ProjectIndexer(None, backend=HashEmbeddingBackend(model='local/test-hash'))
+    indexer.index_project(str(tmp_path))
+    n_rows = len(indexer.store.keys)
+
+    indexer.update_files([str(tmp_path / "module_5.py")])
+
+    assert len(indexer.store.keys) == n_rows
+    assert indexer.search("function_5", top_k=1, mode='vector')[0].file == "module_5.py"
+
+
+def test_removed_files_are_skipped_until_compaction(tmp_path):
+    make_modules(tmp_path, 20)
+    indexer = ProjectIndexer(None, backend=HashEmbeddingBackend(model='local/test-hash'))
+    indexer.index_project(str(tmp_path))
+    vectors_file = indexer.store.vectors_file
+
+    indexer.remove_files([str(tmp_path / "module_0.py"), str(tmp_path / "module_1.py")])
+    assert indexer.store.vectors_file == vectors_file
+    assert indexer.n_deleted == 2
+    assert indexer.remove_files([str(tmp_path / "module_0.py")]) == "Nothing to remove."
+    files = {c.file for c in indexer.search("function value", top_k=40)}
+    assert files == {f"module_{i}.py" for i in range(2, 20)}
+
+    indexer.remove_files([str(tmp_path / f"module_{i}.py") for i in range(2, 6)])
+    assert indexer.n_deleted == 0
+    assert indexer.store.vectors_file != vectors_file
+    assert {indexer.chunks[i].file for i in range(len(indexer.chunks))} == {f"module_{i}.py" for i in range(6, 20)}
+
+
+def test_appended_vectors_are_reused_after_restart(tmp_path):
+    from test_embedding_batching import RecordingBackend
+
+    make_modules(tmp_path, 20)
+    backend = RecordingBackend()
+    indexer = ProjectIndexer(None, backend=backend)
+    indexer.index_project(str(tmp_path))
+    (tmp_path / "module_7.py").write_text("def seventh(value):\n    return value + 7\n", encoding='utf-8')
+    indexer.update_files([str(tmp_path / "module_7.py")])
+    backend.calls.clear()
+
+    ProjectIndexer(None, backend=backend).index_project(str(tmp_path))
+
+    assert backend.calls == []
@@ -0,0 +1,56 @@
+import pytest
+
+from markdown_renderer import MarkdownRenderer, close_fence
+
+DOCUMENTS = [
+    "# Title\n\nSome *text* here.\n\n- a\n- b\n\n- c\n\n1. one\n\n2. two\n\nEnd para.\n",
+    "Код:\n\n```python\nx = 1\n\n\ny = 2\n```\n\nПосле кода.\n",
+    "| a | b |\n|---|---|\n| 1 | 2 |\n\n> цитата\n> дальше\n\nТекст\n===\n\n---\n\nконец",
+    "1. шаг\n\n    вложенный код\n\n2. шаг\n   продолжение\n\n* x\n\n  абзац пункта\n",
+]
+
+
+@pytest.mark.parametrize('text', DOCUMENTS)
+@pytest.mark.parametrize('size', [1, 5, 24, 1000])
+def test_incremental_matches_full_render(text, size):
+    renderer = MarkdownRenderer()
+    view = renderer.stream()
+
+    for end in range(size, len(text) + size, size):
+        html = view.render(text[:end])
+
+    assert html == renderer.render(text)
+
+
+def test_finished_blocks_are_not_reparsed():
+    renderer = MarkdownRenderer()
+    view = renderer.stream()
+    calls = []
+    convert = renderer.convert
+    renderer.convert = lambda text: calls.append(text) or convert(text)
+
+    view.render("Первый абзац.\n\nВторой\n")
+    view.render("Первый абзац.\n\nВторой абзац.\n\nТре\n")
+
+    assert calls == ["Первый абзац.\n\n", "Второй\n", "Второй абзац.\n\n", "Тре\n"]
+
+
+def test_replaced_text_starts_over():
+    renderer = MarkdownRenderer()
+    view = renderer.stream()
+    view.render("Первый абзац.\n\nВторой")
+
+    assert view.render("Другой текст") == renderer.render("Другой текст")
+
+
+def test_open_fence_is_closed_while_streaming():
+    assert close_fence("```python\nx = 1") == "```python\nx = 1\n```"
+    assert close_fence("```\nx\n```") == "```\nx\n```"
+
+
+def test_render_cache_hits():
+    renderer = MarkdownRenderer(cache_size=2)
+    for text in ["a", "b", "a", "c", "b"]:
+        renderer.render(text)
+
+    assert renderer.stats() == {'entries': 2, 'hits': 1, 'misses': 4}
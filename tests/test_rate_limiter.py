@@ -0,0 +1,54 @@
+import pytest
+
+from rate_limiter import is_retryable
+
+
+class HttpError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class StatusCode:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f"StatusCode.{self.name}"
+
+
+class RpcError(Exception):
+    def __init__(self, status):
+        super().__init__("rpc failed")
+        self.status = status
+
+    def code(self):
+        return self.status
+
+
+@pytest.mark.parametrize('error', [
+    ValueError("input exceeds 5000 tokens"),
+    ValueError("request 15023 failed: invalid argument"),
+    HttpError("400 Bad Request: quota field is invalid", 400),
+    RpcError(StatusCode('INVALID_ARGUMENT')),
+    KeyError('candidates'),
+])
+def test_not_retryable(error):
+    assert not is_retryable(error)
+
+
+@pytest.mark.parametrize('error', [
+    RuntimeError("503 Service Unavailable"),
+    RuntimeError("429"),
+    RuntimeError("HTTP 502: bad gateway"),
+    RuntimeError("Rate limit reached, try later"),
+    HttpError("too many requests", 429),
+    ResourceExhausted("try later"),
+    RpcError(StatusCode('UNAVAILABLE')),
+])
+def test_retryable(error):
+    assert is_retryable(error)
@@ -0,0 +1,24 @@
+from response_cache import ResponseCache
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / "cache" / "responses.sqlite3"
+    cache = ResponseCache(str(path), enabled={'classify_intent'})
+
+    assert not path.parent.exists()
+    assert cache.stats()['entries'] == 0
+
+    assert cache.get('key', 'classify_intent') is None
+    assert path.exists()
+    cache.put('key', 'classify_intent', 'TASK')
+    assert cache.get('key', 'classify_intent') == 'TASK'
+
+
+def test_disabled_function_never_opens_database(tmp_path):
+    path = tmp_path / "responses.sqlite3"
+    cache = ResponseCache(str(path), enabled={'classify_intent'})
+
+    cache.put('key', 'get_chat_response', 'text')
+
+    assert cache.get('key', 'get_chat_response') is None
+    assert not path.exists()
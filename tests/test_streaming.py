@@ -0,0 +1,121 @@
+import pytest
+
+import llm_client
+from llm_provider import LocalProvider, LOCAL_STREAM_CHUNK
+from markdown_renderer import MarkdownRenderer
+
+ANSWER = (
+    "## План\n\n"
+    "Сначала **поправим** конфиг:\n\n"
+    "```python\n"
+    "DEBUG = True\n"
+    "\n"
+    "def main():\n"
+    "    run()\n"
+    "```\n\n"
+    "- первый пункт\n"
+    "- второй пункт\n\n"
+    "| a | b |\n|---|---|\n| 1 | 2 |\n\n"
+    "Готово."
+)
+
+
+class BrokenStreamProvider(LocalProvider):
+    """Локальный провайдер, у которого поток обрывается после fail_after кусков."""
+
+    def __init__(self, fail_after, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_after = fail_after
+        self.sent = 0
+        self.closed = False
+
+    def _pieces(self, text):
+        try:
+            for piece in super()._pieces(text):
+                if self.sent == self.fail_after:
+                    raise ConnectionError("stream reset")
+                self.sent += 1
+                yield piece
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def use_provider():
+    previous = llm_client.provider
+
+    def install(provider):
+        llm_client.set_provider(provider)
+        return provider
+
+    yield install
+    llm_client.set_provider(previous)
+
+
+def test_chat_stream_pieces_arrive_in_order(use_provider):
+    use_provider(LocalProvider(responses={"вопрос": ANSWER}))
+
+    pieces = list(llm_client.stream_chat_response("вопрос пользователя"))
+
+    assert len(pieces) == -(-len(ANSWER) // LOCAL_STREAM_CHUNK)
+    assert all(len(p) == LOCAL_STREAM_CHUNK for p in pieces[:-1])
+    assert "".join(pieces) == ANSWER
+
+
+def test_chat_stream_error_mid_stream_keeps_received_text(use_provider):
+    provider = use_provider(BrokenStreamProvider(fail_after=3, responses={"вопрос": ANSWER}))
+
+    pieces = list(llm_client.stream_chat_response("вопрос"))
+
+    assert "".join(pieces[:3]) == ANSWER[:3 * LOCAL_STREAM_CHUNK]
+    assert pieces[-1].startswith("\n\nAPI Error:") and "stream reset" in pieces[-1]
+    assert provider.closed
+
+
+def test_chat_stream_error_on_open(use_provider):
+    use_provider(LocalProvider(error_rate=1.0, error="400 Bad Request"))
+
+    pieces = list(llm_client.stream_chat_response("вопрос"))
+
+    assert len(pieces) == 1 and "400 Bad Request" in pieces[0]
+
+
+def test_cancel_closes_provider_stream(use_provider):
+    provider = use_provider(BrokenStreamProvider(fail_after=10 ** 6, responses={"вопрос": ANSWER}))
+    stream = llm_client.stream_chat_response("вопрос")
+
+    first = next(stream)
+    stream.close()  # так отменённый запрос закрывает генератор (RequestExecutor)
+
+    assert first == ANSWER[:LOCAL_STREAM_CHUNK]
+    assert provider.sent == 1
+    assert provider.closed
+
+
+def test_final_report_stream_joins_to_report(use_provider):
+    report = "```html\n<h3>Готово</h3><ul><li>main.py</li></ul>\n```"
+    use_provider(LocalProvider(responses={"main.py": report}))
+
+    pieces = list(llm_client.stream_final_report("задача", ["шаг"], ["main.py"]))
+
+    assert "".join(pieces) == report
+    assert llm_client.strip_code_fences("".join(pieces), "html") == "<h3>Готово</h3><ul><li>main.py</li></ul>"
+
+
+def test_incremental_render_follows_stream(use_provider):
+    use_provider(LocalProvider(responses={"вопрос": ANSWER}))
+    renderer = MarkdownRenderer()
+    view = renderer.stream()
+    text = ""
+    frames = []
+
+    for piece in llm_client.stream_chat_response("вопрос"):
+        text += piece
+        frames.append(view.render(text))
+
+    # Незакрытый ``` на лету закрывается — код не "растекается" на остальной ответ
+    open_fence = next(i for i, f in enumerate(frames) if "DEBUG" in f)
+    assert "<pre>" in frames[open_fence]
+    # Законченные блоки не перепарсиваются: их HTML копится и не меняется
+    assert view.done > 0 and ANSWER.startswith(view.prefix)
+    assert frames[-1] == renderer.render(ANSWER)
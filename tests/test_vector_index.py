@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from bench_search import clustered_matrix, recall_at_k, SYNTH_SPREAD
+from index_store import normalize_rows
+from vector_index import ExactIndex, IVFIndex, Int8Index, PQIndex
+
+N, DIM, QUERIES, TOP_K = 5000, 64, 50, 10
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    matrix, centers = clustered_matrix(N, DIM, rng, clusters=50)
+    queries = centers[rng.integers(0, len(centers), QUERIES)] + \
+        SYNTH_SPREAD * rng.standard_normal((QUERIES, DIM), dtype=np.float32) / np.sqrt(DIM)
+    queries = normalize_rows(queries)
+    exact = ExactIndex()
+    exact.build(matrix)
+    return matrix, queries, exact.search(queries, TOP_K)
+
+
+def recall_of(index, data):
+    matrix, queries, truth = data
+    index.build(matrix)
+    found = index.search(queries, TOP_K)
+    assert all(len(f) == TOP_K for f in found)
+    return recall_at_k(found, truth, TOP_K)
+
+
+# Пороги — с запасом от значений на этих данных (seed 0)
+@pytest.mark.parametrize('make_index, min_recall', [
+    (lambda: Int8Index(), 0.98),
+    (lambda: Int8Index(rerank=1), 0.9),
+    (lambda: PQIndex(m=DIM // 8), 0.85),
+    (lambda: IVFIndex(), 0.7),
+    (lambda: IVFIndex(n_probe=16), 0.85),
+], ids=['int8+rerank', 'int8', 'pq+rerank', 'ivf', 'ivf-probe16'])
+def test_recall_against_exact(data, make_index, min_recall):
+    assert recall_of(make_index(), data) >= min_recall
+
+
+def test_ivf_recall_grows_with_probe(data):
+    index = IVFIndex()
+    matrix, queries, truth = data
+    index.build(matrix)
+    recalls = []
+    for probe in (1, 4, 16, len(index.centroids)):
+        index.n_probe = probe
+        recalls.append(recall_at_k(index.search(queries, TOP_K), truth, TOP_K))
+    assert recalls == sorted(recalls)
+    # Все кластеры — тот же результат, что у точного поиска
+    assert recalls[-1] == 1.0
+
+
+def test_rerank_improves_compressed_recall(data):
+    assert recall_of(PQIndex(m=DIM // 8), data) > recall_of(PQIndex(m=DIM // 8, rerank=1), data)
+
+
+@pytest.mark.parametrize('make_index', [ExactIndex, IVFIndex, Int8Index, lambda: PQIndex(m=DIM // 8)],
+                         ids=['exact', 'ivf', 'int8', 'pq'])
+def test_extend_matches_build_and_skips_deleted(data, make_index):
+    matrix, queries, _ = data
+    keys = [f"key-{i}" for i in range(N)]
+    built, extended = make_index(), make_index()
+    for index in (built, extended):
+        index.build(matrix[:N - 500], keys[:N - 500])
+    built.build(matrix, keys)
+    extended.extend(matrix, keys)
+
+    deleted = np.zeros(N, dtype=bool)
+    deleted[::3] = True
+    for a, b in zip(built.search(queries, TOP_K, deleted), extended.search(queries, TOP_K, deleted)):
+        assert list(a) == list(b)
+        assert not deleted[a].any()
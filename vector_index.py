@@ -0,0 +1,473 @@
+import os
+import json
+from abc import ABC, abstractmethod
+import numpy as np
+
+from index_store import normalize_rows, top_k_indices
+
+# Параметры IVF по умолчанию
+IVF_PROBE = 8          # сколько ближайших кластеров просматривать на запрос
+IVF_ITERS = 10         # итераций k-means
+IVF_SAMPLE_PER_LIST = 64
+IVF_RETRAIN_GROWTH = 4.0  # переобучаем центроиды, если индекс вырос в N раз
+IVF_FILE = 'ivf.npz'
+
+# Сжатое хранение: сколько кандидатов на 1 результат перепроверять точными векторами
+RERANK_FACTOR = 10
+PQ_SUBSPACES = 96      # 768 измерений -> 96 байт на вектор (32x меньше float32)
+PQ_CENTROIDS = 256     # код подпространства помещается в uint8
+PQ_TRAIN_SAMPLE = 20000
+SCAN_BLOCK = 8192       # строк за шаг сканирования (ограничивает временную память)
+
+
+class ExactIndex:
+    """Точный поиск: полный проход скалярным произведением (по умолчанию)."""
+    kind = 'exact'
+
+    def __init__(self):
+        self.matrix = None
+
+    def build(self, matrix, keys=None):
+        self.matrix = matrix
+
+    def extend(self, matrix, keys=None):
+        self.matrix = matrix
+
+    def search(self, queries, k, deleted=None):
+        """
+        queries — нормированная матрица (Q, D). Возвращает список массивов индексов строк.
+        deleted — маска удалённых строк (tombstone), они в результат не попадают.
+        """
+        if self.matrix is None or len(self.matrix) == 0:
+            return [np.empty(0, dtype=np.intp) for _ in range(len(queries))]
+        scores = queries @ self.matrix.T
+        if deleted is not None:
+            scores[:, deleted] = -np.inf
+            k = min(k, len(deleted) - int(deleted.sum()))
+        return list(top_k_indices(scores, k))
+
+    def save(self, index_dir, vectors_file):
+        pass
+
+    def load(self, index_dir, vectors_file, keys):
+        return False
+
+
+class IVFIndex:
+    """
+    Приближённый поиск (IVF): сферический k-means делит вектора на n_lists кластеров,
+    запрос сравнивается с центроидами и сканирует только n_probe ближайших кластеров.
+    Больше n_probe — выше recall, медленнее. Центроиды и назначения строк
+    хранятся рядом с индексом (.jarvis_index/ivf.npz), при обновлении индекса
+    пересчитываются только назначения новых векторов.
+    """
+    kind = 'ivf'
+
+    def __init__(self, n_lists=None, n_probe=IVF_PROBE, iters=IVF_ITERS, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iters = iters
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self.assign_by_key = {}
+        # (matrix, ids, offsets) подменяется целиком, чтобы search из другого потока
+        # никогда не видел наполовину построенный индекс
+        self._state = None
+
+    def build(self, matrix, keys=None):
+        n = len(matrix)
+        if n == 0:
+            self._state = None
+            return
+        keys = list(keys) if keys is not None else [None] * n
+
+        if self.centroids is None or self.centroids.shape[1] != matrix.shape[1] \
+                or n > self.trained_size * IVF_RETRAIN_GROWTH:
+            self._train(matrix)
+            self.assign_by_key = {}
+
+        assignments = np.empty(n, dtype=np.int32)
+        missing = []
+        for i, key in enumerate(keys):
+            lst = self.assign_by_key.get(key) if key is not None else None
+            if lst is None:
+                missing.append(i)
+            else:
+                assignments[i] = lst
+        if missing:
+            missing = np.asarray(missing, dtype=np.intp)
+            assignments[missing] = self._assign(matrix[missing])
+
+        self.assign_by_key = {key: int(a) for key, a in zip(keys, assignments) if key is not None}
+        self._set_lists(matrix, assignments)
+
+    def extend(self, matrix, keys=None):
+        """
+        matrix — прежние строки и новые в конце: назначаются только новые. Если индекс
+        вырос в IVF_RETRAIN_GROWTH раз (или его ещё нет) — полный build.
+        """
+        state = self._state
+        n = len(matrix)
+        if state is None or self.centroids.shape[1] != matrix.shape[1] \
+                or n > self.trained_size * IVF_RETRAIN_GROWTH:
+            self.build(matrix, keys)
+            return
+        _, ids, offsets = state
+        n_old = len(ids)
+        assignments = np.empty(n, dtype=np.int32)
+        assignments[:n_old] = self._assignments(ids, offsets)
+        assignments[n_old:] = self._assign(matrix[n_old:])
+        if keys is not None:
+            self.assign_by_key.update((key, int(a)) for key, a in zip(keys[n_old:], assignments[n_old:])
+                                      if key is not None)
+        self._set_lists(matrix, assignments)
+
+    @staticmethod
+    def _assignments(ids, offsets):
+        """Кластер каждой строки (обратное к спискам ids/offsets)."""
+        assignments = np.empty(len(ids), dtype=np.int32)
+        assignments[ids] = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        return assignments
+
+    def _set_lists(self, matrix, assignments):
+        ids = np.argsort(assignments, kind='stable').astype(np.intp)
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._state = (matrix, ids, offsets)
+
+    def _train(self, matrix):
+        n, dim = matrix.shape
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(n, n_lists * IVF_SAMPLE_PER_LIST)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            # Пустые кластеры перезапускаем случайными точками
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids
+        self.trained_size = n
+        print(f"[DEBUG] IVF: обучено {n_lists} кластеров на {sample_size} векторах")
+
+    def _assign(self, rows, block=65536):
+        out = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), block):
+            part = np.asarray(rows[start:start + block], dtype=np.float32)
+            out[start:start + len(part)] = np.argmax(part @ self.centroids.T, axis=1)
+        return out
+
+    def search(self, queries, k, deleted=None):
+        state = self._state
+        if state is None:
+            return [np.empty(0, dtype=np.intp) for _ in range(len(queries))]
+        matrix, ids, offsets = state
+
+        probe = min(self.n_probe, len(self.centroids))
+        lists = top_k_indices(queries @ self.centroids.T, probe)
+        results = []
+        for q, q_lists in zip(queries, lists):
+            cand = np.concatenate([ids[offsets[l]:offsets[l + 1]] for l in q_lists])
+            if deleted is not None:
+                cand = cand[~deleted[cand]]
+            if len(cand) == 0:
+                results.append(cand)
+                continue
+            cand.sort()  # последовательное чтение memmap
+            top = top_k_indices(matrix[cand] @ q, k)
+            results.append(cand[top])
+        return results
+
+    def save(self, index_dir, vectors_file):
+        """Сохраняет центроиды и назначения (в порядке строк текущего файла векторов)."""
+        if self.centroids is None or self._state is None:
+            return
+        _, ids, offsets = self._state
+        assignments = self._assignments(ids, offsets)
+        tmp = os.path.join(index_dir, IVF_FILE + '.tmp.npz')
+        np.savez(tmp, centroids=self.centroids, assignments=assignments,
+                 meta=np.array(json.dumps({'vectors_file': vectors_file, 'trained_size': self.trained_size})))
+        os.replace(tmp, os.path.join(index_dir, IVF_FILE))
+
+    def load(self, index_dir, vectors_file, keys):
+        """Поднимает центроиды с диска; назначения — только если они от того же файла векторов."""
+        path = os.path.join(index_dir, IVF_FILE)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data['meta']))
+                self.centroids = data['centroids']
+                self.trained_size = int(meta.get('trained_size', 0))
+                # Файл векторов только дописывается: назначения могут покрывать его начало
+                if meta.get('vectors_file') == vectors_file and len(data['assignments']) <= len(keys):
+                    self.assign_by_key = dict(zip(keys, data['assignments'].tolist()))
+            return True
+        except Exception as e:
+            print(f"[WARN] Не удалось загрузить IVF-индекс: {e}")
+            return False
+
+
+class _CompressedIndex(ABC):
+    """
+    База для сжатых индексов: в памяти держатся только коды, приблизительные оценки
+    считаются по ним блоками, затем top (k * rerank) кандидатов перепроверяются
+    точными float32-векторами из memmap (читаются с диска только эти строки).
+    Коды переиспользуются по ключу чанка, кодируются только новые вектора.
+    Подкласс задаёт code_dtype, а в _train/_set_params заполняет dim (размерность
+    векторов) и code_shape (форма кода одного вектора).
+    """
+    kind = 'compressed'
+    file_name = None
+    code_dtype = None
+
+    def __init__(self, rerank=RERANK_FACTOR):
+        self.rerank = rerank
+        self.trained = False
+        self.dim = None
+        self.code_shape = None
+        self.keys = []
+        self.codes = None
+        self._state = None  # (matrix, codes) — подменяется целиком
+
+    # --- методы подклассов ---
+    @abstractmethod
+    def _train(self, sample):
+        """Обучение на выборке float32-векторов."""
+
+    @abstractmethod
+    def _encode(self, rows):
+        """Коды строк: массив (len(rows),) + code_shape типа code_dtype."""
+
+    @abstractmethod
+    def _approx_scores(self, codes, query):
+        """Приблизительные скалярные произведения запроса с закодированными строками."""
+
+    @abstractmethod
+    def _params(self):
+        """Обученные параметры: {имя: np.ndarray} для сохранения в npz."""
+
+    @abstractmethod
+    def _set_params(self, data):
+        """Восстановление параметров из загруженного npz."""
+
+    # --- общая логика ---
+    def build(self, matrix, keys=None):
+        n = len(matrix)
+        if n == 0:
+            self._state = None
+            return
+        keys = list(keys) if keys is not None else [None] * n
+
+        if not self.trained or self.dim != matrix.shape[1]:
+            rng = np.random.default_rng(0)
+            sample_idx = np.sort(rng.choice(n, min(n, PQ_TRAIN_SAMPLE), replace=False))
+            self._train(np.asarray(matrix[sample_idx], dtype=np.float32))
+            self.trained = True
+            self.keys, self.codes = [], None
+
+        old_rows = {key: i for i, key in enumerate(self.keys) if key is not None}
+        reuse = [old_rows.get(key) for key in keys]
+        missing = np.asarray([i for i, row in enumerate(reuse) if row is None], dtype=np.intp)
+        known = np.asarray([i for i, row in enumerate(reuse) if row is not None], dtype=np.intp)
+
+        codes = np.empty((n,) + self.code_shape, dtype=self.code_dtype)
+        if len(known):
+            codes[known] = self.codes[[reuse[i] for i in known]]
+        for start in range(0, len(missing), SCAN_BLOCK):
+            part = missing[start:start + SCAN_BLOCK]
+            codes[part] = self._encode(np.asarray(matrix[part], dtype=np.float32))
+
+        self.keys = keys
+        self.codes = codes
+        self._state = (matrix, codes)
+
+    def extend(self, matrix, keys=None):
+        """matrix — прежние строки и новые в конце: кодируются только новые."""
+        if self._state is None or self.dim != matrix.shape[1]:
+            self.build(matrix, keys)
+            return
+        n = len(matrix)
+        n_old = len(self.codes)
+        codes = np.empty((n,) + self.code_shape, dtype=self.code_dtype)
+        codes[:n_old] = self.codes
+        for start in range(n_old, n, SCAN_BLOCK):
+            rows = np.asarray(matrix[start:start + SCAN_BLOCK], dtype=np.float32)
+            codes[start:start + len(rows)] = self._encode(rows)
+        self.keys = list(keys) if keys is not None else [None] * n
+        self.codes = codes
+        self._state = (matrix, codes)
+
+    def search(self, queries, k, deleted=None):
+        state = self._state
+        if state is None:
+            return [np.empty(0, dtype=np.intp) for _ in range(len(queries))]
+        matrix, codes = state
+        alive = len(codes) if deleted is None else len(codes) - int(deleted.sum())
+        n_cand = min(alive, max(k, k * self.rerank))
+
+        results = []
+        for q in queries:
+            approx = np.empty(len(codes), dtype=np.float32)
+            for start in range(0, len(codes), SCAN_BLOCK):
+                approx[start:start + SCAN_BLOCK] = self._approx_scores(codes[start:start + SCAN_BLOCK], q)
+            if deleted is not None:
+                approx[deleted] = -np.inf
+            cand = np.sort(top_k_indices(approx, n_cand))
+            # Точный re-rank кандидатов
+            top = top_k_indices(np.asarray(matrix[cand], dtype=np.float32) @ q, k)
+            results.append(cand[top])
+        return results
+
+    def memory_bytes(self):
+        return 0 if self.codes is None else self.codes.nbytes + sum(v.nbytes for v in self._params().values())
+
+    def save(self, index_dir, vectors_file):
+        if self.codes is None:
+            return
+        tmp = os.path.join(index_dir, self.file_name + '.tmp.npz')
+        np.savez(tmp, codes=self.codes, meta=np.array(json.dumps({'vectors_file': vectors_file})),
+                 **self._params())
+        os.replace(tmp, os.path.join(index_dir, self.file_name))
+
+    def load(self, index_dir, vectors_file, keys):
+        path = os.path.join(index_dir, self.file_name)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                self._set_params(data)
+                self.trained = True
+                meta = json.loads(str(data['meta']))
+                # Файл векторов только дописывается: коды могут покрывать его начало
+                if meta.get('vectors_file') == vectors_file and len(data['codes']) <= len(keys):
+                    self.codes = data['codes']
+                    self.keys = list(keys[:len(self.codes)])
+            return True
+        except Exception as e:
+            print(f"[WARN] Не удалось загрузить {self.kind}-индекс: {e}")
+            return False
+
+
+class Int8Index(_CompressedIndex):
+    """Скалярное квантование: int8 на измерение со своим масштабом (4x меньше float32)."""
+    kind = 'int8'
+    file_name = 'int8.npz'
+    code_dtype = np.int8
+
+    def __init__(self, rerank=RERANK_FACTOR):
+        super().__init__(rerank)
+        self.scale = None
+
+    def _set_scale(self, scale):
+        self.scale = scale
+        self.dim = len(scale)
+        self.code_shape = (len(scale),)
+
+    def _train(self, sample):
+        scale = np.abs(sample).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        self._set_scale(scale.astype(np.float32))
+
+    def _encode(self, rows):
+        return np.clip(np.rint(rows / self.scale), -127, 127).astype(np.int8)
+
+    def _approx_scores(self, codes, query):
+        return codes.astype(np.float32) @ (query * self.scale)
+
+    def _params(self):
+        return {'scale': self.scale}
+
+    def _set_params(self, data):
+        self._set_scale(data['scale'])
+
+
+class PQIndex(_CompressedIndex):
+    """
+    Product quantization: вектор режется на m подпространств, каждое кодируется
+    номером ближайшего из 256 центроидов (1 байт). Оценка запроса — сумма по таблице
+    скалярных произведений (ADC). 768 float32 -> 96 байт при m=96.
+    """
+    kind = 'pq'
+    file_name = 'pq.npz'
+    code_dtype = np.uint8
+
+    def __init__(self, m=PQ_SUBSPACES, n_centroids=PQ_CENTROIDS, iters=IVF_ITERS, rerank=RERANK_FACTOR):
+        super().__init__(rerank)
+        self.m = m
+        self.n_centroids = n_centroids
+        self.iters = iters
+        self.codebooks = None  # (m, n_centroids, sub_dim)
+
+    def _set_codebooks(self, books):
+        self.codebooks = books
+        self.dim = books.shape[0] * books.shape[2]
+        self.code_shape = (books.shape[0],)
+
+    def _split(self, rows):
+        m = self.codebooks.shape[0]
+        return rows.reshape(len(rows), m, -1)
+
+    def _train(self, sample):
+        n, dim = sample.shape
+        m = self.m
+        while dim % m:  # размерность должна делиться на m
+            m -= 1
+        n_centroids = min(self.n_centroids, n)
+        rng = np.random.default_rng(0)
+        subs = sample.reshape(n, m, dim // m)
+        books = np.empty((m, n_centroids, dim // m), dtype=np.float32)
+        for j in range(m):
+            x = subs[:, j, :]
+            c = x[rng.choice(n, n_centroids, replace=False)].copy()
+            for _ in range(self.iters):
+                labels = np.argmax(x @ c.T - 0.5 * (c * c).sum(axis=1), axis=1)
+                sums = np.zeros_like(c)
+                np.add.at(sums, labels, x)
+                counts = np.bincount(labels, minlength=n_centroids)
+                empty = counts == 0
+                c = sums / np.maximum(counts, 1)[:, None]
+                c[empty] = x[rng.choice(n, int(empty.sum()))]
+            books[j] = c
+        self._set_codebooks(books)
+        print(f"[DEBUG] PQ: обучено {m} подпространств x {n_centroids} центроидов")
+
+    def _encode(self, rows):
+        subs = self._split(rows)
+        codes = np.empty((len(rows), self.codebooks.shape[0]), dtype=np.uint8)
+        for j, c in enumerate(self.codebooks):
+            codes[:, j] = np.argmax(subs[:, j, :] @ c.T - 0.5 * (c * c).sum(axis=1), axis=1)
+        return codes
+
+    def _approx_scores(self, codes, query):
+        lut = np.einsum('mcd,md->mc', self.codebooks, self._split(query[None, :])[0])
+        return lut[np.arange(lut.shape[0]), codes].sum(axis=1)
+
+    def _params(self):
+        return {'codebooks': self.codebooks}
+
+    def _set_params(self, data):
+        self._set_codebooks(data['codebooks'])
+
+
+VECTOR_INDEXES = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+    'int8': Int8Index,
+    'pq': PQIndex,
+}
+
+
+def make_vector_index(kind='exact', **params):
+    """Создаёт индекс по имени ('exact' | 'ivf' | 'int8' | 'pq')."""
+    if kind not in VECTOR_INDEXES:
+        raise ValueError(f"Unknown vector index: {kind}")
+    return VECTOR_INDEXES[kind](**params)